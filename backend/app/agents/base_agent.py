@@ -1,9 +1,8 @@
 from abc import ABC, abstractmethod
 from typing import Dict, Any, List
-import openai
-from ..config import settings
-
-openai.api_key = settings.openai_api_key
+import time
+from ..utils.clients import get_openai
+from ..utils.metrics import openai_request_duration, openai_tokens
 
 class BaseAgent(ABC):
     def __init__(self, name: str, role: str, system_prompt: str):
@@ -32,18 +31,31 @@ class BaseAgent(ABC):
     async def _get_ai_response(self, message: str) -> str:
         """Get response from OpenAI"""
         try:
+            openai = get_openai()
             messages = [
                 {"role": "system", "content": self.system_prompt},
                 *self.conversation_history[-10:],  # Keep last 10 messages for context
                 {"role": "user", "content": message}
             ]
             
-            response = await openai.ChatCompletion.acreate(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
-            )
+            model = "gpt-3.5-turbo"
+            start = time.perf_counter()
+            outcome = "error"
+            try:
+                response = await openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    max_tokens=500,
+                    temperature=0.7
+                )
+                outcome = "ok"
+            finally:
+                openai_request_duration.observe(time.perf_counter() - start, model=model, outcome=outcome)
+            
+            usage = getattr(response, "usage", None)
+            if usage:
+                openai_tokens.inc(usage.prompt_tokens, model=model, type="prompt")
+                openai_tokens.inc(usage.completion_tokens, model=model, type="completion")
             
             return response.choices[0].message.content
         except Exception as e:
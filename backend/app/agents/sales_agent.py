@@ -1,6 +1,7 @@
 # app/agents/sales_agent.py
 from .base_agent import BaseAgent
 from typing import Dict, Any
+from ..utils.recommender import recommender
 
 class SalesAgent(BaseAgent):
     def __init__(self):
@@ -31,4 +32,11 @@ class SalesAgent(BaseAgent):
         if context:
             sales_context.update(context)
         
+        # Ground recommendations in real co-purchase data when we know what they're looking at
+        product_id = sales_context.get("product_id")
+        if product_id:
+            also_bought = recommender.related_names(product_id)
+            if also_bought:
+                sales_context["customers_also_bought"] = also_bought
+        
         return await self.process_message(query, sales_context)
\ No newline at end of file
@@ -1,15 +1,73 @@
+from fastapi import Request
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, Session
 from .config import settings
 
-engine = create_engine(settings.database_url)
+def _engine_options(url: str) -> dict:
+    """Pool settings for the configured backend"""
+    if make_url(url).get_backend_name() == "sqlite":
+        # FastAPI hands sessions across threads; SQLite has no server-side pool to size
+        return {"connect_args": {"check_same_thread": False}}
+
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_pre_ping": True,
+    }
+
+engine = create_engine(settings.database_url, **_engine_options(settings.database_url))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Optional read replica; `replica_ok` is kept current by utils.replicas.check_replica_lag
+replica_engine = (
+    create_engine(settings.read_replica_url, **_engine_options(settings.read_replica_url))
+    if settings.read_replica_url else None
+)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine else None
+replica_ok = replica_engine is not None
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_read_db(request: Request):
+    """Session for read-only endpoints.
+
+    Uses the replica when one is configured and within its lag budget,
+    unless ReadYourWritesMiddleware pinned this caller to the primary
+    because they just wrote something.
+    """
+    use_replica = replica_ok and not getattr(request.state, "read_primary", False)
+    db = ReplicaSessionLocal() if use_replica else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def warm_pool(size: int) -> int:
+    """Open up to `size` pooled connections so the first requests skip the connect handshake"""
+    connections = []
+    try:
+        for _ in range(size):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.exec_driver_sql("SELECT 1")
+    finally:
+        for connection in connections:
+            connection.close()
+
+    return len(connections)
+
+def dialect_insert(db: Session, table):
+    """Build an INSERT that supports ON CONFLICT for the session's dialect (Postgres or SQLite)"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
@@ -1,20 +1,173 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from sqlalchemy.exc import SQLAlchemyError
 from .config import settings
-from .database import engine, Base
-from .routers import auth, products, agents, carts, orders
+from .database import SessionLocal, engine, replica_engine, warm_pool
+from .utils.catalog import catalog_version
+from .utils.category_index import category_index
+from .utils.admission import CheckoutAdmissionMiddleware
+from .utils.idempotency import IdempotencyMiddleware, purge_expired
+from .utils.invalidation import invalidation_bus
+from .utils.outbox import drain_all, purge_processed
+from .utils.metrics import MetricsMiddleware, instrument_engine, registry
+from .utils.profiling import ProfilingMiddleware, record_profiled_statements
+from .utils.rate_limit import RateLimitMiddleware
+from .utils.replicas import ReadYourWritesMiddleware, check_replica_lag
+from .utils.popularity import popularity
+from .utils.recommender import recommender
+from .utils.serialization import ORJSONResponse
+from .services.reservation_service import sweep_expired
+from .services.stock_shard_service import reconcile_totals
+from .routers import auth, products, agents, carts, orders, profiles, updates
 # Import models to ensure they're registered
-from .models import user, product, cart, order
+from .models import user, product, cart, order, outbox, idempotency, reservation
 
-# Create database tables
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# The schema is managed by Alembic (`alembic upgrade head`), not at import time
+
+def _warm_caches():
+    """Load in-memory catalog state; each cache stays cold if the database is unavailable"""
+    db = SessionLocal()
+    try:
+        catalog_version.load(db)
+        category_index.load(db)
+        popularity.rebuild(db)
+    except SQLAlchemyError as e:
+        logger.warning("Catalog caches not loaded: %s", e)
+    finally:
+        db.close()
+
+def _rebuild_popularity():
+    db = SessionLocal()
+    try:
+        popularity.rebuild(db)
+    finally:
+        db.close()
+
+def _drain_outbox():
+    db = SessionLocal()
+    try:
+        drain_all(db)
+    finally:
+        db.close()
+
+def _purge_outbox():
+    db = SessionLocal()
+    try:
+        purge_processed(db)
+    finally:
+        db.close()
+
+def _purge_idempotency_keys():
+    db = SessionLocal()
+    try:
+        purge_expired(db)
+    finally:
+        db.close()
+
+def _sweep_reservations():
+    db = SessionLocal()
+    try:
+        sweep_expired(db)
+    finally:
+        db.close()
+
+def _reconcile_stock():
+    db = SessionLocal()
+    try:
+        if reconcile_totals(db):
+            # Stock levels are part of the catalog responses
+            catalog_version.stock_changed()
+            invalidation_bus.publish("stock")
+    finally:
+        db.close()
+
+def _rebuild_recommender():
+    db = SessionLocal()
+    try:
+        recommender.rebuild(db)
+    finally:
+        db.close()
+
+async def _run_periodically(interval: float, job, first_run: float = None):
+    """Run a blocking job off the event loop every `interval` seconds until cancelled"""
+    delay = interval if first_run is None else first_run
+    while True:
+        await asyncio.sleep(delay)
+        delay = interval
+        try:
+            await asyncio.to_thread(job)
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm pools and caches before serving; a database outage degrades instead of crashing"""
+    try:
+        opened = await asyncio.to_thread(warm_pool, settings.db_pool_size)
+        logger.info("Warmed %d database connections", opened)
+    except SQLAlchemyError as e:
+        logger.warning("Database unavailable at startup, continuing cold: %s", e)
+    else:
+        await asyncio.to_thread(_warm_caches)
+    
+    try:
+        await invalidation_bus.start()
+    except Exception as e:
+        # Other workers' edits then only reach this one through the periodic refreshes
+        logger.warning("Cache invalidation bus unavailable: %s", e)
+    
+    background = [
+        asyncio.create_task(_run_periodically(settings.popularity_refresh_seconds, _rebuild_popularity)),
+        # Too heavy to block startup on; the first build starts right after it
+        asyncio.create_task(_run_periodically(settings.recommender_refresh_seconds, _rebuild_recommender, first_run=0)),
+        asyncio.create_task(_run_periodically(3600, _purge_idempotency_keys)),
+        asyncio.create_task(_run_periodically(settings.reservation_sweep_seconds, _sweep_reservations)),
+        asyncio.create_task(_run_periodically(settings.stock_reconcile_seconds, _reconcile_stock)),
+    ]
+    if replica_engine is not None:
+        background.append(asyncio.create_task(
+            _run_periodically(settings.replica_lag_check_seconds, check_replica_lag, first_run=0)
+        ))
+    if settings.outbox_worker_enabled:
+        background += [
+            asyncio.create_task(_run_periodically(settings.outbox_poll_seconds, _drain_outbox)),
+            asyncio.create_task(_run_periodically(3600, _purge_outbox)),
+        ]
+
+    yield
+    
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*background, return_exceptions=True)
+    await invalidation_bus.stop()
 
 app = FastAPI(
     title="E-commerce API with AI Agents",
     description="A complete e-commerce solution with JWT auth, cart, payments, and AI shopping assistants",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
+for bound in (engine, replica_engine):
+    if bound is not None:
+        instrument_engine(bound)
+        record_profiled_statements(bound)
+app.add_middleware(IdempotencyMiddleware)
+# Outside idempotency, so a queued attempt is never stored as the key's outcome
+app.add_middleware(CheckoutAdmissionMiddleware)
+app.add_middleware(ReadYourWritesMiddleware)
+app.add_middleware(ProfilingMiddleware)
+# Sheds abusive traffic before any other work, but still shows up in the metrics
+app.add_middleware(RateLimitMiddleware)
+app.add_middleware(MetricsMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +183,8 @@ app.include_router(products.router)
 app.include_router(agents.router)
 app.include_router(carts.router)
 app.include_router(orders.router)
+app.include_router(profiles.router)
+app.include_router(updates.router)
 @app.get("/")
 async def root():
     return {
@@ -46,4 +201,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
\ No newline at end of file
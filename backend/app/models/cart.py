@@ -1,11 +1,16 @@
 # app/models/cart.py
-from sqlalchemy import Column, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
 class CartItem(Base):
     __tablename__ = "cart_items"
+    __table_args__ = (
+        # One line per product per user; add-to-cart upserts against this key.
+        # user_id leads, so the same index serves "cart for user" lookups.
+        UniqueConstraint("user_id", "product_id", name="uq_cart_items_user_product"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -0,0 +1,27 @@
+# app/models/idempotency.py
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, UniqueConstraint, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # One stored outcome per client key, scoped to its owner and endpoint
+        UniqueConstraint("owner", "method", "path", "key", name="uq_idempotency_keys_scope"),
+        # Expiry sweep
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    owner = Column(String, nullable=False)
+    method = Column(String, nullable=False)
+    path = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    request_hash = Column(String, nullable=False)
+    # Null until the first request finishes; duplicates wait while it is null
+    status_code = Column(Integer)
+    content_type = Column(String)
+    response_body = Column(LargeBinary)
+    locked_until = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,5 @@
 # app/models/order.py
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
@@ -15,6 +15,14 @@ class OrderStatus(enum.Enum):
 
 class Order(Base):
     __tablename__ = "orders"
+    __table_args__ = (
+        # User order history: WHERE user_id = ? ORDER BY created_at DESC
+        Index("ix_orders_user_id_created_at", "user_id", "created_at"),
+        # Admin listing: WHERE status = ? ORDER BY created_at DESC
+        Index("ix_orders_status_created_at", "status", "created_at"),
+        # Admin listing without a status filter
+        Index("ix_orders_created_at", "created_at"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
@@ -32,6 +40,11 @@ class Order(Base):
 
 class OrderItem(Base):
     __tablename__ = "order_items"
+    __table_args__ = (
+        # Loading the items of an order, and per-product sales aggregates
+        Index("ix_order_items_order_id", "order_id"),
+        Index("ix_order_items_product_id", "product_id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
@@ -0,0 +1,24 @@
+# app/models/outbox.py
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON, Index, text
+from sqlalchemy.sql import func
+from ..database import Base
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        # Worker poll: WHERE processed_at IS NULL AND available_at <= now ORDER BY id
+        Index(
+            "ix_outbox_events_pending", "available_at",
+            postgresql_where=text("processed_at IS NULL"),
+            sqlite_where=text("processed_at IS NULL"),
+        ),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text)
+    available_at = Column(DateTime(timezone=True), nullable=False)
+    processed_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
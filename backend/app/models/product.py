@@ -1,10 +1,25 @@
-from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, Text, DateTime, Boolean, ForeignKey, Index, UniqueConstraint, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from ..database import Base
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Partial indexes over the live catalog only; soft-deleted rows never
+        # appear in storefront queries. The predicates are spelled the way each
+        # dialect renders `is_active == True` so the planner can match them.
+        Index(
+            "ix_products_active_category_created_at", "category", "created_at",
+            postgresql_where=text("is_active = true"),
+            sqlite_where=text("is_active = 1")
+        ),
+        Index(
+            "ix_products_active_created_at", "created_at",
+            postgresql_where=text("is_active = true"),
+            sqlite_where=text("is_active = 1")
+        ),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False, index=True)
@@ -13,10 +28,39 @@ class Product(Base):
     category = Column(String, index=True)
     image_url = Column(String)
     stock_quantity = Column(Integer, default=0)
+    # Sum of live inventory_reservations for this product
+    reserved_quantity = Column(Integer, nullable=False, default=0, server_default="0")
+    # 0 keeps stock on this row; N > 0 splits it across N ProductStockShard rows
+    stock_shards = Column(Integer, nullable=False, default=0, server_default="0")
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
     cart_items = relationship("CartItem", back_populates="product")
-    order_items = relationship("OrderItem", back_populates="product")
\ No newline at end of file
+    order_items = relationship("OrderItem", back_populates="product")
+
+    @property
+    def available_quantity(self) -> int:
+        """Stock that is not held by anyone's cart (available to promise)"""
+        return (self.stock_quantity or 0) - (self.reserved_quantity or 0)
+
+class ProductStockShard(Base):
+    """One slice of a sharded product's stock, so concurrent checkouts lock different rows"""
+    __tablename__ = "product_stock_shards"
+    __table_args__ = (
+        UniqueConstraint("product_id", "shard", name="uq_product_stock_shards_product_shard"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    shard = Column(Integer, nullable=False)
+    stock_quantity = Column(Integer, nullable=False, default=0)
+    reserved_quantity = Column(Integer, nullable=False, default=0)
+
+class CatalogGeneration(Base):
+    """Single row counting catalog content writes; part of every catalog ETag (see utils.catalog)"""
+    __tablename__ = "catalog_generation"
+    
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
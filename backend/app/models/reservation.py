@@ -0,0 +1,22 @@
+# app/models/reservation.py
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, UniqueConstraint, Index
+from sqlalchemy.sql import func
+from ..database import Base
+
+class InventoryReservation(Base):
+    __tablename__ = "inventory_reservations"
+    __table_args__ = (
+        # One hold per cart line; re-holding upserts against this key
+        UniqueConstraint("user_id", "product_id", name="uq_inventory_reservations_user_product"),
+        # Expiry sweep
+        Index("ix_inventory_reservations_expires_at", "expires_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    quantity = Column(Integer, nullable=False)
+    # Stock shard the hold was taken from; null for unsharded products
+    shard = Column(Integer)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,17 @@
+"""Standalone outbox worker: drains order side effects outside the API.
+
+Set OUTBOX_WORKER_ENABLED=false on the API processes, then run (from backend/):
+    python -m app.outbox_worker
+
+The handlers have to be registered on the app.utils.outbox module that
+run_worker() reads, so they are imported here rather than started with
+`python -m app.utils.outbox`, which would load a second copy of that module
+with no handlers. Every model is imported too, so the mappers can resolve
+relationships declared by name (Order.user -> "User").
+"""
+from .models import cart, idempotency, order, outbox, product, reservation, user  # noqa: F401
+from .utils import order_events  # noqa: F401
+from .utils.outbox import run_worker
+
+if __name__ == "__main__":
+    run_worker()
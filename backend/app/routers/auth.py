@@ -46,7 +46,7 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": UserResponse.from_orm(db_user)
+        "user": UserResponse.model_validate(db_user)
     }
 
 @router.post("/login", response_model=Token)
@@ -68,9 +68,9 @@ async def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
     return {
         "access_token": access_token,
         "token_type": "bearer",
-        "user": UserResponse.from_orm(user)
+        "user": UserResponse.model_validate(user)
     }
 
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(current_user: User = Depends(get_current_user)):
-    return UserResponse.from_orm(current_user)
\ No newline at end of file
+    return UserResponse.model_validate(current_user)
\ No newline at end of file
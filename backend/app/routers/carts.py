@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 from typing import List
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models.user import User
-from ..models.product import Product
 from ..models.cart import CartItem
-from ..schemas.cart import CartItemCreate, CartItemUpdate, CartItemResponse
+from ..schemas.cart import CartItemCreate, CartItemUpdate, CartItemResponse, CartBulkRequest
+from ..services.cart_service import CartService
+from ..services.reservation_service import ReservationService
 from ..utils.dependencies import get_current_active_user
 
 router = APIRouter(prefix="/cart", tags=["cart"])
@@ -13,10 +14,12 @@ router = APIRouter(prefix="/cart", tags=["cart"])
 @router.get("/", response_model=List[CartItemResponse])
 async def get_cart_items(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all cart items for the current user"""
-    cart_items = db.query(CartItem).filter(
+    cart_items = db.query(CartItem).options(
+        joinedload(CartItem.product)
+    ).filter(
         CartItem.user_id == current_user.id
     ).all()
     
@@ -29,59 +32,16 @@ async def add_to_cart(
     db: Session = Depends(get_db)
 ):
     """Add item to cart or update quantity if item already exists"""
-    
-    # Check if product exists and is active
-    product = db.query(Product).filter(
-        Product.id == cart_item.product_id,
-        Product.is_active == True
-    ).first()
-    
-    if not product:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Product not found"
-        )
-    
-    # Check if product has enough stock
-    if product.stock_quantity < cart_item.quantity:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Only {product.stock_quantity} items available in stock"
-        )
-    
-    # Check if item already exists in cart
-    existing_item = db.query(CartItem).filter(
-        CartItem.user_id == current_user.id,
-        CartItem.product_id == cart_item.product_id
-    ).first()
-    
-    if existing_item:
-        # Update quantity
-        new_quantity = existing_item.quantity + cart_item.quantity
-        
-        # Check stock again for new quantity
-        if product.stock_quantity < new_quantity:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Cannot add {cart_item.quantity} more items. Only {product.stock_quantity - existing_item.quantity} more available"
-            )
-        
-        existing_item.quantity = new_quantity
-        db.commit()
-        db.refresh(existing_item)
-        return existing_item
-    else:
-        # Create new cart item
-        db_cart_item = CartItem(
-            user_id=current_user.id,
-            product_id=cart_item.product_id,
-            quantity=cart_item.quantity
-        )
-        
-        db.add(db_cart_item)
-        db.commit()
-        db.refresh(db_cart_item)
-        return db_cart_item
+    return await CartService(db).add_to_cart(current_user.id, cart_item)
+
+@router.post("/bulk", response_model=List[CartItemResponse])
+async def bulk_update_cart(
+    bulk_request: CartBulkRequest,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Apply several add/update/remove operations at once and return the new cart"""
+    return await CartService(db).apply_bulk_operations(current_user.id, bulk_request.operations)
 
 @router.put("/{cart_item_id}", response_model=CartItemResponse)
 async def update_cart_item(
@@ -91,33 +51,7 @@ async def update_cart_item(
     db: Session = Depends(get_db)
 ):
     """Update cart item quantity"""
-    
-    # Get cart item
-    cart_item = db.query(CartItem).filter(
-        CartItem.id == cart_item_id,
-        CartItem.user_id == current_user.id
-    ).first()
-    
-    if not cart_item:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Cart item not found"
-        )
-    
-    # Check product stock
-    product = db.query(Product).filter(Product.id == cart_item.product_id).first()
-    if product.stock_quantity < cart_update.quantity:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Only {product.stock_quantity} items available in stock"
-        )
-    
-    # Update quantity
-    cart_item.quantity = cart_update.quantity
-    db.commit()
-    db.refresh(cart_item)
-    
-    return cart_item
+    return await CartService(db).update_cart_item(current_user.id, cart_item_id, cart_update)
 
 @router.delete("/{cart_item_id}")
 async def remove_from_cart(
@@ -139,6 +73,7 @@ async def remove_from_cart(
         )
     
     db.delete(cart_item)
+    ReservationService(db).hold_cart_lines(current_user.id, [cart_item.product_id])
     db.commit()
     
     return {"message": "Item removed from cart successfully"}
@@ -151,6 +86,7 @@ async def clear_cart(
     """Clear all items from cart"""
     
     db.query(CartItem).filter(CartItem.user_id == current_user.id).delete()
+    ReservationService(db).hold_cart_lines(current_user.id)
     db.commit()
     
     return {"message": "Cart cleared successfully"}
@@ -158,7 +94,7 @@ async def clear_cart(
 @router.get("/summary")
 async def get_cart_summary(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get cart summary with totals"""
     
@@ -191,7 +127,7 @@ async def get_cart_summary(
 @router.get("/count")
 async def get_cart_count(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get total number of items in cart"""
     
@@ -1,33 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, selectinload, joinedload
 from typing import List, Optional
 from datetime import datetime
-import stripe
+import logging
 import secrets
-from ..database import get_db
+from ..database import get_db, get_read_db
 from ..models.user import User
 from ..models.product import Product
 from ..models.cart import CartItem
 from ..models.order import Order, OrderItem, OrderStatus
 from ..schemas.order import OrderCreate, OrderResponse, OrderStatusUpdate
-from ..utils.dependencies import get_current_active_user, get_current_user
-from ..config import settings
+from ..services.order_export_service import export_orders
+from ..services.reservation_service import ReservationService
+from ..services.stock_shard_service import StockShardService
+from ..utils.idempotency import FINAL_OUTCOME_HEADER
+from ..utils.dependencies import get_current_active_user, get_current_user, get_current_admin_user
+from ..utils.catalog import catalog_version
+from ..utils.clients import get_stripe
+from ..utils.invalidation import invalidation_bus
+from ..utils.metrics import track_stripe
+from ..utils.order_events import order_status_changed, stage_order_event
+from ..utils.serialization import adapter_response, order_list_adapter
 
-# Initialize Stripe
-stripe.api_key = settings.stripe_secret_key
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+# Load items and their products in two extra queries per page instead of one per item
+ORDER_DETAIL_OPTIONS = (
+    selectinload(Order.order_items).joinedload(OrderItem.product),
+)
+
 @router.post("/", response_model=OrderResponse)
-async def create_order(
+def create_order(
     order_data: OrderCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Create a new order from cart items"""
+    """Create a new order from cart items.
+
+    Replays for a repeated Idempotency-Key are served by IdempotencyMiddleware;
+    the key is also forwarded to Stripe so a retry after a crash reuses the
+    same PaymentIntent instead of charging twice.
+
+    A plain def, so FastAPI runs it in its threadpool: the Stripe round trip
+    and the checkout queries block a worker thread, not the event loop.
+    """
+    stripe = get_stripe()
+    stripe_options = {"idempotency_key": f"order-create-{current_user.id}-{idempotency_key}"} if idempotency_key else {}
     
     # Get cart items
-    cart_items = db.query(CartItem).filter(
+    cart_items = db.query(CartItem).options(
+        joinedload(CartItem.product)
+    ).filter(
         CartItem.user_id == current_user.id
     ).all()
     
@@ -67,24 +95,32 @@ async def create_order(
             "price": product.price
         })
     
+    # Refresh the cart's holds so they outlast the payment round trip
+    ReservationService(db).hold_cart_lines(current_user.id)
+    db.commit()
+    
     # Add tax (8%)
     tax_amount = total_amount * 0.08
     total_with_tax = total_amount + tax_amount
     
+    # Set once the customer has been charged; any later failure refunds it
+    charged_intent = None
     try:
         # Create Stripe PaymentIntent
-        payment_intent = stripe.PaymentIntent.create(
-            amount=int(total_with_tax * 100),  # Stripe expects cents
-            currency='usd',
-            payment_method=order_data.payment_method_id,
-            confirmation_method='manual',
-            confirm=True,
-            return_url='http://localhost:3000/orders',
-            metadata={
-                'user_id': current_user.id,
-                'user_email': current_user.email
-            }
-        )
+        with track_stripe("payment_intent.create"):
+            payment_intent = stripe.PaymentIntent.create(
+                amount=int(total_with_tax * 100),  # Stripe expects cents
+                currency='usd',
+                payment_method=order_data.payment_method_id,
+                confirmation_method='manual',
+                confirm=True,
+                return_url='http://localhost:3000/orders',
+                metadata={
+                    'user_id': current_user.id,
+                    'user_email': current_user.email
+                },
+                **stripe_options
+            )
         
         # Handle payment confirmation
         if payment_intent.status == 'requires_action':
@@ -103,6 +139,14 @@ async def create_order(
                 status_code=status.HTTP_402_PAYMENT_REQUIRED,
                 detail="Payment failed"
             )
+        # A reused key replays the first attempt's intent, which may have been
+        # refunded when that attempt failed; it must not pay for this order
+        if stripe_options and _was_refunded(stripe, payment_intent.id):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="The payment for this Idempotency-Key was refunded; check out again with a new key"
+            )
+        charged_intent = payment_intent.id
         
         # Create order
         db_order = Order(
@@ -116,61 +160,104 @@ async def create_order(
         db.add(db_order)
         db.flush()  # Get the order ID
         
-        # Create order items and update stock
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=db_order.id,
-                product_id=item_data["product_id"],
-                quantity=item_data["quantity"],
-                price=item_data["price"]
-            )
-            db.add(order_item)
-            
-            # Update product stock
-            product = db.query(Product).filter(Product.id == item_data["product_id"]).first()
-            product.stock_quantity -= item_data["quantity"]
+        # Create order items in one executemany instead of one INSERT per line
+        db.execute(insert(OrderItem), [
+            {"order_id": db_order.id, **item_data} for item_data in order_items_data
+        ])
         
-        # Clear cart
-        db.query(CartItem).filter(CartItem.user_id == current_user.id).delete()
+        # The lines that were priced and charged become stock decrements in one
+        # statement, even if the cart was edited while the payment was in flight
+        ordered = {item["product_id"]: item["quantity"] for item in order_items_data}
+        ReservationService(db).convert_cart(current_user.id, ordered)
         
+        # Clear the ordered lines; anything added during payment stays in the cart
+        db.query(CartItem).filter(
+            CartItem.user_id == current_user.id,
+            CartItem.product_id.in_(list(ordered))
+        ).delete(synchronize_session=False)
+        
+        # Side effects ride on the same commit and run after the response
+        stage_order_event(db, db_order)
         db.commit()
-        db.refresh(db_order)
+        # Stock levels are part of the catalog responses
+        catalog_version.stock_changed()
+        db_order = db.query(Order).options(*ORDER_DETAIL_OPTIONS).populate_existing().filter(
+            Order.id == db_order.id
+        ).one()
+        order_status_changed(db_order)
+        invalidation_bus.publish("stock", [item.product_id for item in db_order.order_items])
         
         return db_order
         
     except stripe.error.StripeError as e:
         db.rollback()
+        _refund_unfulfilled(stripe, charged_intent)
         raise HTTPException(
             status_code=status.HTTP_402_PAYMENT_REQUIRED,
             detail=f"Payment error: {str(e)}"
         )
+    except HTTPException:
+        db.rollback()
+        _refund_unfulfilled(stripe, charged_intent)
+        raise
     except Exception as e:
         db.rollback()
+        if _refund_unfulfilled(stripe, charged_intent):
+            # A retry would only replay the refunded intent; this outcome is final
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Order creation failed and the payment was refunded: {str(e)}",
+                headers={FINAL_OUTCOME_HEADER: "true"}
+            )
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Order creation failed: {str(e)}"
         )
 
+def _refund_unfulfilled(stripe, payment_intent_id: Optional[str]) -> bool:
+    """Give the money back for a charge whose order could not be written; returns whether a refund was issued"""
+    if payment_intent_id is None:
+        return False
+    try:
+        with track_stripe("refund.create"):
+            stripe.Refund.create(
+                payment_intent=payment_intent_id,
+                reason='requested_by_customer',
+                idempotency_key=f"order-create-refund-{payment_intent_id}"
+            )
+        return True
+    except Exception:
+        # The order failed either way; the charge needs a manual refund now
+        logger.exception("Could not refund payment %s for a failed order", payment_intent_id)
+        return False
+
+def _was_refunded(stripe, payment_intent_id: str) -> bool:
+    """Whether any of the intent's charge has been refunded, read fresh from Stripe"""
+    with track_stripe("payment_intent.retrieve"):
+        intent = stripe.PaymentIntent.retrieve(payment_intent_id, expand=["latest_charge"])
+    charge = intent.latest_charge
+    return charge is not None and charge.amount_refunded > 0
+
 @router.get("/", response_model=List[OrderResponse])
 async def get_user_orders(
     skip: int = 0,
     limit: int = 10,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get user's order history"""
     
     orders = db.query(Order).filter(
         Order.user_id == current_user.id
-    ).order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
+    ).options(*ORDER_DETAIL_OPTIONS).order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
     
-    return orders
+    return adapter_response(order_list_adapter, orders)
 
 @router.get("/{order_id}", response_model=OrderResponse)
 async def get_order(
     order_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get specific order details"""
     
@@ -211,6 +298,7 @@ async def update_order_status(
         )
     
     # Update status
+    previous_status = order.status
     order.status = status_update.status
     
     # Update tracking number if provided
@@ -221,18 +309,26 @@ async def update_order_status(
     if status_update.status == OrderStatus.SHIPPED and not order.tracking_number:
         order.tracking_number = f"TRK{secrets.token_hex(8).upper()}"
     
+    stage_order_event(db, order, previous_status)
     db.commit()
     db.refresh(order)
+    order_status_changed(order, previous_status)
     
     return order
 
 @router.post("/{order_id}/cancel")
-async def cancel_order(
+def cancel_order(
     order_id: int,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
     current_user: User = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Cancel an order"""
+    """Cancel an order; an Idempotency-Key makes retries replay the first outcome.
+
+    Runs in the threadpool, like create_order, because the refund calls Stripe.
+    """
+    stripe = get_stripe()
+    stripe_options = {"idempotency_key": f"order-refund-{order_id}-{idempotency_key}"} if idempotency_key else {}
     
     order = db.query(Order).filter(
         Order.id == order_id,
@@ -255,20 +351,30 @@ async def cancel_order(
     try:
         # Refund payment if confirmed
         if order.status == OrderStatus.CONFIRMED and order.stripe_payment_intent_id:
-            stripe.Refund.create(
-                payment_intent=order.stripe_payment_intent_id,
-                reason='requested_by_customer'
-            )
+            with track_stripe("refund.create"):
+                stripe.Refund.create(
+                    payment_intent=order.stripe_payment_intent_id,
+                    reason='requested_by_customer',
+                    **stripe_options
+                )
         
         # Update order status
+        previous_status = order.status
         order.status = OrderStatus.CANCELLED
         
         # Restore product stock
         for order_item in order.order_items:
             product = order_item.product
-            product.stock_quantity += order_item.quantity
+            if product.stock_shards:
+                StockShardService(db).adjust(product.id, order_item.quantity)
+            else:
+                product.stock_quantity += order_item.quantity
         
+        stage_order_event(db, order, previous_status)
         db.commit()
+        catalog_version.stock_changed()
+        invalidation_bus.publish("stock", [item.product_id for item in order.order_items])
+        order_status_changed(order, previous_status)
         
         return {"message": "Order cancelled successfully"}
         
@@ -282,7 +388,7 @@ async def cancel_order(
 async def track_order(
     order_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get order tracking information"""
     
@@ -379,7 +485,7 @@ async def get_all_orders(
     limit: int = 50,
     status: Optional[OrderStatus] = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """Get all orders (admin only)"""
     
@@ -394,6 +500,25 @@ async def get_all_orders(
     if status:
         query = query.filter(Order.status == status)
     
-    orders = query.order_by(Order.created_at.desc()).offset(skip).limit(limit).all()
+    orders = query.options(*ORDER_DETAIL_OPTIONS).order_by(
+        Order.created_at.desc()
+    ).offset(skip).limit(limit).all()
     
-    return orders
\ No newline at end of file
+    return adapter_response(order_list_adapter, orders)
+
+@router.get("/admin/export")
+async def export_all_orders(
+    format: str = Query("csv", pattern="^(ndjson|csv)$"),
+    status: Optional[OrderStatus] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Stream orders with their items for a period (admin only)"""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    
+    return StreamingResponse(
+        export_orders(format, status, start_date, end_date),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="orders.{format}"'}
+    )
\ No newline at end of file
@@ -1,23 +1,43 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+import tempfile
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from typing import List, Optional
-from ..database import get_db
+from ..config import settings
+from ..database import get_db, get_read_db
 from ..models.product import Product
-from ..schemas.product import ProductResponse, ProductCreate, ProductUpdate
-from ..utils.dependencies import get_current_user, get_current_active_user
+from ..schemas.product import ProductResponse, ProductCreate, ProductUpdate, CategoryStats, StockShardsUpdate
+from ..services.catalog_io_service import CatalogIOService, export_products
+from ..services.reservation_service import ReservationService
+from ..services.stock_shard_service import StockShardService
+from ..utils.dependencies import get_current_user, get_current_active_user, get_current_admin_user
+from ..utils.serialization import PRODUCT_COLUMNS, rows_response
+from ..utils.catalog import catalog_version, catalog_not_modified, get_catalog_db, set_catalog_headers
+from ..utils.category_index import category_index
+from ..utils.invalidation import invalidation_bus
+from ..utils.popularity import popularity
+from ..utils.recommender import recommender
 from ..models.user import User
 
 router = APIRouter(prefix="/products", tags=["products"])
 
 @router.get("/", response_model=List[ProductResponse])
 async def get_products(
+    request: Request,
     skip: int = Query(0, ge=0),
     limit: int = Query(10, ge=1, le=100),
     category: Optional[str] = None,
     search: Optional[str] = None,
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_catalog_db)
 ):
-    query = db.query(Product).filter(Product.is_active == True)
+    not_modified = catalog_not_modified(request)
+    if not_modified:
+        return not_modified
+    
+    # Read the version before the data, so a concurrent write can only make the tag older
+    etag = catalog_version.etag
+    query = db.query(*PRODUCT_COLUMNS).filter(Product.is_active == True)
     
     if category:
         query = query.filter(Product.category == category)
@@ -28,11 +48,87 @@ async def get_products(
             Product.description.ilike(f"%{search}%")
         )
     
-    products = query.offset(skip).limit(limit).all()
-    return products
+    # Plain rows straight to JSON; no ORM objects, no second validation pass
+    return set_catalog_headers(rows_response(query.offset(skip).limit(limit).all()), etag)
+
+@router.get("/export")
+async def export_catalog(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    include_inactive: bool = False,
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Stream the whole catalog as NDJSON or CSV (admin only)"""
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    
+    return StreamingResponse(
+        export_products(format, include_inactive),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="products.{format}"'}
+    )
+
+@router.post("/import")
+async def import_catalog(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Bulk create/update products from an NDJSON or CSV request body (admin only)"""
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"Import files are limited to {settings.product_import_max_bytes} bytes"
+    )
+    if int(request.headers.get("content-length") or 0) > settings.product_import_max_bytes:
+        raise too_large
+    
+    # Spool the body (to disk past 8 MB) so memory stays flat for large catalogs
+    upload = tempfile.SpooledTemporaryFile(max_size=8 * 2**20)
+    try:
+        received = 0
+        async for chunk in request.stream():
+            # Chunked bodies have no Content-Length to check up front
+            received += len(chunk)
+            if received > settings.product_import_max_bytes:
+                raise too_large
+            upload.write(chunk)
+        upload.seek(0)
+        
+        return await asyncio.to_thread(CatalogIOService(db).import_file, upload, format)
+    finally:
+        upload.close()
+
+@router.get("/trending", response_model=List[ProductResponse])
+async def get_trending_products(
+    limit: int = Query(8, ge=1, le=50),
+    db: Session = Depends(get_read_db)
+):
+    """Best sellers by time-decayed sales, ranked in memory"""
+    # Over-fetch so products deactivated since the last ranking don't shorten the list
+    ranked_ids = popularity.top(limit * 2)
+    if not ranked_ids:
+        return rows_response([])
+    
+    rows = db.query(*PRODUCT_COLUMNS).filter(
+        Product.id.in_(ranked_ids),
+        Product.is_active == True
+    ).all()
+    rank = {product_id: position for position, product_id in enumerate(ranked_ids)}
+    rows.sort(key=lambda row: rank[row.id])
+    
+    return rows_response(rows[:limit])
 
 @router.get("/{product_id}", response_model=ProductResponse)
-async def get_product(product_id: int, db: Session = Depends(get_db)):
+async def get_product(
+    product_id: int,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_catalog_db)
+):
+    not_modified = catalog_not_modified(request, f"product-{product_id}")
+    if not_modified:
+        return not_modified
+    
+    etag = catalog_version.etag_for(f"product-{product_id}")
     product = db.query(Product).filter(
         Product.id == product_id, 
         Product.is_active == True
@@ -41,8 +137,29 @@ async def get_product(product_id: int, db: Session = Depends(get_db)):
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
     
+    set_catalog_headers(response, etag)
     return product
 
+@router.get("/{product_id}/also-bought", response_model=List[ProductResponse])
+async def get_also_bought(
+    product_id: int,
+    limit: int = Query(5, ge=1, le=20),
+    db: Session = Depends(get_read_db)
+):
+    """Products most often bought in the same order as this one"""
+    related_ids = [other for other, _ in recommender.related(product_id, limit * 2)]
+    if not related_ids:
+        return rows_response([])
+    
+    rows = db.query(*PRODUCT_COLUMNS).filter(
+        Product.id.in_(related_ids),
+        Product.is_active == True
+    ).all()
+    rank = {other: position for position, other in enumerate(related_ids)}
+    rows.sort(key=lambda row: rank[row.id])
+    
+    return rows_response(rows[:limit])
+
 @router.post("/", response_model=ProductResponse)
 async def create_product(
     product: ProductCreate,
@@ -56,7 +173,10 @@ async def create_product(
     db_product = Product(**product.dict())
     db.add(db_product)
     db.commit()
+    catalog_version.bump(db)
     db.refresh(db_product)
+    category_index.upsert(db_product)
+    invalidation_bus.publish("product", [db_product.id])
     return db_product
 
 @router.put("/{product_id}", response_model=ProductResponse)
@@ -74,11 +194,33 @@ async def update_product(
         raise HTTPException(status_code=404, detail="Product not found")
     
     update_data = product_update.dict(exclude_unset=True)
+    if db_product.stock_shards and update_data.get("stock_quantity") is not None:
+        # The shards hold the real stock; the product row catches up on reconcile
+        StockShardService(db).set_stock(product_id, update_data.pop("stock_quantity"))
     for field, value in update_data.items():
         setattr(db_product, field, value)
+    if update_data.get("stock_quantity") is not None:
+        # Holds cannot promise more than is left
+        ReservationService(db).release_excess([product_id])
     
     db.commit()
+    catalog_version.bump(db)
     db.refresh(db_product)
+    category_index.upsert(db_product)
+    invalidation_bus.publish("product", [db_product.id])
+    return db_product
+
+@router.put("/{product_id}/stock-shards", response_model=ProductResponse)
+async def set_stock_shards(
+    product_id: int,
+    shards_update: StockShardsUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Split a hot product's stock across N counter rows, or 0 to merge it back (admin only)"""
+    db_product = StockShardService(db).configure(product_id, shards_update.shards)
+    catalog_version.stock_changed()
+    invalidation_bus.publish("stock", [product_id])
     return db_product
 
 @router.delete("/{product_id}")
@@ -97,14 +239,37 @@ async def delete_product(
     # Soft delete
     db_product.is_active = False
     db.commit()
+    catalog_version.bump(db)
+    category_index.remove(db_product.id)
+    invalidation_bus.publish("product", [db_product.id])
     
     return {"message": "Product deleted successfully"}
 
 @router.get("/categories/", response_model=List[str])
-async def get_categories(db: Session = Depends(get_db)):
-    categories = db.query(Product.category).filter(
-        Product.category.isnot(None),
-        Product.is_active == True
-    ).distinct().all()
+async def get_categories(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_catalog_db)
+):
+    not_modified = catalog_not_modified(request, stock=False)
+    if not_modified:
+        return not_modified
+    
+    set_catalog_headers(response, catalog_version.etag_for(stock=False))
+    category_index.ensure_loaded(db)
+    return category_index.names()
+
+@router.get("/categories/stats", response_model=List[CategoryStats])
+async def get_category_stats(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_catalog_db)
+):
+    """Per-category active product count, price range and newest product"""
+    not_modified = catalog_not_modified(request, stock=False)
+    if not_modified:
+        return not_modified
     
-    return [category[0] for category in categories if category[0]]
\ No newline at end of file
+    set_catalog_headers(response, catalog_version.etag_for(stock=False))
+    category_index.ensure_loaded(db)
+    return category_index.summary()
@@ -0,0 +1,39 @@
+import os
+from fastapi import APIRouter, Depends, HTTPException, Path, status
+from fastapi.responses import FileResponse
+from ..config import settings
+from ..models.user import User
+from ..utils.dependencies import get_current_admin_user
+
+router = APIRouter(prefix="/profiles", tags=["Profiling"])
+
+PROFILE_ID_PATTERN = r"^\d{8}T\d{6}-[0-9a-f]{8}$"
+
+def _artifact_path(profile_id: str, suffix: str) -> str:
+    path = os.path.join(settings.profile_dir, profile_id + suffix)
+    if not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Profile not found"
+        )
+    return path
+
+@router.get("/{profile_id}")
+async def get_profile(
+    profile_id: str = Path(..., pattern=PROFILE_ID_PATTERN),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Get a stored request profile's timings and SQL statements (admin only)"""
+    return FileResponse(_artifact_path(profile_id, ".json"), media_type="application/json")
+
+@router.get("/{profile_id}/flamegraph")
+async def get_profile_flamegraph(
+    profile_id: str = Path(..., pattern=PROFILE_ID_PATTERN),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Download a stored profile as folded stacks for flamegraph.pl or speedscope (admin only)"""
+    return FileResponse(
+        _artifact_path(profile_id, ".folded"),
+        media_type="text/plain",
+        filename=f"{profile_id}.folded"
+    )
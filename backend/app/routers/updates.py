@@ -0,0 +1,93 @@
+import asyncio
+from typing import Optional
+import orjson
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, status
+from ..config import settings
+from ..database import SessionLocal
+from ..models.user import User
+from ..utils.push import Subscriber, push_hub
+from ..utils.security import verify_token
+
+router = APIRouter(prefix="/updates", tags=["updates"])
+
+def _active_user_id(token: str) -> Optional[int]:
+    email = verify_token(token) if isinstance(token, str) else None
+    if email is None:
+        return None
+    db = SessionLocal()
+    try:
+        user = db.query(User.id, User.is_active).filter(User.email == email).first()
+    finally:
+        db.close()
+    return user.id if user is not None and user.is_active else None
+
+def _error(subscriber: Subscriber, detail: str):
+    try:
+        subscriber.queue.put_nowait(orjson.dumps({"type": "error", "detail": detail}).decode())
+    except asyncio.QueueFull:
+        pass
+
+async def _read_watches(websocket: WebSocket, subscriber: Subscriber):
+    """Apply {"watch": [product ids]} messages until the client goes away"""
+    try:
+        while True:
+            try:
+                message = orjson.loads(await websocket.receive_text())
+                product_ids = [int(product_id) for product_id in message["watch"]]
+            except (orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+                _error(subscriber, 'Expected {"watch": [product ids]}')
+                continue
+            if len(product_ids) > settings.push_max_products:
+                _error(subscriber, f"Watch at most {settings.push_max_products} products")
+                continue
+            push_hub.watch_products(subscriber, product_ids)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        subscriber.close()
+
+async def _authenticate(websocket: WebSocket) -> Optional[int]:
+    """The user named by the first message, {"token": <access token>}"""
+    try:
+        message = await asyncio.wait_for(websocket.receive_text(), settings.push_auth_timeout_seconds)
+        token = orjson.loads(message)["token"]
+    except (asyncio.TimeoutError, orjson.JSONDecodeError, KeyError, TypeError):
+        return None
+    return await asyncio.to_thread(_active_user_id, token)
+
+@router.websocket("/ws")
+async def live_updates(websocket: WebSocket):
+    """Push the user's order status changes and watched products' stock levels.
+
+    Browsers cannot set headers on a WebSocket handshake, and a token in
+    the URL would end up in access logs, so the client sends
+    {"token": <access token>} as its first message instead.
+    """
+    await websocket.accept()
+    try:
+        user_id = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    subscriber = push_hub.connect(user_id)
+    reader = asyncio.create_task(_read_watches(websocket, subscriber))
+    try:
+        while True:
+            data = await subscriber.queue.get()
+            if subscriber.closed:
+                break
+            if subscriber.overflowed:
+                # Too far behind to catch up; the client reconnects and refetches
+                await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+                break
+            await websocket.send_text(data)
+    except (WebSocketDisconnect, RuntimeError):
+        # The client left mid-send
+        pass
+    finally:
+        push_hub.disconnect(subscriber)
+        reader.cancel()
+        await asyncio.gather(reader, return_exceptions=True)
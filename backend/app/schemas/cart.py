@@ -1,6 +1,7 @@
 # app/schemas/cart.py
 from pydantic import BaseModel
 from datetime import datetime
+from typing import List, Literal
 from .product import ProductResponse
 
 class CartItemCreate(BaseModel):
@@ -10,6 +11,14 @@ class CartItemCreate(BaseModel):
 class CartItemUpdate(BaseModel):
     quantity: int
 
+class CartBulkOperation(BaseModel):
+    op: Literal["add", "update", "remove"]
+    product_id: int
+    quantity: int = 1
+
+class CartBulkRequest(BaseModel):
+    operations: List[CartBulkOperation]
+
 class CartItemResponse(BaseModel):
     id: int
     product_id: int
@@ -29,4 +29,16 @@ class ProductResponse(ProductBase):
     updated_at: Optional[datetime] = None
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class StockShardsUpdate(BaseModel):
+    shards: int
+
+class CategoryStats(BaseModel):
+    category: str
+    product_count: int
+    min_price: float
+    max_price: float
+    newest_product_id: int
+    newest_product_name: str
+    newest_created_at: Optional[datetime] = None
\ No newline at end of file
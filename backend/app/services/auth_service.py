@@ -47,7 +47,7 @@ class AuthService:
         return Token(
             access_token=access_token,
             token_type="bearer",
-            user=UserResponse.from_orm(db_user)
+            user=UserResponse.model_validate(db_user)
         )
 
     async def login_user(self, user_credentials: UserLogin) -> Token:
@@ -75,7 +75,7 @@ class AuthService:
         return Token(
             access_token=access_token,
             token_type="bearer",
-            user=UserResponse.from_orm(user)
+            user=UserResponse.model_validate(user)
         )
 
     async def get_user_by_email(self, email: str) -> Optional[User]:
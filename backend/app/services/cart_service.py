@@ -1,72 +1,103 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import select, literal, and_
+from sqlalchemy.orm import Session, joinedload, contains_eager
 from fastapi import HTTPException, status
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from ..database import dialect_insert
 from ..models.cart import CartItem
 from ..models.product import Product
 from ..models.user import User
-from ..schemas.cart import CartItemCreate, CartItemUpdate, CartItemResponse
+from ..schemas.cart import CartItemCreate, CartItemUpdate, CartItemResponse, CartBulkOperation
+from .reservation_service import ReservationService
 
 class CartService:
     def __init__(self, db: Session):
         self.db = db
+        self.reservations = ReservationService(db)
 
     async def get_user_cart(self, user_id: int) -> List[CartItem]:
         """Get all cart items for a user"""
         return self.db.query(CartItem).filter(
             CartItem.user_id == user_id
-        ).join(Product).filter(Product.is_active == True).all()
+        ).join(Product).filter(Product.is_active == True).options(
+            contains_eager(CartItem.product)
+        ).all()
 
     async def add_to_cart(self, user_id: int, cart_item_data: CartItemCreate) -> CartItem:
-        """Add item to cart or update quantity if already exists"""
-        # Check if product exists and is active
+        """Add item to cart or update quantity if already exists.
+
+        The line is written by a single INSERT ... ON CONFLICT DO UPDATE
+        against the (user_id, product_id) unique key. The stock guard lives
+        in the statement itself, so concurrent adds can neither duplicate
+        the line nor push it past the stock on hand. The line is then held
+        with `hold_cart_lines` in the same transaction, which releases the
+        user's old hold on the product and reserves the new quantity. If
+        other carts' holds leave too little available, it rolls back the
+        upsert too and raises a 400.
+        """
+        product_id = cart_item_data.product_id
+        quantity = cart_item_data.quantity
+
+        # Only produces a row when the product is active and has enough stock
+        source = select(
+            literal(user_id), Product.id, literal(quantity)
+        ).where(
+            Product.id == product_id,
+            Product.is_active == True,
+            Product.stock_quantity >= quantity
+        )
+        stock = select(Product.stock_quantity).where(
+            Product.id == product_id
+        ).scalar_subquery()
+
+        stmt = dialect_insert(self.db, CartItem).from_select(
+            ["user_id", "product_id", "quantity"], source
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity},
+            where=stock >= CartItem.quantity + stmt.excluded.quantity
+        ).returning(CartItem.id)
+
+        cart_item_id = self.db.execute(stmt).scalar()
+
+        if cart_item_id is None:
+            self.db.rollback()
+            self._raise_add_to_cart_error(user_id, product_id, quantity)
+
+        self.reservations.hold_cart_lines(user_id, [product_id])
+        self.db.commit()
+        return self.db.query(CartItem).options(
+            joinedload(CartItem.product)
+        ).populate_existing().filter(CartItem.id == cart_item_id).one()
+
+    def _raise_add_to_cart_error(self, user_id: int, product_id: int, quantity: int):
+        """Explain why the add-to-cart upsert did not touch a row"""
         product = self.db.query(Product).filter(
-            Product.id == cart_item_data.product_id,
+            Product.id == product_id,
             Product.is_active == True
         ).first()
-        
+
         if not product:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Product not found"
             )
-        
-        # Check stock availability
-        if product.stock_quantity < cart_item_data.quantity:
+
+        in_cart = self.db.query(CartItem.quantity).filter(
+            CartItem.user_id == user_id,
+            CartItem.product_id == product_id
+        ).scalar()
+
+        if in_cart:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Only {product.stock_quantity} items available in stock"
+                detail=f"Cannot add {quantity} more items. Only {max(product.stock_quantity - in_cart, 0)} more available"
             )
-        
-        # Check if item already exists in cart
-        existing_item = self.db.query(CartItem).filter(
-            CartItem.user_id == user_id,
-            CartItem.product_id == cart_item_data.product_id
-        ).first()
-        
-        if existing_item:
-            # Update quantity
-            new_quantity = existing_item.quantity + cart_item_data.quantity
-            if product.stock_quantity < new_quantity:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"Only {product.stock_quantity} items available in stock"
-                )
-            
-            existing_item.quantity = new_quantity
-            self.db.commit()
-            self.db.refresh(existing_item)
-            return existing_item
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                user_id=user_id,
-                product_id=cart_item_data.product_id,
-                quantity=cart_item_data.quantity
-            )
-            self.db.add(cart_item)
-            self.db.commit()
-            self.db.refresh(cart_item)
-            return cart_item
+
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Only {product.stock_quantity} items available in stock"
+        )
 
     async def update_cart_item(self, user_id: int, cart_item_id: int, 
                               cart_item_update: CartItemUpdate) -> Optional[CartItem]:
@@ -82,15 +113,16 @@ class CartService:
                 detail="Cart item not found"
             )
         
-        # Check stock availability
-        product = self.db.query(Product).filter(Product.id == cart_item.product_id).first()
-        if product.stock_quantity < cart_item_update.quantity:
+        # Other carts' holds count against the stock; this line's own hold does not
+        available = self.reservations.available_to(user_id, [cart_item.product_id])[cart_item.product_id]
+        if available < cart_item_update.quantity:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail=f"Only {product.stock_quantity} items available in stock"
+                detail=f"Only {available} items available in stock"
             )
         
         cart_item.quantity = cart_item_update.quantity
+        self.reservations.hold_cart_lines(user_id, [cart_item.product_id])
         self.db.commit()
         self.db.refresh(cart_item)
         return cart_item
@@ -109,6 +141,7 @@ class CartService:
             )
         
         self.db.delete(cart_item)
+        self.reservations.hold_cart_lines(user_id, [cart_item.product_id])
         self.db.commit()
         return True
 
@@ -119,6 +152,7 @@ class CartService:
         for item in cart_items:
             self.db.delete(item)
         
+        self.reservations.hold_cart_lines(user_id)
         self.db.commit()
         return True
 
@@ -163,31 +197,141 @@ class CartService:
             CartItem.user_id == user_id
         ).first()
 
+    async def apply_bulk_operations(self, user_id: int,
+                                    operations: List[CartBulkOperation]) -> List[CartItem]:
+        """Apply a batch of add/update/remove operations in one transaction.
+
+        Operations are folded into one target quantity per product, stock is
+        validated for all touched products with a single query, and the
+        result is written with one DELETE plus one multi-row upsert.
+        """
+        targets = self._fold_operations(operations)
+        if not targets:
+            return await self.get_user_cart(user_id)
+
+        product_ids = list(targets)
+        rows = self.db.query(
+            Product.id, Product.name, Product.is_active, CartItem.quantity
+        ).outerjoin(
+            CartItem, and_(CartItem.product_id == Product.id, CartItem.user_id == user_id)
+        ).filter(Product.id.in_(product_ids)).all()
+        found = {row[0]: row for row in rows}
+        available = self.reservations.available_to(user_id, product_ids)
+
+        to_remove = []
+        to_write = []
+        for product_id, (mode, quantity) in targets.items():
+            if mode == "remove":
+                to_remove.append(product_id)
+                continue
+
+            row = found.get(product_id)
+            if row is None or not row.is_active:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Product {product_id} not found"
+                )
+
+            _, name, _, in_cart = row
+            new_quantity = quantity + (in_cart or 0) if mode == "add" else quantity
+
+            if new_quantity <= 0:
+                to_remove.append(product_id)
+                continue
+
+            if available[product_id] < new_quantity:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Only {available[product_id]} items of '{name}' available in stock"
+                )
+
+            to_write.append({"user_id": user_id, "product_id": product_id, "quantity": new_quantity})
+
+        try:
+            if to_remove:
+                self.db.query(CartItem).filter(
+                    CartItem.user_id == user_id,
+                    CartItem.product_id.in_(to_remove)
+                ).delete(synchronize_session=False)
+
+            if to_write:
+                stmt = dialect_insert(self.db, CartItem).values(to_write)
+                self.db.execute(stmt.on_conflict_do_update(
+                    index_elements=[CartItem.user_id, CartItem.product_id],
+                    set_={"quantity": stmt.excluded.quantity}
+                ))
+
+            self.reservations.hold_cart_lines(user_id, product_ids)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        self.db.expire_all()
+        return await self.get_user_cart(user_id)
+
+    def _fold_operations(self, operations: List[CartBulkOperation]) -> Dict[int, Tuple[str, int]]:
+        """Collapse an ordered operation list into (mode, quantity) per product.
+
+        mode is "add" (relative to what is already in the cart), "set"
+        (absolute quantity) or "remove".
+        """
+        targets: Dict[int, Tuple[str, int]] = {}
+
+        for operation in operations:
+            if operation.op != "remove" and operation.quantity < 0:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Quantity cannot be negative"
+                )
+
+            mode, quantity = targets.get(operation.product_id, ("add", 0))
+
+            if operation.op == "remove":
+                targets[operation.product_id] = ("remove", 0)
+            elif operation.op == "update":
+                targets[operation.product_id] = ("set", operation.quantity)
+            elif mode == "remove":
+                targets[operation.product_id] = ("set", operation.quantity)
+            else:
+                targets[operation.product_id] = (mode, quantity + operation.quantity)
+
+        return targets
+
     async def merge_carts(self, source_user_id: int, target_user_id: int) -> bool:
         """Merge cart items from one user to another (useful for guest to user conversion)"""
-        source_cart_items = await self.get_user_cart(source_user_id)
-        
-        for source_item in source_cart_items:
-            # Check if target user already has this product in cart
-            existing_item = self.db.query(CartItem).filter(
-                CartItem.user_id == target_user_id,
-                CartItem.product_id == source_item.product_id
-            ).first()
-            
-            if existing_item:
-                # Merge quantities
-                existing_item.quantity += source_item.quantity
-            else:
-                # Create new cart item for target user
-                new_item = CartItem(
-                    user_id=target_user_id,
-                    product_id=source_item.product_id,
-                    quantity=source_item.quantity
+        # Copy every active source line across in one INSERT ... SELECT,
+        # adding to the target's quantity where the product is already there
+        source = select(
+            literal(target_user_id), CartItem.product_id, CartItem.quantity
+        ).join(Product, Product.id == CartItem.product_id).where(
+            CartItem.user_id == source_user_id,
+            Product.is_active == True
+        )
+        stmt = dialect_insert(self.db, CartItem).from_select(
+            ["user_id", "product_id", "quantity"], source
+        )
+
+        try:
+            self.db.execute(stmt.on_conflict_do_update(
+                index_elements=[CartItem.user_id, CartItem.product_id],
+                set_={"quantity": CartItem.quantity + stmt.excluded.quantity}
+            ))
+
+            # Remove merged lines from source cart
+            self.db.query(CartItem).filter(
+                CartItem.user_id == source_user_id,
+                CartItem.product_id.in_(
+                    select(Product.id).where(Product.is_active == True)
                 )
-                self.db.add(new_item)
-            
-            # Remove from source cart
-            self.db.delete(source_item)
-        
-        self.db.commit()
-        return True
\ No newline at end of file
+            ).delete(synchronize_session=False)
+
+            # Free the source's holds first so the target can take them over
+            self.reservations.hold_cart_lines(source_user_id)
+            self.reservations.hold_cart_lines(target_user_id)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        return True
@@ -0,0 +1,248 @@
+import csv
+import io
+import json
+import orjson
+from typing import Any, BinaryIO, Dict, Iterator, List, Tuple
+from pydantic import ValidationError
+from sqlalchemy import insert, text, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal, dialect_insert
+from ..models.product import Product
+from ..schemas.product import ProductCreate, ProductUpdate
+from ..utils.catalog import catalog_version
+from ..utils.category_index import category_index
+from ..utils.invalidation import invalidation_bus
+from ..utils.serialization import PRODUCT_COLUMNS
+from .reservation_service import ReservationService
+from .stock_shard_service import StockShardService
+
+FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = [column.key for column in PRODUCT_COLUMNS]
+MAX_REPORTED_ERRORS = 100
+
+class CatalogIOService:
+    """Bulk product import and export for admins.
+
+    Import reads an uploaded file line by line and writes it in batches.
+    Rows without an `id` are validated with ProductCreate and insert a new
+    product. Rows with an `id` upsert: when the product exists the row is
+    validated with ProductUpdate and overwrites only the columns it gives;
+    otherwise it is validated with ProductCreate and inserts a product
+    with that id, so an export can be imported into an empty catalog.
+    Export streams the catalog from a server-side cursor.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def import_file(self, upload: BinaryIO, fmt: str) -> Dict[str, Any]:
+        """Import products from a spooled upload; returns counts and per-row errors"""
+        report = {"inserted": 0, "updated": 0, "failed": 0, "errors": []}
+        batch: List[Tuple[int, Dict[str, Any]]] = []
+
+        for line_number, raw in self._read_rows(upload, fmt):
+            try:
+                batch.append((line_number, self._validate(raw)))
+            except (ValidationError, ValueError, TypeError) as e:
+                self._record_error(report, line_number, e)
+
+            if len(batch) >= settings.product_import_batch_size:
+                self._write_batch(batch, report)
+                batch = []
+
+        if batch:
+            self._write_batch(batch, report)
+
+        # Derived state is refreshed once for the whole import
+        if report["inserted"] or report["updated"]:
+            catalog_version.bump(self.db)
+            category_index.load(self.db)
+            invalidation_bus.publish("product")
+
+        return report
+
+    def _read_rows(self, upload: BinaryIO, fmt: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        text = io.TextIOWrapper(upload, encoding="utf-8", newline="")
+
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for row in reader:
+                # DictReader files cells past the header under a None key
+                if None in row:
+                    row = {"__error__": f"Row has {len(row[None])} more field(s) than the header"}
+                yield reader.line_num, row
+            return
+
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                row = {"__error__": f"Invalid JSON: {e.msg}"}
+            yield line_number, row
+
+    def _validate(self, raw: Any) -> Dict[str, Any]:
+        if not isinstance(raw, dict):
+            raise ValueError("Row must be a JSON object")
+        if "__error__" in raw:
+            raise ValueError(raw["__error__"])
+
+        # CSV has no null; treat empty cells as missing
+        cleaned = {key: value for key, value in raw.items() if value != "" and value is not None}
+        product_id = cleaned.pop("id", None)
+
+        if product_id is None:
+            return ProductCreate(**cleaned).model_dump()
+
+        # Updates only overwrite the columns the row actually provides
+        values = ProductUpdate(**cleaned).model_dump(exclude_unset=True)
+        values["id"] = int(product_id)
+        return values
+
+    def _write_batch(self, batch: List[Tuple[int, Dict[str, Any]]], report: Dict[str, Any]):
+        inserts = [(line_number, values) for line_number, values in batch if "id" not in values]
+        updates = [(line_number, values) for line_number, values in batch if "id" in values]
+
+        shard_stock: Dict[int, int] = {}
+        if updates:
+            shard_counts = dict(self.db.query(Product.id, Product.stock_shards).filter(
+                Product.id.in_([values["id"] for _, values in updates])
+            ).all())
+            new_ids = [(line_number, values) for line_number, values in updates if values["id"] not in shard_counts]
+            updates = [(line_number, values) for line_number, values in updates if values["id"] in shard_counts]
+            updates, shard_stock = self._split_sharded_stock(updates, shard_counts, report)
+            inserts += self._validate_new_ids(new_ids, report)
+
+        try:
+            fresh = [values for _, values in inserts if "id" not in values]
+            keyed = [values for _, values in inserts if "id" in values]
+            if fresh:
+                # executemany; SQLAlchemy batches these into multi-row INSERTs
+                self.db.execute(insert(Product), fresh)
+            if keyed:
+                # Another import may create the same id first; the row then updates it
+                stmt = dialect_insert(self.db, Product)
+                self.db.execute(stmt.on_conflict_do_update(
+                    index_elements=[Product.id],
+                    set_={key: stmt.excluded[key] for key in keyed[0] if key != "id"}
+                ), keyed)
+                self._advance_id_sequence()
+            columns = [values for _, values in updates if len(values) > 1]
+            if columns:
+                # Bulk UPDATE by primary key
+                self.db.execute(update(Product), columns)
+                # Holds cannot promise more than is left
+                ReservationService(self.db).release_excess(
+                    values["id"] for values in columns if "stock_quantity" in values
+                )
+            # The shards hold the real stock; the product row catches up on reconcile
+            for product_id, stock_quantity in shard_stock.items():
+                StockShardService(self.db).set_stock(product_id, stock_quantity)
+            self.db.commit()
+        except Exception as e:
+            self.db.rollback()
+            for line_number, _ in inserts + updates:
+                self._record_error(report, line_number, f"Batch failed: {e.__class__.__name__}")
+            return
+
+        report["inserted"] += len(inserts)
+        report["updated"] += len(updates)
+
+    def _validate_new_ids(self, rows: List[Tuple[int, Dict[str, Any]]],
+                          report: Dict[str, Any]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Validate rows whose id matches no product as new products that keep that id"""
+        valid = []
+        for line_number, values in rows:
+            fields = {key: value for key, value in values.items() if key != "id"}
+            try:
+                valid.append((line_number, {"id": values["id"], **ProductCreate(**fields).model_dump()}))
+            except ValidationError as e:
+                self._record_error(report, line_number, e)
+        return valid
+
+    def _advance_id_sequence(self):
+        """Move the Postgres id sequence past explicitly inserted ids, so later inserts do not collide"""
+        if self.db.get_bind().dialect.name == "postgresql":
+            self.db.execute(text(
+                "SELECT setval(pg_get_serial_sequence('products', 'id'), (SELECT max(id) FROM products))"
+            ))
+
+    def _split_sharded_stock(self, updates: List[Tuple[int, Dict[str, Any]]], shard_counts: Dict[int, int],
+                             report: Dict[str, Any]) -> Tuple[List[Tuple[int, Dict[str, Any]]], Dict[int, int]]:
+        """Take stock_quantity for sharded products out of the row updates.
+
+        Returns the remaining updates and {product id: new total stock} for
+        StockShardService.set_stock; writing products.stock_quantity directly
+        would be undone by the next reconcile. Rows that would cut stock
+        below what carts hold are reported instead, like the admin
+        endpoint's 400.
+        """
+        sharded_ids = {
+            values["id"] for _, values in updates
+            if shard_counts[values["id"]] and "stock_quantity" in values
+        }
+        if not sharded_ids:
+            return updates, {}
+
+        totals = StockShardService(self.db).totals(sharded_ids)
+        kept = []
+        shard_stock = {}
+        for line_number, values in updates:
+            if values["id"] not in sharded_ids:
+                kept.append((line_number, values))
+                continue
+            _, reserved = totals.get(values["id"], (0, 0))
+            if values["stock_quantity"] < reserved:
+                self._record_error(report, line_number, "Stock cannot drop below the quantity held in carts")
+                continue
+            values = dict(values)
+            shard_stock[values["id"]] = values.pop("stock_quantity")
+            kept.append((line_number, values))
+        return kept, shard_stock
+
+    def _record_error(self, report: Dict[str, Any], line_number: int, error):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            message = "; ".join(
+                f"{'.'.join(str(part) for part in item['loc'])}: {item['msg']}" for item in error.errors()
+            ) if isinstance(error, ValidationError) else str(error)
+            report["errors"].append({"line": line_number, "error": message})
+
+def export_products(fmt: str, include_inactive: bool = False) -> Iterator[bytes]:
+    """Yield the catalog as NDJSON or CSV chunks, streaming rows from a server-side cursor.
+
+    Opens its own session because the response body is produced after the
+    request's dependencies have been torn down.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(*PRODUCT_COLUMNS).order_by(Product.id)
+        if not include_inactive:
+            query = query.filter(Product.is_active == True)
+
+        rows = query.execution_options(stream_results=True, yield_per=1000)
+
+        if fmt == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_FIELDS)
+            for count, row in enumerate(rows, start=1):
+                writer.writerow(row)
+                if count % 1000 == 0:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue().encode()
+        else:
+            chunk = []
+            for row in rows:
+                chunk.append(orjson.dumps(row._asdict()))
+                if len(chunk) == 1000:
+                    yield b"\n".join(chunk) + b"\n"
+                    chunk = []
+            if chunk:
+                yield b"\n".join(chunk) + b"\n"
+    finally:
+        db.close()
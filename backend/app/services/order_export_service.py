@@ -0,0 +1,102 @@
+import csv
+import io
+from datetime import datetime
+from typing import Iterator, Optional
+import orjson
+from ..database import SessionLocal
+from ..models.order import Order, OrderItem, OrderStatus
+
+ORDER_COLUMNS = (
+    Order.id, Order.user_id, Order.status, Order.total_amount, Order.shipping_address,
+    Order.tracking_number, Order.stripe_payment_intent_id, Order.created_at, Order.updated_at,
+)
+ITEM_COLUMNS = (
+    OrderItem.id.label("item_id"), OrderItem.product_id, OrderItem.quantity, OrderItem.price,
+)
+CSV_FIELDS = [
+    "order_id", "user_id", "status", "total_amount", "shipping_address", "tracking_number",
+    "stripe_payment_intent_id", "created_at", "updated_at",
+    "item_id", "product_id", "quantity", "price",
+]
+CHUNK_ROWS = 1000
+
+def export_orders(fmt: str,
+                  status: Optional[OrderStatus] = None,
+                  start_date: Optional[datetime] = None,
+                  end_date: Optional[datetime] = None) -> Iterator[bytes]:
+    """Yield orders and their items as CSV (one line per item) or NDJSON (one object per order).
+
+    Rows come from a single orders-join-items query read through a
+    server-side cursor, so memory stays constant however many orders
+    match. Opens its own session because the body is produced after the
+    request's dependencies have been torn down.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(*ORDER_COLUMNS, *ITEM_COLUMNS).outerjoin(
+            OrderItem, OrderItem.order_id == Order.id
+        )
+
+        if status:
+            query = query.filter(Order.status == status)
+        if start_date:
+            query = query.filter(Order.created_at >= start_date)
+        if end_date:
+            query = query.filter(Order.created_at <= end_date)
+
+        rows = query.order_by(Order.id, OrderItem.id).execution_options(
+            stream_results=True, yield_per=CHUNK_ROWS
+        )
+
+        if fmt == "csv":
+            yield from _csv_chunks(rows)
+        else:
+            yield from _ndjson_chunks(rows)
+    finally:
+        db.close()
+
+def _csv_chunks(rows) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_FIELDS)
+
+    for count, row in enumerate(rows, start=1):
+        values = list(row)
+        values[2] = row.status.value if row.status else None
+        writer.writerow(values)
+
+        if count % CHUNK_ROWS == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue().encode()
+
+def _ndjson_chunks(rows) -> Iterator[bytes]:
+    # Rows arrive ordered by order id, so each order's items are contiguous
+    chunk = []
+    current = None
+
+    for row in rows:
+        if current is None or current["id"] != row.id:
+            if current is not None:
+                chunk.append(orjson.dumps(current))
+                if len(chunk) >= CHUNK_ROWS:
+                    yield b"\n".join(chunk) + b"\n"
+                    chunk = []
+
+            current = {column.key: getattr(row, column.key) for column in ORDER_COLUMNS}
+            current["order_items"] = []
+
+        if row.item_id is not None:
+            current["order_items"].append({
+                "id": row.item_id,
+                "product_id": row.product_id,
+                "quantity": row.quantity,
+                "price": row.price,
+            })
+
+    if current is not None:
+        chunk.append(orjson.dumps(current))
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
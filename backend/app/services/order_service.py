@@ -1,31 +1,49 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import insert
+from sqlalchemy.orm import Session, contains_eager, selectinload, joinedload
 from fastapi import HTTPException, status
 from typing import List, Optional
-import stripe
 from datetime import datetime
+import asyncio
+import logging
 import secrets
 from ..models.order import Order, OrderItem, OrderStatus
 from ..models.cart import CartItem
 from ..models.product import Product
 from ..models.user import User
 from ..schemas.order import OrderCreate, OrderResponse, OrderStatusUpdate
-from ..config import settings
+from ..utils.clients import get_stripe
+from ..utils.metrics import track_stripe
+from ..utils.catalog import catalog_version
+from ..utils.invalidation import invalidation_bus
+from ..utils.order_events import order_status_changed, stage_order_event
 from .cart_service import CartService
 from .product_service import ProductService
+from .reservation_service import ReservationService
 
-# Configure Stripe
-stripe.api_key = settings.stripe_secret_key
+logger = logging.getLogger(__name__)
 
 class OrderService:
     def __init__(self, db: Session):
         self.db = db
         self.cart_service = CartService(db)
         self.product_service = ProductService(db)
+        self.reservations = ReservationService(db)
 
     async def create_order_from_cart(self, user_id: int, order_data: OrderCreate) -> Order:
-        """Create order from user's cart items"""
+        """Create order from user's cart items.
+
+        The Stripe call and the queries block, so they run in a worker thread.
+        """
+        return await asyncio.to_thread(self._create_order_from_cart, user_id, order_data)
+
+    def _create_order_from_cart(self, user_id: int, order_data: OrderCreate) -> Order:
+        stripe = get_stripe()
         # Get cart items
-        cart_items = await self.cart_service.get_user_cart(user_id)
+        cart_items = self.db.query(CartItem).filter(
+            CartItem.user_id == user_id
+        ).join(Product).filter(Product.is_active == True).options(
+            contains_eager(CartItem.product)
+        ).all()
         
         if not cart_items:
             raise HTTPException(
@@ -63,66 +81,88 @@ class OrderService:
                 'price': product.price
             })
         
+        # Refresh the cart's holds so they outlast the payment round trip
+        self.reservations.hold_cart_lines(user_id)
+        self.db.commit()
+        
         # Create Stripe Payment Intent
         try:
-            payment_intent = stripe.PaymentIntent.create(
-                amount=int(total_amount * 100),  # Convert to cents
-                currency='usd',
-                payment_method=order_data.payment_method_id,
-                confirmation_method='manual',
-                confirm=True,
-                metadata={
-                    'user_id': user_id,
-                    'order_type': 'ecommerce'
-                }
-            )
+            with track_stripe("payment_intent.create"):
+                payment_intent = stripe.PaymentIntent.create(
+                    amount=int(total_amount * 100),  # Convert to cents
+                    currency='usd',
+                    payment_method=order_data.payment_method_id,
+                    confirmation_method='manual',
+                    confirm=True,
+                    metadata={
+                        'user_id': user_id,
+                        'order_type': 'ecommerce'
+                    }
+                )
         except stripe.error.StripeError as e:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Payment processing failed: {str(e)}"
             )
         
-        # Create order
+        # Order, stock, cart and outbox events commit together or not at all
         db_order = Order(
             user_id=user_id,
             total_amount=total_amount,
-            status=OrderStatus.PENDING,
+            status=OrderStatus.CONFIRMED if payment_intent.status == 'succeeded' else OrderStatus.PENDING,
             stripe_payment_intent_id=payment_intent.id,
             shipping_address=order_data.shipping_address
         )
         
-        self.db.add(db_order)
-        self.db.commit()
-        self.db.refresh(db_order)
-        
-        # Create order items and update stock
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=db_order.id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                price=item_data['price']
-            )
-            self.db.add(order_item)
+        try:
+            self.db.add(db_order)
+            self.db.flush()
             
-            # Update product stock
-            await self.product_service.update_stock(
-                item_data['product_id'], 
-                -item_data['quantity']
-            )
-        
-        # Clear cart after successful order creation
-        await self.cart_service.clear_cart(user_id)
-        
-        # Update order status based on payment
-        if payment_intent.status == 'succeeded':
-            db_order.status = OrderStatus.CONFIRMED
-        
-        self.db.commit()
-        self.db.refresh(db_order)
+            self.db.execute(insert(OrderItem), [
+                {'order_id': db_order.id, **item_data} for item_data in order_items_data
+            ])
+            
+            # The priced lines become stock decrements in one guarded statement,
+            # even if the cart was edited while the payment was in flight
+            ordered = {item['product_id']: item['quantity'] for item in order_items_data}
+            self.reservations.convert_cart(user_id, ordered)
+            
+            self.db.query(CartItem).filter(
+                CartItem.user_id == user_id,
+                CartItem.product_id.in_(list(ordered))
+            ).delete(synchronize_session=False)
+            stage_order_event(self.db, db_order)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            self._release_payment(stripe, payment_intent)
+            raise
+        catalog_version.stock_changed()
+        
+        db_order = self.db.query(Order).options(
+            selectinload(Order.order_items).joinedload(OrderItem.product)
+        ).populate_existing().filter(Order.id == db_order.id).one()
+        order_status_changed(db_order)
+        invalidation_bus.publish("stock", [item.product_id for item in db_order.order_items])
         
         return db_order
 
+    def _release_payment(self, stripe, payment_intent):
+        """Refund (or cancel, if not yet captured) a payment whose order could not be written"""
+        try:
+            if payment_intent.status == 'succeeded':
+                with track_stripe("refund.create"):
+                    stripe.Refund.create(
+                        payment_intent=payment_intent.id,
+                        reason='requested_by_customer',
+                        idempotency_key=f"order-create-refund-{payment_intent.id}"
+                    )
+            else:
+                with track_stripe("payment_intent.cancel"):
+                    stripe.PaymentIntent.cancel(payment_intent.id)
+        except Exception:
+            logger.exception("Could not release payment %s for a failed order", payment_intent.id)
+
     async def get_user_orders(self, user_id: int, skip: int = 0, limit: int = 10) -> List[Order]:
         """Get all orders for a user"""
         return self.db.query(Order).filter(
@@ -148,6 +188,7 @@ class OrderService:
                 detail="Order not found"
             )
         
+        previous_status = order.status
         order.status = status_update.status
         
         if status_update.tracking_number:
@@ -157,13 +198,16 @@ class OrderService:
         if status_update.status == OrderStatus.SHIPPED and not order.tracking_number:
             order.tracking_number = self._generate_tracking_number()
         
+        stage_order_event(self.db, order, previous_status)
         self.db.commit()
         self.db.refresh(order)
+        order_status_changed(order, previous_status)
         
         return order
 
     async def cancel_order(self, order_id: int, user_id: int) -> bool:
         """Cancel an order and restore stock"""
+        stripe = get_stripe()
         order = self.db.query(Order).filter(
             Order.id == order_id,
             Order.user_id == user_id
@@ -192,12 +236,16 @@ class OrderService:
         # Cancel Stripe payment if possible
         if order.stripe_payment_intent_id:
             try:
-                stripe.PaymentIntent.cancel(order.stripe_payment_intent_id)
+                with track_stripe("payment_intent.cancel"):
+                    await asyncio.to_thread(stripe.PaymentIntent.cancel, order.stripe_payment_intent_id)
             except stripe.error.StripeError:
                 pass  # Payment might already be processed
         
+        previous_status = order.status
         order.status = OrderStatus.CANCELLED
+        stage_order_event(self.db, order, previous_status)
         self.db.commit()
+        order_status_changed(order, previous_status)
         
         return True
 
@@ -226,8 +274,9 @@ class OrderService:
     async def search_orders(self, user_id: Optional[int] = None, 
                            status: Optional[OrderStatus] = None,
                            start_date: Optional[datetime] = None,
-                           end_date: Optional[datetime] = None) -> List[Order]:
-        """Search orders with filters"""
+                           end_date: Optional[datetime] = None,
+                           limit: Optional[int] = 1000) -> List[Order]:
+        """Search orders with filters; use the admin export endpoint for unbounded result sets"""
         query = self.db.query(Order)
         
         if user_id:
@@ -242,10 +291,16 @@ class OrderService:
         if end_date:
             query = query.filter(Order.created_at <= end_date)
         
-        return query.order_by(Order.created_at.desc()).all()
+        query = query.order_by(Order.created_at.desc())
+        
+        if limit is not None:
+            query = query.limit(limit)
+        
+        return query.all()
 
     async def process_refund(self, order_id: int) -> bool:
         """Process refund for an order"""
+        stripe = get_stripe()
         order = self.db.query(Order).filter(Order.id == order_id).first()
         
         if not order:
@@ -262,10 +317,12 @@ class OrderService:
         
         try:
             # Create refund in Stripe
-            refund = stripe.Refund.create(
-                payment_intent=order.stripe_payment_intent_id,
-                reason='requested_by_customer'
-            )
+            with track_stripe("refund.create"):
+                refund = await asyncio.to_thread(
+                    stripe.Refund.create,
+                    payment_intent=order.stripe_payment_intent_id,
+                    reason='requested_by_customer'
+                )
             
             # Restore stock
             for order_item in order.order_items:
@@ -274,8 +331,11 @@ class OrderService:
                     order_item.quantity
                 )
             
+            previous_status = order.status
             order.status = OrderStatus.CANCELLED
+            stage_order_event(self.db, order, previous_status)
             self.db.commit()
+            order_status_changed(order, previous_status)
             
             return True
         
@@ -3,6 +3,12 @@ from fastapi import HTTPException, status
 from typing import List, Optional
 from ..models.product import Product
 from ..schemas.product import ProductCreate, ProductUpdate, ProductResponse
+from ..utils.catalog import catalog_version
+from ..utils.category_index import category_index
+from ..utils.invalidation import invalidation_bus
+from ..utils.popularity import popularity
+from .reservation_service import ReservationService
+from .stock_shard_service import StockShardService
 
 class ProductService:
     def __init__(self, db: Session):
@@ -38,7 +44,10 @@ class ProductService:
         db_product = Product(**product_data.dict())
         self.db.add(db_product)
         self.db.commit()
+        catalog_version.bump(self.db)
         self.db.refresh(db_product)
+        category_index.upsert(db_product)
+        invalidation_bus.publish("product", [db_product.id])
         return db_product
 
     async def update_product(self, product_id: int, product_update: ProductUpdate) -> Optional[Product]:
@@ -52,11 +61,20 @@ class ProductService:
             )
         
         update_data = product_update.dict(exclude_unset=True)
+        if db_product.stock_shards and update_data.get("stock_quantity") is not None:
+            # The shards hold the real stock; the product row catches up on reconcile
+            StockShardService(self.db).set_stock(product_id, update_data.pop("stock_quantity"))
         for field, value in update_data.items():
             setattr(db_product, field, value)
+        if update_data.get("stock_quantity") is not None:
+            # Holds cannot promise more than is left
+            ReservationService(self.db).release_excess([product_id])
         
         self.db.commit()
+        catalog_version.bump(self.db)
         self.db.refresh(db_product)
+        category_index.upsert(db_product)
+        invalidation_bus.publish("product", [db_product.id])
         return db_product
 
     async def delete_product(self, product_id: int) -> bool:
@@ -72,22 +90,38 @@ class ProductService:
         # Soft delete
         db_product.is_active = False
         self.db.commit()
+        catalog_version.bump(self.db)
+        category_index.remove(db_product.id)
+        invalidation_bus.publish("product", [db_product.id])
         return True
 
     async def get_categories(self) -> List[str]:
         """Get all product categories"""
-        categories = self.db.query(Product.category).filter(
-            Product.category.isnot(None),
-            Product.is_active == True
-        ).distinct().all()
-        
-        return [category[0] for category in categories if category[0]]
+        category_index.ensure_loaded(self.db)
+        return category_index.names()
 
     async def get_featured_products(self, limit: int = 8) -> List[Product]:
-        """Get featured products (most popular or newest)"""
-        return self.db.query(Product).filter(
-            Product.is_active == True
-        ).order_by(Product.created_at.desc()).limit(limit).all()
+        """Get featured products (most popular, topped up with the newest)"""
+        ranked_ids = popularity.top(limit * 2)
+        featured = []
+        
+        if ranked_ids:
+            by_id = {
+                product.id: product
+                for product in self.db.query(Product).filter(
+                    Product.id.in_(ranked_ids),
+                    Product.is_active == True
+                ).all()
+            }
+            featured = [by_id[product_id] for product_id in ranked_ids if product_id in by_id][:limit]
+        
+        if len(featured) < limit:
+            query = self.db.query(Product).filter(Product.is_active == True)
+            if featured:
+                query = query.filter(Product.id.notin_([product.id for product in featured]))
+            featured += query.order_by(Product.created_at.desc()).limit(limit - len(featured)).all()
+        
+        return featured
 
     async def search_products(self, query: str, limit: int = 20) -> List[Product]:
         """Search products by name and description"""
@@ -112,6 +146,11 @@ class ProductService:
         if not db_product:
             return False
         
+        if db_product.stock_shards:
+            StockShardService(self.db).adjust(product_id, quantity_change)
+            self.db.commit()
+            return True
+        
         new_quantity = db_product.stock_quantity + quantity_change
         if new_quantity < 0:
             raise HTTPException(
@@ -120,7 +159,11 @@ class ProductService:
             )
         
         db_product.stock_quantity = new_quantity
+        if quantity_change < 0:
+            ReservationService(self.db).release_excess([product_id])
         self.db.commit()
+        catalog_version.stock_changed()
+        invalidation_bus.publish("stock", [product_id])
         return True
 
     async def check_stock_availability(self, product_id: int, requested_quantity: int) -> bool:
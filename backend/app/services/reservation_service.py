@@ -0,0 +1,365 @@
+"""Inventory holds for cart lines.
+
+Every cart change re-holds the touched lines: the user's old holds on those
+products are released and the current cart quantities are reserved again
+with a fresh expiry. `Product.reserved_quantity` is the sum of live holds,
+so `stock_quantity - reserved_quantity` is what can still be promised to
+other shoppers. Holds that outlive `reservation_ttl_minutes` without cart
+activity are released by `sweep_expired`. Checkout turns the user's holds
+into stock decrements with one set-based UPDATE. When an admin cuts stock
+below what is held, `release_excess` drops the newest holds until the rest
+fit; their cart lines are held again at checkout.
+
+Holds on sharded products (see stock_shard_service) are taken from, and
+returned to, a stock shard instead of the product row.
+
+Taking or releasing a hold changes what is available, so once the
+transaction commits, the products it touched are published as a "hold"
+event, which pushes their new stock levels to watching clients. Holds are
+not "stock" events: the catalog does not show them, so they must not
+retire its ETags.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import and_, bindparam, delete, event, func, insert, select, true, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import dialect_insert
+from ..models.cart import CartItem
+from ..models.product import Product, ProductStockShard
+from ..models.reservation import InventoryReservation
+from ..utils.invalidation import invalidation_bus
+from .stock_shard_service import StockShardService
+
+SWEEP_BATCH_SIZE = 1000
+
+products = Product.__table__
+shards = ProductStockShard.__table__
+
+# Holds are not part of the product as the catalog shows it, so taking or
+# releasing one leaves updated_at (and with it the catalog ETags) alone
+KEEP_UPDATED_AT = {"updated_at": products.c.updated_at}
+
+RELEASED_COLUMNS = (InventoryReservation.product_id, InventoryReservation.quantity, InventoryReservation.shard)
+
+# Session.info key: product ids whose holds changed in the open transaction
+HELD_PRODUCTS = "reservations.changed_products"
+
+def _holds_changed(db: Session, product_ids: Iterable[int]):
+    db.info.setdefault(HELD_PRODUCTS, set()).update(product_ids)
+
+@event.listens_for(Session, "after_commit")
+def _publish_hold_changes(session: Session):
+    changed = session.info.pop(HELD_PRODUCTS, None)
+    if changed:
+        invalidation_bus.publish("hold", sorted(changed))
+
+@event.listens_for(Session, "after_rollback")
+def _forget_hold_changes(session: Session):
+    session.info.pop(HELD_PRODUCTS, None)
+
+def _unreserve(db: Session, released: Iterable):
+    """Give (product_id, quantity, shard) rows back to the available-to-promise pool"""
+    _holds_changed(db, (product_id for product_id, _, _ in released))
+    totals = defaultdict(int)
+    for product_id, quantity, shard in released:
+        totals[product_id, shard] += quantity
+
+    pooled = [{"b_id": product_id, "b_quantity": quantity}
+              for (product_id, shard), quantity in totals.items() if shard is None]
+    sharded = [{"b_id": product_id, "b_shard": shard, "b_quantity": quantity}
+               for (product_id, shard), quantity in totals.items() if shard is not None]
+    if pooled:
+        db.execute(
+            update(products).where(products.c.id == bindparam("b_id")).values(
+                reserved_quantity=products.c.reserved_quantity - bindparam("b_quantity"),
+                **KEEP_UPDATED_AT
+            ),
+            pooled
+        )
+    if sharded:
+        db.execute(
+            update(shards).where(
+                shards.c.product_id == bindparam("b_id"),
+                shards.c.shard == bindparam("b_shard")
+            ).values(reserved_quantity=shards.c.reserved_quantity - bindparam("b_quantity")),
+            sharded
+        )
+
+class ReservationService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.shards = StockShardService(db)
+
+    def hold_cart_lines(self, user_id: int, product_ids: Optional[List[int]] = None):
+        """Re-hold the user's cart quantities for `product_ids` (every line when None).
+
+        Runs in the caller's transaction and leaves the commit to it. If a
+        line cannot be held the transaction is rolled back and a 400 names
+        the product and how much of it is still available.
+        """
+        # Cart edits made through the ORM must be visible to the statements below
+        self.db.flush()
+
+        held = delete(InventoryReservation).where(InventoryReservation.user_id == user_id)
+        lines = select(
+            CartItem.product_id, CartItem.quantity, Product.is_active, Product.stock_shards
+        ).join(Product, Product.id == CartItem.product_id).where(CartItem.user_id == user_id)
+        if product_ids is not None:
+            held = held.where(InventoryReservation.product_id.in_(product_ids))
+            lines = lines.where(CartItem.product_id.in_(product_ids))
+
+        _unreserve(self.db, self.db.execute(held.returning(*RELEASED_COLUMNS)).all())
+
+        lines = self.db.execute(lines).all()
+        if not lines:
+            return
+
+        holds = {}
+        pooled = [line.product_id for line in lines if not line.stock_shards]
+        if pooled:
+            # One guarded UPDATE reserves every unsharded line; a product that is
+            # inactive or short of unreserved stock is simply not matched
+            wanted = select(CartItem.quantity).where(
+                CartItem.user_id == user_id,
+                CartItem.product_id == products.c.id
+            ).scalar_subquery()
+            reserved = self.db.execute(
+                update(products).where(
+                    products.c.id.in_(pooled),
+                    products.c.is_active == True,
+                    products.c.stock_quantity - products.c.reserved_quantity >= wanted
+                ).values(reserved_quantity=products.c.reserved_quantity + wanted, **KEEP_UPDATED_AT)
+            ).rowcount
+            if reserved == len(pooled):
+                holds.update(dict.fromkeys(pooled))
+
+        for line in lines:
+            if line.stock_shards and line.is_active:
+                shard = self.shards.reserve(line.product_id, line.quantity)
+                if shard is not None:
+                    holds[line.product_id] = shard
+
+        if len(holds) != len(lines):
+            self.db.rollback()
+            self._raise_hold_error(user_id, lines)
+
+        _holds_changed(self.db, holds)
+        expires_at = datetime.now(timezone.utc) + timedelta(minutes=settings.reservation_ttl_minutes)
+        self.db.execute(insert(InventoryReservation), [
+            {
+                "user_id": user_id, "product_id": line.product_id, "quantity": line.quantity,
+                "shard": holds[line.product_id], "expires_at": expires_at,
+            }
+            for line in lines
+        ])
+
+    def available_to(self, user_id: int, product_ids: Iterable[int]) -> Dict[int, int]:
+        """Units of each product the user could hold: unreserved stock plus their own hold"""
+        rows = self.db.query(
+            Product.id, Product.stock_shards, Product.stock_quantity, Product.reserved_quantity,
+            func.coalesce(InventoryReservation.quantity, 0)
+        ).outerjoin(InventoryReservation, and_(
+            InventoryReservation.product_id == Product.id,
+            InventoryReservation.user_id == user_id
+        )).filter(Product.id.in_(list(product_ids))).all()
+        # The product row only carries a periodic summary for sharded products
+        sharded = self.shards.totals(row.id for row in rows if row.stock_shards)
+
+        available = {}
+        for product_id, _, stock, reserved, own in rows:
+            stock, reserved = sharded.get(product_id, (stock or 0, reserved))
+            available[product_id] = max(stock - reserved + own, 0)
+        return available
+
+    def release_excess(self, product_ids: Iterable[int]) -> int:
+        """Release the newest holds on products whose stock now falls short of them.
+
+        Call after a stock edit, in the same transaction. Sharded products
+        are skipped; their stock edits are refused instead (see
+        StockShardService.set_stock). Returns how many holds were released.
+        """
+        self.db.flush()
+        short = self.db.execute(
+            select(products.c.id, products.c.reserved_quantity - func.coalesce(products.c.stock_quantity, 0)).where(
+                products.c.id.in_(list(product_ids)),
+                products.c.stock_shards == 0,
+                products.c.reserved_quantity > func.coalesce(products.c.stock_quantity, 0)
+            ).with_for_update()
+        ).all()
+
+        released_ids = []
+        for product_id, excess in short:
+            holds = self.db.execute(
+                select(InventoryReservation.id, InventoryReservation.quantity).where(
+                    InventoryReservation.product_id == product_id
+                ).order_by(InventoryReservation.id.desc())
+            ).all()
+            for hold_id, quantity in holds:
+                if excess <= 0:
+                    break
+                released_ids.append(hold_id)
+                excess -= quantity
+
+        if not released_ids:
+            return 0
+        released = self.db.execute(
+            delete(InventoryReservation).where(
+                InventoryReservation.id.in_(released_ids)
+            ).returning(*RELEASED_COLUMNS)
+        ).all()
+        _unreserve(self.db, released)
+        return len(released)
+
+    def _raise_hold_error(self, user_id: int, lines: list):
+        """Explain which line the hold UPDATE skipped; runs after the rollback"""
+        wanted = {line.product_id: line.quantity for line in lines}
+        rows = self.db.query(
+            Product.id, Product.name, Product.is_active, Product.stock_quantity,
+            Product.reserved_quantity, func.coalesce(InventoryReservation.quantity, 0)
+        ).outerjoin(InventoryReservation, and_(
+            InventoryReservation.product_id == Product.id,
+            InventoryReservation.user_id == user_id
+        )).filter(Product.id.in_(wanted)).order_by(Product.id).all()
+        # The product row only carries a periodic summary for sharded products
+        sharded = self.shards.totals(line.product_id for line in lines if line.stock_shards)
+
+        for product_id, name, is_active, stock, reserved, own in rows:
+            stock, reserved = sharded.get(product_id, (stock, reserved))
+            if not is_active:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Product '{name}' is no longer available"
+                )
+            # The user's own hold is still counted in `reserved` after the rollback
+            available = max(stock - reserved + own, 0)
+            if available < wanted[product_id]:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Only {available} items of '{name}' available"
+                )
+
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Stock changed while reserving your cart, please try again"
+        )
+
+    def convert_cart(self, user_id: int, lines: Optional[Dict[int, int]] = None):
+        """Turn the user's holds into stock decrements for checkout.
+
+        `lines` maps product id to quantity for the lines being ordered,
+        as they were priced. The cart is set back to them first, so edits
+        made while the payment was in flight cannot change what is taken
+        from stock, and lines outside them keep their holds. Without
+        `lines` the whole cart is converted.
+
+        Lines whose hold lapsed or no longer matches the cart are re-held
+        first, and holds without a cart line are released. Then a single
+        UPDATE moves every held quantity out of both stock_quantity and
+        reserved_quantity (one more covers holds on stock shards), and the
+        holds are deleted. Runs in the caller's transaction.
+        """
+        in_scope = true()
+        if lines is not None:
+            stmt = dialect_insert(self.db, CartItem).values([
+                {"user_id": user_id, "product_id": product_id, "quantity": quantity}
+                for product_id, quantity in lines.items()
+            ])
+            self.db.execute(stmt.on_conflict_do_update(
+                index_elements=[CartItem.user_id, CartItem.product_id],
+                set_={"quantity": stmt.excluded.quantity}
+            ))
+            in_scope = InventoryReservation.product_id.in_(list(lines))
+
+        stale = self.db.execute(
+            select(CartItem.product_id).outerjoin(InventoryReservation, and_(
+                InventoryReservation.user_id == CartItem.user_id,
+                InventoryReservation.product_id == CartItem.product_id
+            )).where(
+                CartItem.user_id == user_id,
+                CartItem.product_id.in_(list(lines)) if lines is not None else true(),
+                InventoryReservation.quantity.is_distinct_from(CartItem.quantity)
+            )
+        ).scalars().all()
+        if lines is None:
+            # Holds left behind for products that are no longer in the cart
+            stale += self.db.execute(
+                select(InventoryReservation.product_id).where(
+                    InventoryReservation.user_id == user_id,
+                    InventoryReservation.product_id.not_in(
+                        select(CartItem.product_id).where(CartItem.user_id == user_id)
+                    )
+                )
+            ).scalars().all()
+        if stale:
+            self.hold_cart_lines(user_id, stale)
+
+        line_count = self.db.execute(
+            select(func.count()).where(InventoryReservation.user_id == user_id, in_scope)
+        ).scalar()
+
+        held = select(InventoryReservation.quantity).where(
+            InventoryReservation.user_id == user_id,
+            InventoryReservation.shard.is_(None),
+            InventoryReservation.product_id == products.c.id
+        ).scalar_subquery()
+        converted = self.db.execute(
+            update(products).where(
+                products.c.id.in_(select(InventoryReservation.product_id).where(
+                    InventoryReservation.user_id == user_id,
+                    InventoryReservation.shard.is_(None),
+                    in_scope
+                )),
+                products.c.stock_quantity >= held
+            ).values(
+                stock_quantity=products.c.stock_quantity - held,
+                reserved_quantity=products.c.reserved_quantity - held
+            )
+        ).rowcount
+
+        # Whatever is left is held on stock shards
+        if converted != line_count:
+            held_on_shard = and_(
+                InventoryReservation.user_id == user_id,
+                InventoryReservation.product_id == shards.c.product_id,
+                InventoryReservation.shard == shards.c.shard,
+                in_scope
+            )
+            held = select(InventoryReservation.quantity).where(held_on_shard).scalar_subquery()
+            converted += self.db.execute(
+                update(shards).where(
+                    select(InventoryReservation.id).where(held_on_shard).exists(),
+                    shards.c.stock_quantity >= held
+                ).values(
+                    stock_quantity=shards.c.stock_quantity - held,
+                    reserved_quantity=shards.c.reserved_quantity - held
+                )
+            ).rowcount
+
+        if converted != line_count:
+            self.db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Insufficient stock"
+            )
+
+        self.db.execute(delete(InventoryReservation).where(InventoryReservation.user_id == user_id, in_scope))
+
+def sweep_expired(db: Session) -> int:
+    """Release holds past their expiry; returns how many were released"""
+    now = datetime.now(timezone.utc)
+    total = 0
+    while True:
+        expired = select(InventoryReservation.id).where(
+            InventoryReservation.expires_at < now
+        ).limit(SWEEP_BATCH_SIZE)
+        released = db.execute(
+            delete(InventoryReservation).where(InventoryReservation.id.in_(expired)).returning(*RELEASED_COLUMNS)
+        ).all()
+        _unreserve(db, released)
+        db.commit()
+        total += len(released)
+        if len(released) < SWEEP_BATCH_SIZE:
+            return total
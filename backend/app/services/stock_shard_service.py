@@ -0,0 +1,190 @@
+"""Sharded stock counters for flash-sale products.
+
+Under a sale every hold and checkout of a hot product updates the same
+`products` row, so they queue on its row lock. A product with
+`stock_shards = N` keeps its stock in N `product_stock_shards` rows
+instead. Each hold takes a random shard that can cover it, so concurrent
+shoppers mostly lock different rows. The product row's stock_quantity and
+reserved_quantity become a summary: `reconcile_totals` writes the shard
+sums back every `stock_reconcile_seconds`, so the catalog shows accurate
+stock without checkout writing to the product row.
+
+When no single shard can cover a hold, the shards are locked and their
+unreserved stock is redistributed, making room in one of them if the
+product as a whole still has enough.
+"""
+import random
+from typing import Dict, Iterable, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models.product import Product, ProductStockShard
+from ..models.reservation import InventoryReservation
+
+shards = ProductStockShard.__table__
+
+def reconcile_totals(db: Session) -> int:
+    """Copy shard sums onto their product rows; returns how many products changed"""
+    stock = select(func.sum(shards.c.stock_quantity)).where(
+        shards.c.product_id == Product.id
+    ).scalar_subquery()
+    reserved = select(func.sum(shards.c.reserved_quantity)).where(
+        shards.c.product_id == Product.id
+    ).scalar_subquery()
+
+    changed = db.query(Product).filter(
+        Product.stock_shards > 0,
+        (Product.stock_quantity != stock) | (Product.reserved_quantity != reserved)
+    ).update(
+        {Product.stock_quantity: stock, Product.reserved_quantity: reserved},
+        synchronize_session=False
+    )
+    db.commit()
+    return changed
+
+class StockShardService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def reserve(self, product_id: int, quantity: int) -> Optional[int]:
+        """Hold `quantity` on a random shard that can cover it; returns the shard or None"""
+        candidate = select(shards.c.id).where(
+            shards.c.product_id == product_id,
+            shards.c.stock_quantity - shards.c.reserved_quantity >= quantity
+        ).order_by(func.random()).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+
+        shard = self._reserve_where(shards.c.id == candidate, quantity)
+        if shard is None:
+            # Stock may be spread too thinly; concentrate it and take the prepared shard
+            prepared = self._redistribute(product_id, need=quantity)
+            if prepared is not None:
+                shard = self._reserve_where(
+                    (shards.c.product_id == product_id) & (shards.c.shard == prepared), quantity
+                )
+        return shard
+
+    def _reserve_where(self, condition, quantity: int) -> Optional[int]:
+        return self.db.execute(
+            update(shards).where(
+                condition,
+                shards.c.stock_quantity - shards.c.reserved_quantity >= quantity
+            ).values(
+                reserved_quantity=shards.c.reserved_quantity + quantity
+            ).returning(shards.c.shard)
+        ).scalar()
+
+    def totals(self, product_ids: Iterable[int]) -> Dict[int, Tuple[int, int]]:
+        """Current (stock, reserved) sums per sharded product"""
+        rows = self.db.query(
+            ProductStockShard.product_id,
+            func.sum(ProductStockShard.stock_quantity),
+            func.sum(ProductStockShard.reserved_quantity)
+        ).filter(ProductStockShard.product_id.in_(list(product_ids))).group_by(
+            ProductStockShard.product_id
+        ).all()
+        return {product_id: (stock, reserved) for product_id, stock, reserved in rows}
+
+    def _redistribute(self, product_id: int, total: Optional[int] = None, need: int = 0) -> Optional[int]:
+        """Spread unreserved stock evenly over the locked shards.
+
+        `total` replaces the product's stock when given. One random shard
+        also gets `need` units of headroom first, and its number is
+        returned; None when there is not that much unreserved stock.
+        """
+        rows = self.db.query(
+            ProductStockShard.shard, ProductStockShard.stock_quantity, ProductStockShard.reserved_quantity
+        ).filter(
+            ProductStockShard.product_id == product_id
+        ).order_by(ProductStockShard.shard).with_for_update().all()
+
+        if total is None:
+            total = sum(row.stock_quantity for row in rows)
+        free = total - sum(row.reserved_quantity for row in rows)
+        if free < 0 or need > free:
+            return None
+
+        prepared = random.randrange(len(rows))
+        share, remainder = divmod(free - need, len(rows))
+        self.db.execute(
+            update(shards).where(
+                shards.c.product_id == product_id,
+                shards.c.shard == bindparam("b_shard")
+            ).values(stock_quantity=bindparam("b_stock")),
+            [
+                {
+                    "b_shard": row.shard,
+                    "b_stock": row.reserved_quantity + share + (index < remainder)
+                               + (need if row.shard == prepared else 0),
+                }
+                for index, row in enumerate(rows)
+            ]
+        )
+        return prepared
+
+    def set_stock(self, product_id: int, stock_quantity: int):
+        """Replace a sharded product's total stock (admin edits and restocks)"""
+        if self._redistribute(product_id, total=stock_quantity) is None:
+            self.db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Stock cannot drop below the quantity held in carts"
+            )
+
+    def adjust(self, product_id: int, quantity_change: int):
+        """Add to (or take from) a sharded product's total stock"""
+        stock, _ = self.totals([product_id])[product_id]
+        if stock + quantity_change < 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Insufficient stock"
+            )
+        self.set_stock(product_id, stock + quantity_change)
+
+    def configure(self, product_id: int, count: int) -> Product:
+        """Split a product's stock across `count` shards, or fold it back with 0.
+
+        Existing holds move with the stock: they are pinned to shard 0 when
+        sharding, and back onto the product row when unsharding.
+        """
+        if not 0 <= count <= settings.stock_max_shards:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Shard count must be between 0 and {settings.stock_max_shards}"
+            )
+
+        product = self.db.query(Product).filter(Product.id == product_id).with_for_update().first()
+        if not product:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Product not found"
+            )
+
+        if product.stock_shards:
+            product.stock_quantity, product.reserved_quantity = self.totals([product_id]).get(product_id, (0, 0))
+            self.db.query(ProductStockShard).filter(
+                ProductStockShard.product_id == product_id
+            ).delete(synchronize_session=False)
+
+        stock = product.stock_quantity or 0
+        reserved = product.reserved_quantity or 0
+        self.db.query(InventoryReservation).filter(
+            InventoryReservation.product_id == product_id
+        ).update({InventoryReservation.shard: 0 if count else None}, synchronize_session=False)
+
+        if count:
+            share, remainder = divmod(max(stock - reserved, 0), count)
+            self.db.add_all(
+                ProductStockShard(
+                    product_id=product_id,
+                    shard=shard,
+                    stock_quantity=share + (shard < remainder) + (reserved if shard == 0 else 0),
+                    reserved_quantity=reserved if shard == 0 else 0
+                )
+                for shard in range(count)
+            )
+
+        product.stock_shards = count
+        self.db.commit()
+        self.db.refresh(product)
+        return product
@@ -0,0 +1,225 @@
+"""Admission control for checkout.
+
+Checkout is the most expensive request we serve, and a surge of it used to
+starve catalog and cart traffic of the same workers. At most
+`checkout_max_concurrency` checkouts now run at once. Anyone arriving while
+the gate is full gets a ticket in a FIFO queue and a 429 that carries the
+ticket, their position and a Retry-After estimated from recent checkout
+durations. Retrying with the X-Checkout-Ticket header keeps the place in
+line, and a ticket is admitted once enough slots are free for everyone
+ahead of it. A ticket that is not presented again within its Retry-After
+plus `checkout_ticket_grace_seconds` is dropped, so abandoned places do
+not hold up the line.
+
+The default backend keeps the queue in this process, so the limit applies
+per worker. With ADMISSION_BACKEND=redis, the slots and the queue are
+shared by every worker through REDIS_URL. Each running checkout holds a
+lease there that expires after `checkout_lease_seconds`, in case its
+worker dies. If Redis is unreachable, each worker falls back to its own
+local queue.
+"""
+import logging
+import math
+import re
+import secrets
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+import orjson
+from ..config import settings
+from .clients import get_redis
+from .metrics import checkout_admissions, checkout_in_progress
+
+logger = logging.getLogger(__name__)
+
+TICKET_HEADER = b"x-checkout-ticket"
+TICKET_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Endpoints that queue behind the checkout gate
+ADMISSION_ROUTES = (
+    ("POST", re.compile(r"^/orders/?$")),
+)
+
+class Admission(NamedTuple):
+    admitted: bool
+    ticket: Optional[str] = None
+    position: int = 0
+    # Handed back to release(); None for the local backend
+    lease: Optional[str] = None
+
+class LocalAdmissionQueue:
+    """Slots and FIFO tickets for this process; every call runs on the event loop"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        # ticket -> deadline for presenting it again, in arrival order
+        self.queue: "OrderedDict[str, float]" = OrderedDict()
+
+    async def admit(self, ticket: Optional[str], seconds_per_position: float) -> Admission:
+        now = time.monotonic()
+        for stale in [t for t, deadline in self.queue.items() if deadline < now]:
+            del self.queue[stale]
+
+        free = self.limit - self.active
+        if ticket is None:
+            if free > 0 and not self.queue:
+                self.active += 1
+                return Admission(True)
+            ticket = secrets.token_urlsafe(16)
+
+        # Presenting a known ticket keeps its place; an unknown one joins at the back
+        self.queue.setdefault(ticket, 0.0)
+        position = list(self.queue).index(ticket) + 1
+        if position <= free:
+            del self.queue[ticket]
+            self.active += 1
+            return Admission(True)
+
+        self.queue[ticket] = now + settings.checkout_ticket_grace_seconds + seconds_per_position * position
+        return Admission(False, ticket, position)
+
+    async def release(self, lease: Optional[str]):
+        self.active -= 1
+
+# KEYS: active leases (zset, score = lease expiry), queue (zset, score = arrival),
+#       ticket deadlines (zset), arrival counter
+# ARGV: ticket or "", new ticket, now, limit, lease expiry, grace, seconds per position
+_ADMIT_SCRIPT = """
+local active, queue, deadlines, arrivals = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local ticket, new_ticket = ARGV[1], ARGV[2]
+local now, limit, lease_until = tonumber(ARGV[3]), tonumber(ARGV[4]), tonumber(ARGV[5])
+local grace, per_position = tonumber(ARGV[6]), tonumber(ARGV[7])
+
+redis.call('ZREMRANGEBYSCORE', active, '-inf', now)
+for _, stale in ipairs(redis.call('ZRANGEBYSCORE', deadlines, '-inf', now)) do
+    redis.call('ZREM', queue, stale)
+end
+redis.call('ZREMRANGEBYSCORE', deadlines, '-inf', now)
+
+local free = limit - redis.call('ZCARD', active)
+if ticket == '' then
+    if free > 0 and redis.call('ZCARD', queue) == 0 then
+        redis.call('ZADD', active, lease_until, new_ticket)
+        return {1, new_ticket, 0}
+    end
+    ticket = new_ticket
+end
+
+if not redis.call('ZSCORE', queue, ticket) then
+    redis.call('ZADD', queue, redis.call('INCR', arrivals), ticket)
+end
+local position = redis.call('ZRANK', queue, ticket) + 1
+if position <= free then
+    redis.call('ZREM', queue, ticket)
+    redis.call('ZREM', deadlines, ticket)
+    redis.call('ZADD', active, lease_until, ticket)
+    return {1, ticket, 0}
+end
+
+redis.call('ZADD', deadlines, now + grace + per_position * position, ticket)
+return {0, ticket, position}
+"""
+
+class RedisAdmissionQueue:
+    """Slots and FIFO tickets shared by every worker through Redis"""
+
+    KEYS = ("admission:checkout:active", "admission:checkout:queue",
+            "admission:checkout:deadlines", "admission:checkout:arrivals")
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.fallback = LocalAdmissionQueue(limit)
+        self._script = None
+
+    async def admit(self, ticket: Optional[str], seconds_per_position: float) -> Admission:
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(_ADMIT_SCRIPT)
+            now = time.time()
+            admitted, ticket, position = await self._script(keys=self.KEYS, args=[
+                ticket or "", secrets.token_urlsafe(16), now, self.limit,
+                now + settings.checkout_lease_seconds,
+                settings.checkout_ticket_grace_seconds, seconds_per_position,
+            ])
+        except Exception as e:
+            logger.warning("Admission queue unavailable, using the local gate: %s", e)
+            return await self.fallback.admit(ticket, seconds_per_position)
+
+        ticket = ticket.decode()
+        if admitted:
+            return Admission(True, lease=ticket)
+        return Admission(False, ticket, position)
+
+    async def release(self, lease: Optional[str]):
+        if lease is None:
+            await self.fallback.release(None)
+            return
+        try:
+            await get_redis().zrem(self.KEYS[0], lease)
+        except Exception as e:
+            # The lease expires on its own after checkout_lease_seconds
+            logger.warning("Could not release checkout lease: %s", e)
+
+def build_queue():
+    """The admission queue selected by settings.admission_backend"""
+    if settings.admission_backend == "redis":
+        return RedisAdmissionQueue(settings.checkout_max_concurrency)
+    return LocalAdmissionQueue(settings.checkout_max_concurrency)
+
+class CheckoutAdmissionMiddleware:
+    """Queue checkout requests behind a bounded concurrency gate"""
+
+    def __init__(self, app, queue=None):
+        self.app = app
+        self.queue = queue or build_queue()
+        # Moving average of admitted checkout durations, for Retry-After estimates
+        self.average_seconds = 1.0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            scope["method"] == method and pattern.match(scope["path"])
+            for method, pattern in ADMISSION_ROUTES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        ticket = dict(scope["headers"]).get(TICKET_HEADER, b"").decode()
+        seconds_per_position = self.average_seconds / self.queue.limit
+        admission = await self.queue.admit(
+            ticket if TICKET_PATTERN.match(ticket) else None, seconds_per_position
+        )
+
+        if not admission.admitted:
+            checkout_admissions.inc(outcome="queued")
+            await self._queued(send, admission, max(1, math.ceil(seconds_per_position * admission.position)))
+            return
+
+        checkout_admissions.inc(outcome="admitted")
+        checkout_in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            checkout_in_progress.dec()
+            await self.queue.release(admission.lease)
+            self.average_seconds = 0.8 * self.average_seconds + 0.2 * (time.perf_counter() - start)
+
+    async def _queued(self, send, admission: Admission, retry_after: int):
+        body = orjson.dumps({
+            "detail": "Checkout is busy; retry with your ticket to keep your place in line",
+            "ticket": admission.ticket,
+            "position": admission.position,
+            "retry_after": retry_after,
+        })
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                (TICKET_HEADER, admission.ticket.encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,189 @@
+"""Catalog versioning for conditional GETs on the product endpoints.
+
+Catalog ETags are derived from the database, so every worker, and a
+restarted process, gives the same ETag for the same catalog. Each ETag has
+two parts:
+
+- generation: a counter persisted in `catalog_generation`. Every catalog
+  content write (products created, edited, deleted or imported) bumps it.
+- stock stamp: a digest of the newest Product.updated_at, the number of
+  products and their total stock_quantity. Checkouts, restocks and the
+  shard reconciler change it. Cart holds do not, since the responses do
+  not show them.
+
+Both parts are held in memory, so a matching If-None-Match can be answered
+with 304 before any database work happens. A local write refreshes them
+right away. Another worker's write arrives as an invalidation event: a
+"product" event reloads both parts, and a "stock" event marks the stock
+stamp stale. A stale stock stamp is read again on the next catalog
+request, at most once every `catalog_stock_refresh_seconds`, so a cached
+listing can show stock levels that trail by up to that long.
+
+The category endpoints use the generation alone, since they contain no
+stock. Single-resource endpoints key their ETag by the resource as well,
+so an ETag for one product never answers for another that may not exist.
+"""
+import hashlib
+import threading
+import time
+from typing import List, Optional
+from fastapi import Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal, dialect_insert, get_read_db
+from ..models.product import CatalogGeneration, Product
+from .category_index import category_index
+from .invalidation import invalidation_bus
+from .replicas import primary_lsn, replica_caught_up
+
+GENERATION_ROW = 1
+
+class CatalogVersion:
+    def __init__(self):
+        # None until read from the database; the first ETag request reads both
+        self._generation: Optional[int] = None
+        self._stock: Optional[str] = None
+        self._stock_stale = True
+        self._stock_read_at = 0.0
+        # Primary WAL position when the version last changed; None off Postgres
+        self.lsn: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def load(self, db: Session):
+        """Read both parts of the version from the database"""
+        self._set(db, generation=self._read_generation(db), stock=self._read_stock(db))
+
+    def bump(self, db: Session):
+        """Record a committed catalog content write; every outstanding ETag becomes stale"""
+        stmt = dialect_insert(db, CatalogGeneration).values(id=GENERATION_ROW, generation=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[CatalogGeneration.id],
+            set_={"generation": CatalogGeneration.generation + 1}
+        ))
+        db.commit()
+        self.load(db)
+
+    def stock_changed(self):
+        """Stock levels moved; the stock stamp is read again on the next request"""
+        self._stock_stale = True
+
+    @property
+    def etag(self) -> str:
+        return self.etag_for()
+
+    def etag_for(self, resource: Optional[str] = None, stock: bool = True) -> str:
+        """The current ETag, scoped to one resource when given; `stock=False` leaves out stock levels"""
+        self._refresh()
+        tag = f"{self._generation}.{self._stock}" if stock else f"{self._generation}"
+        return f'"{tag}-{resource}"' if resource is not None else f'"{tag}"'
+
+    def _refresh(self):
+        if self._generation is not None and not (
+            self._stock_stale and time.monotonic() - self._stock_read_at >= settings.catalog_stock_refresh_seconds
+        ):
+            return
+        db = SessionLocal()
+        try:
+            if self._generation is None:
+                self.load(db)
+            else:
+                self._set(db, stock=self._read_stock(db))
+        finally:
+            db.close()
+
+    def _read_generation(self, db: Session) -> int:
+        return db.execute(
+            select(CatalogGeneration.generation).where(CatalogGeneration.id == GENERATION_ROW)
+        ).scalar() or 0
+
+    def _read_stock(self, db: Session) -> str:
+        # Cleared before the read, so a change committed during it marks the stamp stale again
+        self._stock_stale = False
+        self._stock_read_at = time.monotonic()
+        newest, count, stock = db.execute(select(
+            func.max(func.coalesce(Product.updated_at, Product.created_at)),
+            func.count(Product.id),
+            func.coalesce(func.sum(Product.stock_quantity), 0)
+        )).one()
+        return hashlib.sha1(f"{newest}|{count}|{stock}".encode()).hexdigest()[:12]
+
+    def _set(self, db: Session, generation: Optional[int] = None, stock: Optional[str] = None):
+        if (generation is None or generation == self._generation) and (stock is None or stock == self._stock):
+            return
+        # Read after the version, so it covers every commit the version reflects
+        lsn = primary_lsn(db)
+        with self._lock:
+            if generation is not None:
+                self._generation = generation
+            if stock is not None:
+                self._stock = stock
+            self.lsn = lsn
+
+catalog_version = CatalogVersion()
+
+@invalidation_bus.on("product")
+def _reload_changed_products(product_ids: Optional[List[int]]):
+    """Another worker edited products: refresh the category index and the catalog version"""
+    db = SessionLocal()
+    try:
+        if product_ids is None:
+            category_index.load(db)
+        else:
+            category_index.reload_products(db, product_ids)
+        catalog_version.load(db)
+    finally:
+        db.close()
+
+@invalidation_bus.on("stock")
+def _stock_changed(product_ids: Optional[List[int]]):
+    """Stock levels are part of the product responses"""
+    catalog_version.stock_changed()
+
+def _matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison, as RFC 9110 requires for If-None-Match"""
+    if if_none_match.strip() == "*":
+        return True
+
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
+
+def set_catalog_headers(response: Response, etag: Optional[str] = None) -> Response:
+    """Attach the catalog ETag and Cache-Control to a response"""
+    response.headers["ETag"] = etag or catalog_version.etag
+    response.headers["Cache-Control"] = f"public, max-age={settings.catalog_cache_max_age}, must-revalidate"
+    return response
+
+def get_catalog_db(request: Request):
+    """Read session for ETagged catalog endpoints.
+
+    Right after a catalog write the replica may still serve the old rows,
+    which would then be cached under the new ETag. Those reads stay on the
+    primary until the replica has replayed the WAL up to where the current
+    version was read.
+    """
+    if not replica_caught_up(catalog_version.lsn):
+        request.state.read_primary = True
+    yield from get_read_db(request)
+
+def catalog_not_modified(request: Request, resource: Optional[str] = None, stock: bool = True) -> Optional[Response]:
+    """Return a 304 response if the client already has the current catalog version.
+
+    Pass `resource` for endpoints that can 404, and tag their responses
+    with catalog_version.etag_for(resource). Pass `stock=False` for
+    endpoints whose responses contain no stock levels, and tag them with
+    catalog_version.etag_for(resource, stock=False).
+    """
+    if_none_match = request.headers.get("if-none-match")
+    etag = catalog_version.etag_for(resource, stock)
+
+    # "*" matches any existing representation, which only the lookup can tell
+    if resource is not None and if_none_match and if_none_match.strip() == "*":
+        return None
+
+    if if_none_match and _matches(if_none_match, etag):
+        return set_catalog_headers(Response(status_code=304), etag)
+
+    return None
@@ -0,0 +1,133 @@
+"""In-memory category index over the active catalog.
+
+Tracks, per category, the active product count, price range and newest
+product. It is loaded once at startup and kept current by the product
+write paths, so the categories endpoints never scan the products table.
+"""
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..models.product import Product
+
+# product_id -> (price, created_at, name)
+_Entry = Tuple[float, Any, str]
+
+class CategoryIndex:
+    def __init__(self):
+        self._products: Dict[str, Dict[int, _Entry]] = {}
+        self._category_of: Dict[int, str] = {}
+        self._stats: Dict[str, dict] = {}
+        self._names: List[str] = []
+        self._summary: List[dict] = []
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, db: Session):
+        """Rebuild the whole index from the active products"""
+        rows = db.query(
+            Product.id, Product.category, Product.price, Product.created_at, Product.name
+        ).filter(
+            Product.is_active == True,
+            Product.category.isnot(None)
+        ).all()
+
+        products: Dict[str, Dict[int, _Entry]] = {}
+        category_of: Dict[int, str] = {}
+        for product_id, category, price, created_at, name in rows:
+            if not category:
+                continue
+            products.setdefault(category, {})[product_id] = (price, created_at, name)
+            category_of[product_id] = category
+
+        with self._lock:
+            self._products = products
+            self._category_of = category_of
+            self._stats = {category: self._aggregate(category, entries) for category, entries in products.items()}
+            self._publish()
+            self._loaded = True
+
+    def ensure_loaded(self, db: Session):
+        if not self._loaded:
+            self.load(db)
+
+    def upsert(self, product: Product):
+        """Apply a created or updated product"""
+        with self._lock:
+            touched = {self._detach(product.id)}
+
+            if product.is_active and product.category:
+                self._products.setdefault(product.category, {})[product.id] = (
+                    product.price, product.created_at, product.name
+                )
+                self._category_of[product.id] = product.category
+                touched.add(product.category)
+
+            self._refresh(touched)
+
+    def remove(self, product_id: int):
+        """Apply a soft delete"""
+        with self._lock:
+            self._refresh({self._detach(product_id)})
+
+    def reload_products(self, db: Session, product_ids: List[int]):
+        """Re-read the given products, e.g. after another worker changed them"""
+        products = db.query(Product).filter(Product.id.in_(product_ids)).all()
+        for product in products:
+            self.upsert(product)
+        for missing in set(product_ids) - {product.id for product in products}:
+            self.remove(missing)
+
+    def names(self) -> List[str]:
+        return self._names
+
+    def summary(self) -> List[dict]:
+        return self._summary
+
+    def _detach(self, product_id: int) -> Optional[str]:
+        category = self._category_of.pop(product_id, None)
+        if category is not None:
+            self._products[category].pop(product_id, None)
+        return category
+
+    def _refresh(self, categories):
+        """Recompute only the touched categories, then republish the cached lists"""
+        for category in categories:
+            if category is None:
+                continue
+            entries = self._products.get(category)
+            if entries:
+                self._stats[category] = self._aggregate(category, entries)
+            else:
+                self._products.pop(category, None)
+                self._stats.pop(category, None)
+
+        self._publish()
+
+    def _publish(self):
+        # Swap in new lists so readers never see a half-built result
+        self._names = sorted(self._stats)
+        self._summary = [self._stats[name] for name in self._names]
+
+    @staticmethod
+    def _aggregate(category: str, entries: Dict[int, _Entry]) -> dict:
+        prices = [price for price, _, _ in entries.values()]
+        newest_id, (_, newest_at, newest_name) = max(
+            entries.items(),
+            key=lambda item: (item[1][1] is not None, item[1][1] or 0, item[0])
+        )
+
+        return {
+            "category": category,
+            "product_count": len(entries),
+            "min_price": min(prices),
+            "max_price": max(prices),
+            "newest_product_id": newest_id,
+            "newest_product_name": newest_name,
+            "newest_created_at": newest_at,
+        }
+
+category_index = CategoryIndex()
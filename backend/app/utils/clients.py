@@ -0,0 +1,36 @@
+"""Lazily configured third-party SDK clients.
+
+The Stripe and OpenAI SDKs are expensive to import, so they are only
+loaded the first time a request actually needs them. Redis is optional
+and only imported when a feature is configured to use it. Both API base URLs
+can be overridden to point at stripe-mock or the fakes in benchmarks/.
+"""
+from functools import lru_cache
+from ..config import settings
+
+@lru_cache(maxsize=None)
+def get_stripe():
+    """Return the configured stripe module, importing it on first use"""
+    import stripe
+
+    stripe.api_key = settings.stripe_secret_key
+    if settings.stripe_api_base:
+        stripe.api_base = settings.stripe_api_base
+    return stripe
+
+@lru_cache(maxsize=None)
+def get_openai():
+    """Return the configured openai module, importing it on first use"""
+    import openai
+
+    openai.api_key = settings.openai_api_key
+    if settings.openai_api_base:
+        openai.api_base = settings.openai_api_base
+    return openai
+
+@lru_cache(maxsize=None)
+def get_redis():
+    """Return a shared asyncio Redis client for settings.redis_url"""
+    import redis.asyncio
+
+    return redis.asyncio.from_url(settings.redis_url)
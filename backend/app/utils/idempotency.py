@@ -0,0 +1,255 @@
+"""Idempotency-Key support for order creation and cancellation.
+
+The first request with a given key claims a row in `idempotency_keys`
+(unique per owner, method, path and key), runs, and stores its response.
+A retry with the same key replays that response after one indexed lookup.
+A duplicate that arrives while the first is still running waits for it:
+it wakes on an in-process event when the first runs in the same worker,
+and polls the row otherwise. Database work runs in worker threads, never
+on the event loop. 5xx outcomes are not stored, so the client
+can retry them, unless the endpoint marks one final with the
+`Idempotency-Final` response header (a checkout that was charged, failed
+and refunded: a retry would only replay the refunded payment). The header
+is stripped before the response leaves. A claim whose request died with its worker is taken over
+once `idempotency_lock_seconds` have passed. Rows expire after
+`idempotency_ttl_hours` and are swept by `purge_expired`.
+"""
+import asyncio
+import hashlib
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple
+import orjson
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..database import SessionLocal
+from ..models.idempotency import IdempotencyKey
+from .security import bearer_subject
+
+KEY_HEADER = b"idempotency-key"
+FINAL_OUTCOME_HEADER = "Idempotency-Final"
+_FINAL_HEADER_NAME = FINAL_OUTCOME_HEADER.lower().encode()
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+# Endpoints whose retries must not repeat payment, stock or refund side effects
+IDEMPOTENT_ROUTES = (
+    ("POST", re.compile(r"^/orders/?$")),
+    ("POST", re.compile(r"^/orders/\d+/cancel$")),
+)
+
+Scope = Tuple[str, str, str, str]
+
+# Requests currently holding a claim in this worker, for duplicates to wait on
+_inflight: Dict[Scope, asyncio.Event] = {}
+
+def _claim(db: Session, ident: Scope, request_hash: str) -> Tuple[bool, Optional[dict]]:
+    """Claim the key, or return the live row's state as (False, row)"""
+    owner, method, path, key = ident
+    now = datetime.now(timezone.utc)
+    match = (
+        IdempotencyKey.owner == owner,
+        IdempotencyKey.method == method,
+        IdempotencyKey.path == path,
+        IdempotencyKey.key == key,
+    )
+
+    # The common retry: a single indexed lookup that finds a stored outcome
+    row = db.query(
+        IdempotencyKey.request_hash, IdempotencyKey.status_code,
+        IdempotencyKey.content_type, IdempotencyKey.response_body
+    ).filter(*match, IdempotencyKey.expires_at >= now).first()
+
+    if row is not None:
+        if row.status_code is None and row.request_hash == request_hash:
+            # Take over a claim abandoned by a crashed worker (compare-and-set on the lock)
+            taken = db.query(IdempotencyKey).filter(
+                *match,
+                IdempotencyKey.status_code.is_(None),
+                IdempotencyKey.locked_until < now
+            ).update(
+                {IdempotencyKey.locked_until: now + timedelta(seconds=settings.idempotency_lock_seconds)},
+                synchronize_session=False
+            )
+            db.commit()
+            if taken:
+                return True, None
+        # Hand the connection back while the caller waits or replays
+        db.rollback()
+        return False, row._asdict()
+
+    # An expired outcome no longer counts; the key is free again
+    db.query(IdempotencyKey).filter(*match, IdempotencyKey.expires_at < now).delete(synchronize_session=False)
+    db.add(IdempotencyKey(
+        owner=owner, method=method, path=path, key=key, request_hash=request_hash,
+        locked_until=now + timedelta(seconds=settings.idempotency_lock_seconds),
+        expires_at=now + timedelta(hours=settings.idempotency_ttl_hours),
+    ))
+    try:
+        db.commit()
+        return True, None
+    except IntegrityError:
+        # Another request claimed it first; the caller looks again
+        db.rollback()
+        return False, None
+
+def _finish(ident: Scope, status_code: int, content_type: Optional[str], body: bytes, final: bool = False):
+    """Store the outcome for replay, or release the key when it should be retried"""
+    owner, method, path, key = ident
+    db = SessionLocal()
+    try:
+        query = db.query(IdempotencyKey).filter(
+            IdempotencyKey.owner == owner,
+            IdempotencyKey.method == method,
+            IdempotencyKey.path == path,
+            IdempotencyKey.key == key
+        )
+        if status_code is None or (status_code >= 500 and not final):
+            query.delete(synchronize_session=False)
+        else:
+            query.update({
+                IdempotencyKey.status_code: status_code,
+                IdempotencyKey.content_type: content_type,
+                IdempotencyKey.response_body: body,
+            }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def purge_expired(db: Session) -> int:
+    """Delete stored outcomes past their TTL"""
+    deleted = db.query(IdempotencyKey).filter(
+        IdempotencyKey.expires_at < datetime.now(timezone.utc)
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+async def _send_json(send, status_code: int, detail: str, headers: list = ()):
+    body = orjson.dumps({"detail": detail})
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+async def _read_body(receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+class IdempotencyMiddleware:
+    """Replay stored outcomes for repeated Idempotency-Key requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not any(
+            scope["method"] == method and pattern.match(scope["path"])
+            for method, pattern in IDEMPOTENT_ROUTES
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        key = headers.get(KEY_HEADER, b"").decode()
+        owner = bearer_subject(headers) if key else None
+        # Without a key, or a valid token to scope it to, the endpoint runs as usual
+        if not owner:
+            await self.app(scope, receive, send)
+            return
+
+        if len(key) > MAX_KEY_LENGTH:
+            await _send_json(send, 400, f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters")
+            return
+
+        body = await _read_body(receive)
+        ident = (owner, scope["method"], scope["path"], key)
+        request_hash = hashlib.sha256(body).hexdigest()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.idempotency_wait_seconds
+        # One session for every poll; it hands its connection back to the pool between them
+        db = SessionLocal()
+        try:
+            while True:
+                claimed, row = await asyncio.to_thread(_claim, db, ident, request_hash)
+                if claimed:
+                    break
+                # No row means another request claimed the key between our lookup and insert
+                if row is not None:
+                    if row["request_hash"] != request_hash:
+                        await _send_json(send, 422, "Idempotency-Key was already used with a different request")
+                        return
+                    if row["status_code"] is not None:
+                        await self._replay(send, row)
+                        return
+
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    await _send_json(send, 409, "A request with this Idempotency-Key is still in progress",
+                                     [(b"retry-after", b"1")])
+                    return
+
+                event = _inflight.get(ident)
+                if event is not None:
+                    try:
+                        await asyncio.wait_for(event.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await asyncio.sleep(min(POLL_INTERVAL, remaining))
+        finally:
+            await asyncio.to_thread(db.close)
+
+        await self._execute(scope, receive, send, ident, body)
+
+    async def _execute(self, scope, receive, send, ident: Scope, body: bytes):
+        event = _inflight[ident] = asyncio.Event()
+        response = {"status": None, "content_type": None, "body": [], "final": False}
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                # Only disconnects are left to pass through
+                return await receive()
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                kept = [(name, value) for name, value in headers if name.lower() != _FINAL_HEADER_NAME]
+                response["status"] = message["status"]
+                response["content_type"] = dict(headers).get(b"content-type", b"").decode() or None
+                response["final"] = len(kept) != len(headers)
+                message = {**message, "headers": kept}
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            try:
+                await asyncio.to_thread(
+                    _finish, ident, response["status"], response["content_type"], b"".join(response["body"]),
+                    response["final"]
+                )
+            finally:
+                _inflight.pop(ident, None)
+                event.set()
+
+    async def _replay(self, send, row: dict):
+        body = row["response_body"] or b""
+        headers = [(b"idempotent-replayed", b"true"), (b"content-length", str(len(body)).encode())]
+        if row["content_type"]:
+            headers.append((b"content-type", row["content_type"].encode()))
+        await send({"type": "http.response.start", "status": row["status_code"], "headers": headers})
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,285 @@
+"""Cross-worker invalidation for the in-process caches.
+
+Each worker keeps its own catalog version and category index. A write in
+one worker updates that worker's copies directly and then calls
+`invalidation_bus.publish(entity, ids)`. Every other worker receives the
+event and runs the handlers registered with `@invalidation_bus.on(entity)`,
+which evict or reload what the event touched. Handlers registered with
+`own=True` also run in the publishing worker, after the broker echoes its
+event back. The push hub uses them so that every worker, including the
+writer, notifies its own connected clients. Entities:
+
+- "product": products were created, edited or deleted. `ids=None` means
+  any product may have changed.
+- "stock": only stock levels changed.
+- "hold": cart holds changed the quantity available to promise, but not
+  the stock. Only the push hub listens, so holds never retire catalog
+  ETags.
+- "order": orders were placed or changed status.
+
+Transports, chosen by INVALIDATION_BACKEND:
+
+- loopback: in-process only. A single worker needs nothing more. Tests
+  can put several buses on one hub to stand in for several workers.
+- postgres: LISTEN/NOTIFY on the primary database (psycopg2 driver).
+- redis: pub/sub on REDIS_URL.
+
+Delivery is best effort. After a broker connection drops, a worker
+reconnects and then invalidates everything, because it may have missed
+events in between. Handlers run one event at a time, in order, off the
+event loop. The time from publish to applied is exported as
+cache_invalidation_propagation_seconds.
+"""
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import orjson
+from sqlalchemy import text
+from ..config import settings
+from .metrics import cache_invalidation_propagation, cache_invalidations_published
+
+logger = logging.getLogger(__name__)
+
+RECONNECT_SECONDS = 1.0
+# NOTIFY payloads are capped at 8000 bytes; larger changes invalidate everything
+MAX_IDS = 500
+
+Deliver = Callable[[str], None]
+
+class LoopbackTransport:
+    """Delivers to every transport on the same hub, within this process"""
+
+    def __init__(self, hub: Optional[list] = None):
+        self.hub = hub if hub is not None else []
+
+    async def start(self, deliver: Deliver, resync: Callable[[], None]):
+        self.deliver = deliver
+        self.hub.append(self)
+
+    async def publish(self, payload: str):
+        for transport in list(self.hub):
+            transport.deliver(payload)
+
+    async def stop(self):
+        self.hub.remove(self)
+
+class PostgresTransport:
+    """LISTEN/NOTIFY on a dedicated connection to the primary"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._connection = None
+        self._loop = None
+
+    async def start(self, deliver: Deliver, resync: Callable[[], None]):
+        self.deliver = deliver
+        self.resync = resync
+        self._loop = asyncio.get_running_loop()
+        await self._listen()
+
+    def _connect(self):
+        from ..database import engine
+
+        # Detached from the pool: this connection only ever listens
+        pooled = engine.raw_connection()
+        pooled.detach()
+        connection = pooled.driver_connection
+        connection.autocommit = True
+        with connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return connection
+
+    async def _listen(self):
+        self._connection = await asyncio.to_thread(self._connect)
+        self._loop.add_reader(self._connection.fileno(), self._on_readable)
+
+    async def _reconnect(self):
+        while True:
+            await asyncio.sleep(RECONNECT_SECONDS)
+            try:
+                await self._listen()
+            except Exception as e:
+                logger.warning("Invalidation listener reconnect failed: %s", e)
+                continue
+            self.resync()
+            return
+
+    def _on_readable(self):
+        try:
+            self._connection.poll()
+        except Exception as e:
+            logger.warning("Invalidation listener lost its connection: %s", e)
+            self._close()
+            asyncio.ensure_future(self._reconnect())
+            return
+        while self._connection.notifies:
+            self.deliver(self._connection.notifies.pop(0).payload)
+
+    async def publish(self, payload: str):
+        from ..database import engine
+
+        def notify():
+            with engine.connect() as connection:
+                connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                                   {"channel": self.channel, "payload": payload})
+                connection.commit()
+
+        await asyncio.to_thread(notify)
+
+    def _close(self):
+        if self._connection is not None:
+            self._loop.remove_reader(self._connection.fileno())
+            self._connection.close()
+            self._connection = None
+
+    async def stop(self):
+        self._close()
+
+class RedisTransport:
+    """Pub/sub on the shared Redis"""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._task = None
+
+    async def start(self, deliver: Deliver, resync: Callable[[], None]):
+        self.deliver = deliver
+        self.resync = resync
+        pubsub = await self._subscribe()
+        self._task = asyncio.create_task(self._read(pubsub))
+
+    async def _subscribe(self):
+        from .clients import get_redis
+
+        pubsub = get_redis().pubsub()
+        await pubsub.subscribe(self.channel)
+        return pubsub
+
+    async def _read(self, pubsub):
+        while True:
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.deliver(message["data"].decode())
+            except asyncio.CancelledError:
+                await pubsub.close()
+                raise
+            except Exception as e:
+                logger.warning("Invalidation subscriber lost Redis: %s", e)
+            await asyncio.sleep(RECONNECT_SECONDS)
+            try:
+                pubsub = await self._subscribe()
+            except Exception as e:
+                logger.warning("Invalidation subscriber reconnect failed: %s", e)
+                continue
+            self.resync()
+
+    async def publish(self, payload: str):
+        from .clients import get_redis
+
+        await get_redis().publish(self.channel, payload)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+def build_transport():
+    """The transport selected by settings.invalidation_backend"""
+    if settings.invalidation_backend == "postgres":
+        return PostgresTransport(settings.invalidation_channel)
+    if settings.invalidation_backend == "redis":
+        return RedisTransport(settings.invalidation_channel)
+    return LoopbackTransport()
+
+class InvalidationBus:
+    def __init__(self):
+        self.origin = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Tuple[Callable[[Optional[List[int]]], None], bool]]] = defaultdict(list)
+        self._transport = None
+        self._loop = None
+        self._events: Optional[asyncio.Queue] = None
+        self._consumer = None
+        # The loop only keeps weak references to tasks
+        self._sending = set()
+
+    def on(self, entity: str, own: bool = False):
+        """Register a function to run with the changed ids; `own` also runs it for this worker's events"""
+        def register(fn: Callable[[Optional[List[int]]], None]):
+            self._handlers[entity].append((fn, own))
+            return fn
+        return register
+
+    async def start(self, transport=None):
+        self._loop = asyncio.get_running_loop()
+        self._events = asyncio.Queue()
+        self._consumer = asyncio.create_task(self._consume())
+        transport = transport or build_transport()
+        await transport.start(self._receive, self._resync)
+        self._transport = transport
+
+    async def stop(self):
+        transport, self._transport = self._transport, None
+        if transport is not None:
+            await transport.stop()
+        if self._consumer is not None:
+            self._consumer.cancel()
+            await asyncio.gather(self._consumer, return_exceptions=True)
+
+    def publish(self, entity: str, ids: Optional[Sequence[int]] = None):
+        """Tell the other workers that `entity` changed; safe to call from any thread"""
+        if self._transport is None:
+            # Not serving (scripts, migrations); there is nobody to tell
+            return
+        if ids is not None and len(ids) > MAX_IDS:
+            ids = None
+        payload = orjson.dumps({
+            "entity": entity,
+            "ids": list(ids) if ids is not None else None,
+            "origin": self.origin,
+            "sent_at": time.time(),
+        }).decode()
+        cache_invalidations_published.inc(entity=entity)
+        self._loop.call_soon_threadsafe(self._schedule, payload)
+
+    def _schedule(self, payload: str):
+        task = self._loop.create_task(self._send(payload))
+        self._sending.add(task)
+        task.add_done_callback(self._sending.discard)
+
+    async def _send(self, payload: str):
+        try:
+            await self._transport.publish(payload)
+        except Exception as e:
+            logger.warning("Could not publish cache invalidation: %s", e)
+
+    def _receive(self, payload: str):
+        event = orjson.loads(payload)
+        event["own"] = event["origin"] == self.origin
+        if not event["own"] or any(own for _, own in self._handlers.get(event["entity"], ())):
+            self._events.put_nowait(event)
+
+    def _resync(self):
+        """Assume anything may have changed while we were not listening"""
+        for entity in list(self._handlers):
+            self._events.put_nowait({"entity": entity, "ids": None, "origin": None, "sent_at": None, "own": False})
+
+    async def _consume(self):
+        while True:
+            event = await self._events.get()
+            try:
+                await asyncio.to_thread(self._apply, event)
+            except Exception:
+                logger.exception("Cache invalidation handler failed for %s", event["entity"])
+            if event["sent_at"] is not None and not event["own"]:
+                cache_invalidation_propagation.observe(time.time() - event["sent_at"], entity=event["entity"])
+
+    def _apply(self, event: dict):
+        for fn, own in self._handlers.get(event["entity"], ()):
+            if own or not event["own"]:
+                fn(event["ids"])
+
+invalidation_bus = InvalidationBus()
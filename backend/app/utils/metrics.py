@@ -0,0 +1,259 @@
+"""In-process metrics rendered in the Prometheus text exposition format.
+
+Recording is a dict lookup and a few additions under a lock, cheap enough
+to leave on for every request. Each worker process keeps its own
+registry, so scrape every worker (or aggregate per pod) when running more
+than one.
+"""
+import abc
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(label, "")) for label in self.labels)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+    @abc.abstractmethod
+    def _samples(self):
+        """Sample lines for render(), one per label set"""
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{self._format_labels(key)} {value}" for key, value in values]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: [bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the enclosed block, including when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+
+        lines = []
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                labels = self._format_labels(key, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+registry = Registry()
+
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being served"))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template",
+    labels=("method", "route", "status")))
+db_statements_per_request = registry.register(Histogram(
+    "db_statements_per_request", "SQL statements executed while serving a request",
+    labels=("method", "route"), buckets=COUNT_BUCKETS))
+db_time_per_request = registry.register(Histogram(
+    "db_time_per_request_seconds", "Time spent in SQL statements while serving a request",
+    labels=("method", "route")))
+stripe_request_duration = registry.register(Histogram(
+    "stripe_request_duration_seconds", "Stripe API call latency",
+    labels=("operation", "outcome")))
+openai_request_duration = registry.register(Histogram(
+    "openai_request_duration_seconds", "OpenAI API call latency",
+    labels=("model", "outcome")))
+openai_tokens = registry.register(Counter(
+    "openai_tokens_total", "Tokens consumed by OpenAI calls",
+    labels=("model", "type")))
+cache_invalidations_published = registry.register(Counter(
+    "cache_invalidations_published_total", "Cache invalidation events sent to other workers",
+    labels=("entity",)))
+cache_invalidation_propagation = registry.register(Histogram(
+    "cache_invalidation_propagation_seconds", "Time from publishing an invalidation to another worker applying it",
+    labels=("entity",)))
+db_replica_lag = registry.register(Gauge(
+    "db_replica_lag_seconds", "Replication lag of the read replica at the last check (-1 when unreachable)"))
+checkout_in_progress = registry.register(Gauge(
+    "checkout_in_progress", "Checkouts admitted past the admission gate and still running"))
+checkout_admissions = registry.register(Counter(
+    "checkout_admissions_total", "Checkout attempts by admission outcome",
+    labels=("outcome",)))
+push_connections = registry.register(Gauge(
+    "push_connections", "Open live-update WebSocket connections"))
+push_messages = registry.register(Counter(
+    "push_messages_total", "Live updates queued for connected clients",
+    labels=("type",)))
+push_overflows = registry.register(Counter(
+    "push_overflows_total", "Connections closed because the client fell too far behind"))
+rate_limit_decisions = registry.register(Counter(
+    "rate_limit_decisions_total", "Rate limit decisions by route class and outcome",
+    labels=("route_class", "outcome")))
+
+class _SqlTally:
+    __slots__ = ("statements", "seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+
+# Set per request by MetricsMiddleware; shared by reference with threadpool copies of the context
+_sql_tally: ContextVar[Optional[_SqlTally]] = ContextVar("sql_tally", default=None)
+
+def instrument_engine(engine):
+    """Attribute SQL statement counts and time to the request that issued them"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        tally = _sql_tally.get()
+        if tally is not None:
+            tally.statements += 1
+            tally.seconds += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        starts = exception_context.connection.info.get("query_start") if exception_context.connection else None
+        if starts:
+            starts.pop()
+
+@contextmanager
+def track_stripe(operation: str):
+    """Time a Stripe API call, labelled by whether it raised"""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        stripe_request_duration.observe(time.perf_counter() - start, operation=operation, outcome=outcome)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, in-flight count and SQL usage per route"""
+
+    def __init__(self, app, skip_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.skip_paths = frozenset(skip_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip_paths:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        tally = _SqlTally()
+        token = _sql_tally.set(tally)
+        http_requests_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_requests_in_flight.dec()
+            _sql_tally.reset(token)
+
+            # Label by route template, never the raw path, to keep cardinality bounded
+            route = scope.get("route")
+            route_label = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_request_duration.observe(elapsed, method=method, route=route_label, status=status_code)
+            db_statements_per_request.observe(tally.statements, method=method, route=route_label)
+            db_time_per_request.observe(tally.seconds, method=method, route=route_label)
@@ -0,0 +1,63 @@
+"""Fan order status changes out to the in-memory indexes built from sales and
+to live-update clients, and stage them in the outbox for side effects that
+must survive a crash."""
+import logging
+from typing import Optional
+from sqlalchemy.orm import Session
+from ..models.order import Order, OrderItem, OrderStatus
+from . import outbox
+from .invalidation import invalidation_bus
+from .popularity import COUNTED_STATUSES, popularity
+from .recommender import recommender
+
+logger = logging.getLogger(__name__)
+
+def order_status_changed(order: Order, previous_status: Optional[OrderStatus] = None):
+    """Count an order's items when it becomes a sale, and uncount them when it stops being one"""
+    # The owner's open order pages hear about every change, not just sales
+    invalidation_bus.publish("order", [order.id])
+
+    was_counted = previous_status in COUNTED_STATUSES
+    is_counted = order.status in COUNTED_STATUSES
+
+    if was_counted == is_counted:
+        return
+
+    sign = 1 if is_counted else -1
+    items = [(item.product_id, item.quantity) for item in order.order_items]
+
+    popularity.record([(product_id, sign * quantity) for product_id, quantity in items], order.created_at)
+    recommender.record(order.id, [product_id for product_id, _ in items], sign)
+
+def stage_order_event(db: Session, order: Order, previous_status: Optional[OrderStatus] = None):
+    """Enqueue order.created or order.status_changed; call before the order's commit"""
+    payload = {
+        "order_id": order.id,
+        "user_id": order.user_id,
+        "status": order.status.value,
+    }
+
+    if previous_status is None:
+        payload["total_amount"] = order.total_amount
+        # Read back from the database: the relationship is still empty on a new
+        # order, and sessions here do not autoflush
+        db.flush()
+        items = db.query(OrderItem).filter(OrderItem.order_id == order.id).all()
+        payload["items"] = [
+            {"product_id": item.product_id, "quantity": item.quantity, "price": item.price}
+            for item in items
+        ]
+        outbox.enqueue(db, "order.created", payload)
+    else:
+        payload["previous_status"] = previous_status.value
+        outbox.enqueue(db, "order.status_changed", payload)
+
+@outbox.handler("order.created")
+def _log_order_created(payload: dict):
+    logger.info("Order %s placed by user %s for %.2f (%d items)", payload["order_id"],
+                payload["user_id"], payload["total_amount"], len(payload["items"]))
+
+@outbox.handler("order.status_changed")
+def _log_order_status_changed(payload: dict):
+    logger.info("Order %s moved from %s to %s", payload["order_id"],
+                payload["previous_status"], payload["status"])
@@ -0,0 +1,117 @@
+"""Transactional outbox for side effects of order writes.
+
+Request handlers stage events with `enqueue()` in the same session as the
+order change. An event is committed or rolled back together with that
+change. A worker later drains committed events and passes them to the
+handlers registered with `@handler(event_type)`. A failed event is retried
+with exponential backoff until `outbox_max_attempts`.
+
+Delivery is at least once. A crash between a handler running and its row
+being marked processed replays the event, so handlers must be idempotent.
+
+The worker runs inside the API process by default. To run it as a
+separate process, set OUTBOX_WORKER_ENABLED=false on the API and start
+(from backend/):
+    python -m app.outbox_worker
+"""
+import logging
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models.outbox import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+MAX_BACKOFF_SECONDS = 3600
+
+_handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+
+def handler(event_type: str):
+    """Register a function to receive every payload of `event_type`"""
+    def register(fn: Callable[[dict], None]):
+        _handlers[event_type].append(fn)
+        return fn
+    return register
+
+def enqueue(db: Session, event_type: str, payload: dict) -> OutboxEvent:
+    """Stage an event; it is only delivered if the caller's transaction commits"""
+    event = OutboxEvent(
+        event_type=event_type,
+        payload=payload,
+        attempts=0,
+        available_at=datetime.now(timezone.utc)
+    )
+    db.add(event)
+    return event
+
+def drain(db: Session, batch_size: int = None) -> int:
+    """Deliver one batch of due events; returns how many were attempted"""
+    now = datetime.now(timezone.utc)
+    events = db.query(OutboxEvent).filter(
+        OutboxEvent.processed_at.is_(None),
+        OutboxEvent.available_at <= now,
+        OutboxEvent.attempts < settings.outbox_max_attempts
+    ).order_by(OutboxEvent.id).limit(
+        batch_size or settings.outbox_batch_size
+    ).with_for_update(skip_locked=True).all()
+
+    for event in events:
+        try:
+            for fn in _handlers.get(event.event_type, ()):
+                fn(event.payload)
+        except Exception as e:
+            event.attempts += 1
+            event.last_error = f"{type(e).__name__}: {e}"
+            event.available_at = now + timedelta(seconds=min(2 ** event.attempts, MAX_BACKOFF_SECONDS))
+            if event.attempts >= settings.outbox_max_attempts:
+                logger.error("Outbox event %s (%s) gave up after %d attempts: %s",
+                             event.id, event.event_type, event.attempts, event.last_error)
+        else:
+            event.processed_at = now
+
+    # Row locks are held until here, so concurrent workers never claim the same events
+    db.commit()
+    return len(events)
+
+def drain_all(db: Session) -> int:
+    """Drain until no due events remain"""
+    total = 0
+    while True:
+        attempted = drain(db)
+        total += attempted
+        if attempted < settings.outbox_batch_size:
+            return total
+
+def purge_processed(db: Session) -> int:
+    """Delete delivered events older than the retention window"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=settings.outbox_retention_days)
+    deleted = db.query(OutboxEvent).filter(
+        OutboxEvent.processed_at.is_not(None),
+        OutboxEvent.processed_at < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return deleted
+
+def run_worker():
+    """Poll and drain forever with the handlers registered so far; see app.outbox_worker"""
+    from ..database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    logger.info("Outbox worker polling every %ss", settings.outbox_poll_seconds)
+    last_purge = 0.0
+    while True:
+        db = SessionLocal()
+        try:
+            drain_all(db)
+            if time.monotonic() - last_purge > 3600:
+                purge_processed(db)
+                last_purge = time.monotonic()
+        except Exception:
+            db.rollback()
+            logger.exception("Outbox drain failed")
+        finally:
+            db.close()
+        time.sleep(settings.outbox_poll_seconds)
@@ -0,0 +1,99 @@
+"""Time-decayed product popularity from sales.
+
+Each unit sold contributes 2 ** ((sold_at - epoch) / half_life) to its
+product's score. Every score decays at the same rate, so ranking by the
+stored value equals ranking by the decayed value at any later moment.
+That makes an increment O(1), with no need to touch older scores. A
+periodic rebuild from order_items moves the epoch forward and drops
+sales that have left the window.
+"""
+import math
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models.order import Order, OrderItem, OrderStatus
+
+# Orders whose items count as sales
+COUNTED_STATUSES = {OrderStatus.CONFIRMED, OrderStatus.PROCESSING, OrderStatus.SHIPPED, OrderStatus.DELIVERED}
+
+def _timestamp(value) -> float:
+    """Seconds since the Unix epoch for datetimes, dates or SQLite date strings"""
+    if value is None:
+        return time.time()
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+class PopularityRanker:
+    def __init__(self, top_k: int, half_life_hours: float):
+        self.top_k = top_k
+        self.half_life = half_life_hours * 3600
+        self._epoch = time.time()
+        self._scores: Dict[int, float] = {}
+        self._top: List[Tuple[int, float]] = []
+        self._lock = threading.Lock()
+
+    def _weight(self, sold_at: float) -> float:
+        return math.pow(2.0, (sold_at - self._epoch) / self.half_life)
+
+    def rebuild(self, db: Session):
+        """Recompute all scores from the recent sales window"""
+        since = datetime.now(timezone.utc) - timedelta(days=settings.popularity_window_days)
+        day = func.date(Order.created_at)
+
+        # Pre-aggregated per product per day; midday is close enough for decay
+        rows = db.query(
+            OrderItem.product_id, day, func.sum(OrderItem.quantity)
+        ).join(Order, Order.id == OrderItem.order_id).filter(
+            Order.created_at >= since,
+            Order.status.in_(COUNTED_STATUSES)
+        ).group_by(OrderItem.product_id, day).all()
+
+        epoch = time.time()
+        scores: Dict[int, float] = {}
+        for product_id, sold_on, quantity in rows:
+            sold_at = _timestamp(sold_on) + 12 * 3600
+            weight = math.pow(2.0, (sold_at - epoch) / self.half_life)
+            scores[product_id] = scores.get(product_id, 0.0) + quantity * weight
+
+        with self._lock:
+            self._epoch = epoch
+            self._scores = scores
+            self._top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self.top_k]
+
+    def record(self, items: Iterable[Tuple[int, int]], sold_at: Optional[datetime] = None):
+        """Apply (product_id, quantity) sales; negative quantities undo a cancelled order"""
+        with self._lock:
+            weight = self._weight(_timestamp(sold_at))
+            top = dict(self._top)
+            floor = self._top[-1][1] if len(self._top) >= self.top_k else float("-inf")
+            changed = False
+
+            for product_id, quantity in items:
+                score = self._scores.get(product_id, 0.0) + quantity * weight
+                self._scores[product_id] = score
+                if product_id in top or score > floor:
+                    top[product_id] = score
+                    changed = True
+
+            if changed:
+                ranked = sorted(top.items(), key=lambda item: item[1], reverse=True)
+                # A demoted entry may leave room for a product outside the cached top-K;
+                # the next rebuild restores exact ordering below the floor
+                self._top = [(pid, score) for pid, score in ranked if score > 0][:self.top_k]
+
+    def top(self, limit: int) -> List[int]:
+        return [product_id for product_id, _ in self._top[:limit]]
+
+popularity = PopularityRanker(
+    top_k=settings.popularity_top_k,
+    half_life_hours=settings.popularity_half_life_hours
+)
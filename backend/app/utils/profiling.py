@@ -0,0 +1,186 @@
+"""Opt-in per-request profiling for admins.
+
+A request carrying an `X-Profile: 1` header or a `?profile=1` query flag
+from an admin is sampled while it runs. The event loop thread's stack is
+captured every `profile_sample_interval` seconds and folded into the
+collapsed-stack format read by flamegraph.pl, speedscope and inferno.
+Every SQL statement it issues is recorded alongside. Requests without the
+flag take a single header lookup and nothing else.
+
+Artifacts are kept for `profile_max_age_hours` and at most
+`profile_max_files` profiles; older ones are swept whenever a new profile
+is stored.
+
+Samples cover the whole event loop thread. Other requests interleaved with
+the profiled one appear in the flamegraph too, so profile on a quiet
+worker when the numbers matter.
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+import orjson
+from sqlalchemy import event
+from ..config import settings
+from ..database import SessionLocal
+from ..models.user import User
+from .security import bearer_subject
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_FLAG = b"profile=1"
+
+class _StackSampler(threading.Thread):
+    """Sample one thread's Python stack at a fixed interval into folded stacks"""
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True, name="request-profiler")
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            self.stacks[";".join(reversed(names))] += 1
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+# Statements recorded for the profiled request, None everywhere else
+_statements: ContextVar[Optional[List[dict]]] = ContextVar("profiled_statements", default=None)
+
+def record_profiled_statements(engine):
+    """Record statements issued by a profiled request"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if _statements.get() is not None:
+            conn.info["profile_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements is not None:
+            statements.append({
+                "statement": statement,
+                "duration_ms": round((time.perf_counter() - conn.info.pop("profile_start")) * 1000, 3),
+            })
+
+def _is_admin(headers: dict) -> bool:
+    """The same checks as get_current_admin_user; blocks on the database, so run it in a thread"""
+    email = bearer_subject(headers)
+    if email is None:
+        return False
+
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter(User.email == email).first()
+        return bool(user and user.is_active and user.is_admin)
+    finally:
+        db.close()
+
+def _requested(scope) -> bool:
+    if PROFILE_QUERY_FLAG in scope["query_string"].split(b"&"):
+        return True
+    return any(name == PROFILE_HEADER and value == b"1" for name, value in scope["headers"])
+
+def _sweep_artifacts():
+    """Delete profiles past profile_max_age_hours, then all but the newest profile_max_files"""
+    profiles = {}
+    with os.scandir(settings.profile_dir) as entries:
+        for entry in entries:
+            profile_id, suffix = os.path.splitext(entry.name)
+            if suffix in (".json", ".folded") and entry.is_file():
+                paths, mtime = profiles.get(profile_id, ([], 0.0))
+                profiles[profile_id] = (paths + [entry.path], max(mtime, entry.stat().st_mtime))
+
+    cutoff = time.time() - settings.profile_max_age_hours * 3600
+    newest_first = sorted(profiles.values(), key=lambda profile: profile[1], reverse=True)
+    for rank, (paths, mtime) in enumerate(newest_first):
+        if rank >= settings.profile_max_files or mtime < cutoff:
+            for path in paths:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+def _write_artifacts(profile_id: str, sampler: _StackSampler, summary: dict):
+    os.makedirs(settings.profile_dir, exist_ok=True)
+    base = os.path.join(settings.profile_dir, profile_id)
+    with open(base + ".folded", "w") as f:
+        f.write(sampler.folded())
+    with open(base + ".json", "wb") as f:
+        f.write(orjson.dumps(summary, option=orjson.OPT_INDENT_2))
+    _sweep_artifacts()
+
+class ProfilingMiddleware:
+    """Profile flagged admin requests and store a flamegraph plus their SQL"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or not _requested(scope)
+                or not await asyncio.to_thread(_is_admin, dict(scope["headers"]))):
+            await self.app(scope, receive, send)
+            return
+
+        profile_id = f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode())
+                ]
+            await send(message)
+
+        statements: List[dict] = []
+        token = _statements.set(statements)
+        sampler = _StackSampler(threading.get_ident(), settings.profile_sample_interval)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            sampler.stop()
+            _statements.reset(token)
+
+            route = scope.get("route")
+            summary = {
+                "id": profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": getattr(route, "path", None),
+                "duration_ms": round(elapsed * 1000, 3),
+                "samples": sum(sampler.stacks.values()),
+                "sample_interval_ms": settings.profile_sample_interval * 1000,
+                "sql_count": len(statements),
+                "sql_ms": round(sum(s["duration_ms"] for s in statements), 3),
+                "statements": statements,
+            }
+            try:
+                await asyncio.to_thread(_write_artifacts, profile_id, sampler, summary)
+            except OSError:
+                logger.exception("Could not store profile %s", profile_id)
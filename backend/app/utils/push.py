@@ -0,0 +1,185 @@
+"""Live order and stock updates for connected clients.
+
+Each worker tracks the WebSocket connections it accepted in a `PushHub`,
+indexed by topic. "user:<id>" carries a shopper's order updates, and
+"product:<id>" carries the stock level of a product the client watches
+(typically the products in its cart). A message is serialized once and
+queued on every subscriber of its topic. An idle connection costs one
+small bounded queue and two parked coroutines. A client that falls
+`push_queue_size` messages behind is disconnected; it reconnects and
+refetches.
+
+Updates are driven by the invalidation bus, so a write in any worker
+reaches clients connected to every worker:
+
+- "order" events push the order's new status and tracking number to its owner.
+- "stock", "hold" and "product" events push a watched product's level
+  when it moves between in_stock, low (at most `low_stock_threshold` available)
+  and out_of_stock.
+"""
+import asyncio
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+import orjson
+from ..config import settings
+from ..database import SessionLocal
+from ..models.order import Order
+from ..models.product import Product
+from .invalidation import invalidation_bus
+from .metrics import push_connections, push_messages, push_overflows
+
+class Subscriber:
+    __slots__ = ("user_id", "queue", "topics", "closed", "overflowed")
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(settings.push_queue_size)
+        self.topics: Set[str] = set()
+        self.closed = False
+        self.overflowed = False
+
+    def close(self):
+        """Wake the writer so it can finish; a full queue wakes it anyway"""
+        self.closed = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass
+
+def stock_level(available: int) -> str:
+    if available <= 0:
+        return "out_of_stock"
+    if available <= settings.low_stock_threshold:
+        return "low"
+    return "in_stock"
+
+class PushHub:
+    """Topic fan-out for this worker's connections; subscriptions change on the event loop only"""
+
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscriber]] = defaultdict(set)
+        # Last level pushed per watched product, so only transitions are sent
+        self._levels: Dict[int, str] = {}
+        self._loop = None
+        self.connections = 0
+
+    def connect(self, user_id: int) -> Subscriber:
+        self._loop = asyncio.get_running_loop()
+        subscriber = Subscriber(user_id)
+        self.subscribe(subscriber, f"user:{user_id}")
+        self.connections += 1
+        push_connections.inc()
+        return subscriber
+
+    def disconnect(self, subscriber: Subscriber):
+        for topic in list(subscriber.topics):
+            self.unsubscribe(subscriber, topic)
+        self.connections -= 1
+        push_connections.dec()
+
+    def subscribe(self, subscriber: Subscriber, topic: str):
+        self._topics[topic].add(subscriber)
+        subscriber.topics.add(topic)
+
+    def unsubscribe(self, subscriber: Subscriber, topic: str):
+        subscriber.topics.discard(topic)
+        subscribers = self._topics.get(topic)
+        if subscribers is None:
+            return
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._topics[topic]
+            if topic.startswith("product:"):
+                self._levels.pop(int(topic[len("product:"):]), None)
+
+    def watch_products(self, subscriber: Subscriber, product_ids: List[int]):
+        """Replace the set of products whose stock level `subscriber` receives"""
+        wanted = {f"product:{product_id}" for product_id in product_ids}
+        for topic in [topic for topic in subscriber.topics if topic.startswith("product:")]:
+            if topic not in wanted:
+                self.unsubscribe(subscriber, topic)
+        for topic in wanted:
+            self.subscribe(subscriber, topic)
+
+    def has(self, topic: str) -> bool:
+        return topic in self._topics
+
+    def watched_products(self) -> List[int]:
+        return [int(topic[len("product:"):]) for topic in list(self._topics) if topic.startswith("product:")]
+
+    def level_changed(self, product_id: int, level: str) -> bool:
+        """Record `level`; True when watchers should hear about it"""
+        previous = self._levels.get(product_id, "in_stock")
+        self._levels[product_id] = level
+        return level != previous
+
+    def publish(self, topic: str, message: dict):
+        """Queue `message` for every subscriber of `topic`; safe to call from any thread"""
+        if self._loop is None or topic not in self._topics:
+            return
+        self._loop.call_soon_threadsafe(self._fanout, topic, orjson.dumps(message).decode(), message["type"])
+
+    def _fanout(self, topic: str, data: str, kind: str):
+        for subscriber in list(self._topics.get(topic, ())):
+            try:
+                subscriber.queue.put_nowait(data)
+            except asyncio.QueueFull:
+                # The writer is awake with a full queue; it sees the flag and hangs up
+                if not subscriber.overflowed:
+                    subscriber.overflowed = True
+                    push_overflows.inc()
+                for subscribed in list(subscriber.topics):
+                    self.unsubscribe(subscriber, subscribed)
+            else:
+                push_messages.inc(type=kind)
+
+push_hub = PushHub()
+
+@invalidation_bus.on("order", own=True)
+def _push_order_updates(order_ids: Optional[List[int]]):
+    """Send changed orders to their owners' connections"""
+    # A resync cannot say which orders changed; clients refetch on reconnect instead
+    if order_ids is None or not push_hub.connections:
+        return
+    db = SessionLocal()
+    try:
+        orders = db.query(
+            Order.id, Order.user_id, Order.status, Order.tracking_number, Order.updated_at
+        ).filter(Order.id.in_(order_ids)).all()
+    finally:
+        db.close()
+    for order in orders:
+        push_hub.publish(f"user:{order.user_id}", {
+            "type": "order",
+            "order_id": order.id,
+            "status": order.status.value,
+            "tracking_number": order.tracking_number,
+            "updated_at": order.updated_at.isoformat() if order.updated_at else None,
+        })
+
+# Product edits can set stock_quantity too
+@invalidation_bus.on("product", own=True)
+@invalidation_bus.on("stock", own=True)
+@invalidation_bus.on("hold", own=True)
+def _push_stock_levels(product_ids: Optional[List[int]]):
+    """Send watched products whose stock level crossed a threshold"""
+    if product_ids is None:
+        watched = push_hub.watched_products()
+    else:
+        watched = [product_id for product_id in product_ids if push_hub.has(f"product:{product_id}")]
+    if not watched:
+        return
+    db = SessionLocal()
+    try:
+        rows = db.query(Product.id, Product.stock_quantity, Product.reserved_quantity).filter(
+            Product.id.in_(watched)
+        ).all()
+    finally:
+        db.close()
+    for row in rows:
+        available = (row.stock_quantity or 0) - (row.reserved_quantity or 0)
+        level = stock_level(available)
+        if push_hub.level_changed(row.id, level):
+            push_hub.publish(f"product:{row.id}", {
+                "type": "stock", "product_id": row.id, "available": max(available, 0), "level": level,
+            })
@@ -0,0 +1,207 @@
+"""Per-caller request rate limits by route class.
+
+Every request belongs to a route class with its own limit in Settings,
+written as "<count>/<second|minute|hour>":
+
+- auth: POST /auth/login and /auth/register (bcrypt), per client address
+- ai: the agent endpoints that call the LLM
+- search: GET /products/ with a search term (text scans)
+- default: everything else
+
+Callers are identified by their token subject, or by client address when
+there is no valid token. The auth class always goes by client address, so
+a token does not buy more login attempts. Behind a proxy, run uvicorn with --proxy-headers
+so the client address is the real one. Each (class, caller) pair has a
+token bucket. The bucket is stored as a GCRA theoretical arrival time, a
+single float per caller. This makes it a sliding window, with no bursts at
+window boundaries. Responses carry RateLimit-Limit, RateLimit-Remaining,
+RateLimit-Reset and RateLimit-Policy, and a rejected request gets a 429
+with Retry-After.
+
+The default backend keeps buckets in this process, so each worker counts
+on its own. With RATE_LIMIT_BACKEND=redis, the buckets are shared through
+REDIS_URL, and each worker falls back to its own buckets while Redis is
+unreachable.
+"""
+import logging
+import math
+import re
+import time
+from typing import Dict, NamedTuple, Optional
+import orjson
+from ..config import settings
+from .clients import get_redis
+from .metrics import rate_limit_decisions
+from .security import bearer_subject
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 3600}
+EXEMPT_PATHS = frozenset(("/health", "/metrics"))
+SWEEP_SECONDS = 60.0
+
+# Checked in order; anything unmatched is "default"
+RATE_LIMITED_ROUTES = (
+    ("auth", "POST", re.compile(r"^/auth/(login|register)$")),
+    ("ai", "POST", re.compile(r"^/agents/(chat|product-inquiry/\d+)$")),
+    ("ai", "GET", re.compile(r"^/agents/order-status/\d+$")),
+)
+# Route classes counted per client address even for callers with a token
+ADDRESS_CLASSES = frozenset(("auth",))
+SEARCH_PATH = re.compile(r"^/products/?$")
+SEARCH_PARAM = re.compile(rb"(^|&)search=[^&]")
+
+class Limit(NamedTuple):
+    count: int
+    period: float
+
+class Decision(NamedTuple):
+    allowed: bool
+    remaining: int
+    # Seconds until the bucket is full again
+    reset: float
+    retry_after: float = 0.0
+
+def parse_limit(value: str) -> Limit:
+    """"10/minute" -> Limit(10, 60)"""
+    count, _, unit = value.partition("/")
+    return Limit(int(count), PERIODS[unit.strip()])
+
+def route_class(scope) -> str:
+    method, path = scope["method"], scope["path"]
+    for name, route_method, pattern in RATE_LIMITED_ROUTES:
+        if method == route_method and pattern.match(path):
+            return name
+    if method == "GET" and SEARCH_PATH.match(path) and SEARCH_PARAM.search(scope["query_string"]):
+        return "search"
+    return "default"
+
+def caller(scope, headers: dict, route: str = "default") -> str:
+    subject = bearer_subject(headers) if route not in ADDRESS_CLASSES else None
+    if subject:
+        return f"user:{subject}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else ''}"
+
+def _gcra(tat: Optional[float], now: float, limit: Limit):
+    """(allowed, new arrival time, decision) for one request against a bucket"""
+    interval = limit.period / limit.count
+    tat = now if tat is None or tat < now else tat
+    new_tat = tat + interval
+    if new_tat - now > limit.period:
+        return False, tat, Decision(False, 0, tat - now, new_tat - limit.period - now)
+    return True, new_tat, Decision(True, int((limit.period - (new_tat - now)) / interval), new_tat - now)
+
+class LocalRateLimiter:
+    """Buckets for this process; every call runs on the event loop"""
+
+    def __init__(self):
+        # key -> theoretical arrival time; a key in the past is a full bucket
+        self.arrivals: Dict[str, float] = {}
+        self._next_sweep = 0.0
+
+    async def hit(self, key: str, limit: Limit) -> Decision:
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self.arrivals = {k: tat for k, tat in self.arrivals.items() if tat > now}
+            self._next_sweep = now + SWEEP_SECONDS
+        allowed, tat, decision = _gcra(self.arrivals.get(key), now, limit)
+        if allowed:
+            self.arrivals[key] = tat
+        return decision
+
+# KEYS: the bucket; ARGV: now, period, count
+# Floats go back as strings, since Redis truncates Lua numbers to integers
+_HIT_SCRIPT = """
+local now, period, count = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local interval = period / count
+local tat = tonumber(redis.call('GET', KEYS[1])) or now
+if tat < now then tat = now end
+local new_tat = tat + interval
+if new_tat - now > period then
+    return {0, 0, tostring(tat - now), tostring(new_tat - period - now)}
+end
+redis.call('SET', KEYS[1], tostring(new_tat), 'PX', math.ceil((new_tat - now) * 1000))
+return {1, math.floor((period - (new_tat - now)) / interval), tostring(new_tat - now), '0'}
+"""
+
+class RedisRateLimiter:
+    """Buckets shared by every worker through Redis"""
+
+    PREFIX = "ratelimit:"
+
+    def __init__(self):
+        self.fallback = LocalRateLimiter()
+        self._script = None
+
+    async def hit(self, key: str, limit: Limit) -> Decision:
+        try:
+            if self._script is None:
+                self._script = get_redis().register_script(_HIT_SCRIPT)
+            allowed, remaining, reset, retry_after = await self._script(
+                keys=[self.PREFIX + key], args=[time.time(), limit.period, limit.count]
+            )
+        except Exception as e:
+            logger.warning("Rate limit store unavailable, using local buckets: %s", e)
+            return await self.fallback.hit(key, limit)
+        return Decision(bool(allowed), int(remaining), float(reset), float(retry_after))
+
+def build_limiter():
+    """The limiter selected by settings.rate_limit_backend"""
+    if settings.rate_limit_backend == "redis":
+        return RedisRateLimiter()
+    return LocalRateLimiter()
+
+class RateLimitMiddleware:
+    """Reject callers that exceed their route class's rate with 429"""
+
+    def __init__(self, app, limiter=None):
+        self.app = app
+        self.limiter = limiter or build_limiter()
+        self.limits = {
+            name: parse_limit(getattr(settings, f"rate_limit_{name}"))
+            for name in ("auth", "ai", "search", "default")
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.rate_limit_enabled or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        name = route_class(scope)
+        limit = self.limits[name]
+        decision = await self.limiter.hit(f"{name}:{caller(scope, dict(scope['headers']), name)}", limit)
+        headers = [
+            (b"ratelimit-limit", str(limit.count).encode()),
+            (b"ratelimit-remaining", str(decision.remaining).encode()),
+            (b"ratelimit-reset", str(math.ceil(decision.reset)).encode()),
+            (b"ratelimit-policy", f"{limit.count};w={limit.period:g}".encode()),
+        ]
+
+        if not decision.allowed:
+            rate_limit_decisions.inc(route_class=name, outcome="rejected")
+            await self._rejected(send, headers, max(1, math.ceil(decision.retry_after)))
+            return
+
+        rate_limit_decisions.inc(route_class=name, outcome="allowed")
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), *headers]
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    async def _rejected(self, send, headers: list, retry_after: int):
+        body = orjson.dumps({"detail": "Too many requests; slow down and retry later"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+                *headers,
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
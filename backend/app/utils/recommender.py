@@ -0,0 +1,176 @@
+"""Co-purchase ("customers also bought") recommendations.
+
+The offline build turns order_items into a sparse order x product basket
+matrix B. It computes the product co-occurrence matrix C = B.T @ B with
+SciPy and keeps the top-N neighbours of every product in dense int32 and
+float32 arrays. A lookup is then a binary search plus one row slice.
+Orders confirmed after the build are folded into a small pair-count
+delta, which is merged in at lookup time until the next rebuild. A rebuild
+cannot tell which of the orders recorded while it ran its query already
+saw, so it remembers those orders, and when it swaps in the new index it
+rebuilds the delta from them: each counts for the difference between its
+state now and its state in the query.
+
+NumPy and SciPy are imported on first build so they don't weigh on
+worker start-up.
+"""
+import threading
+from array import array
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from itertools import permutations
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+from ..config import settings
+from ..models.order import Order, OrderItem
+from ..models.product import Product
+
+class CoPurchaseRecommender:
+    def __init__(self, top_n: int):
+        self.top_n = top_n
+        # (product_keys, neighbours, scores): neighbours hold column positions into product_keys
+        self._index = None
+        self._names: Dict[int, str] = {}
+        self._delta: Dict[int, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        # order id -> (basket, counted) for orders recorded since the last rebuild began
+        self._recorded: Dict[int, Tuple[Tuple[int, ...], bool]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, order_ids, product_ids, names: Optional[Dict[int, str]] = None):
+        """Build the neighbour index from parallel arrays of order ids and product ids"""
+        index = self._build_index(order_ids, product_ids)
+        with self._lock:
+            self._index = index
+            if names is not None or index is None:
+                self._names = names or {}
+
+    def _build_index(self, order_ids, product_ids):
+        """(product_keys, neighbours, scores), or None without any order lines"""
+        import numpy as np
+        from scipy import sparse
+
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+
+        if len(product_ids) == 0:
+            return None
+
+        product_keys, columns = np.unique(product_ids, return_inverse=True)
+        _, rows = np.unique(order_ids, return_inverse=True)
+
+        basket = sparse.csr_matrix(
+            (np.ones(len(columns), dtype=np.int32), (rows, columns)),
+            shape=(int(rows.max()) + 1, len(product_keys))
+        )
+        # A product listed twice in one order still counts once
+        basket.data[:] = 1
+
+        co = (basket.T @ basket).tocsr()
+        co.setdiag(0)
+        co.eliminate_zeros()
+
+        neighbours, scores = self._top_n(co, len(product_keys))
+        return product_keys, neighbours, scores
+
+    def _top_n(self, co, size: int):
+        import numpy as np
+
+        top_n = self.top_n
+        neighbours = np.full((size, top_n), -1, dtype=np.int32)
+        scores = np.zeros((size, top_n), dtype=np.float32)
+        indptr, indices, data = co.indptr, co.indices, co.data
+
+        for row in np.flatnonzero(np.diff(indptr)):
+            start, end = indptr[row], indptr[row + 1]
+            row_data = data[start:end]
+            k = min(top_n, end - start)
+
+            best = np.argpartition(-row_data, k - 1)[:k] if end - start > k else np.arange(end - start)
+            best = best[np.argsort(-row_data[best], kind="stable")]
+
+            neighbours[row, :k] = indices[start:end][best]
+            scores[row, :k] = row_data[best]
+
+        return neighbours, scores
+
+    def rebuild(self, db: Session):
+        """Rebuild from the order lines of counted orders in the recommender window"""
+        from .popularity import COUNTED_STATUSES
+
+        import numpy as np
+
+        # Orders recorded from here on may or may not be in the query below
+        with self._lock:
+            self._recorded = {}
+
+        since = datetime.now(timezone.utc) - timedelta(days=settings.recommender_window_days)
+        order_ids = array("q")
+        product_ids = array("q")
+
+        lines = db.query(OrderItem.order_id, OrderItem.product_id).join(
+            Order, Order.id == OrderItem.order_id
+        ).filter(
+            Order.created_at >= since,
+            Order.status.in_(COUNTED_STATUSES)
+        ).yield_per(100_000)
+
+        for order_id, product_id in lines:
+            order_ids.append(order_id)
+            product_ids.append(product_id)
+
+        names = dict(db.query(Product.id, Product.name).filter(Product.is_active == True).all())
+        index = self._build_index(order_ids, product_ids)
+        queried = np.unique(np.asarray(order_ids, dtype=np.int64))
+
+        with self._lock:
+            recorded = list(self._recorded.items())
+            ids = np.fromiter((order_id for order_id, _ in recorded), dtype=np.int64, count=len(recorded))
+            in_query = np.isin(ids, queried).tolist()
+
+            delta = defaultdict(lambda: defaultdict(int))
+            for (_, (basket, counted)), seen in zip(recorded, in_query):
+                sign = int(counted) - int(seen)
+                for a, b in permutations(basket, 2):
+                    delta[a][b] += sign
+
+            self._index = index
+            self._names = names
+            self._delta = delta
+
+    def record(self, order_id: int, product_ids: List[int], sign: int = 1):
+        """Fold one order's basket into the delta; sign=-1 takes a cancelled order back out"""
+        basket = tuple(set(product_ids))
+        with self._lock:
+            self._recorded[order_id] = (basket, sign > 0)
+            for a, b in permutations(basket, 2):
+                self._delta[a][b] += sign
+
+    def related(self, product_id: int, limit: int = 5) -> List[Tuple[int, float]]:
+        """(product_id, co-purchase count) pairs, strongest first"""
+        combined: Dict[int, float] = {}
+        index = self._index
+
+        if index is not None:
+            product_keys, neighbours, scores = index
+            row = int(product_keys.searchsorted(product_id))
+            if row < len(product_keys) and product_keys[row] == product_id:
+                valid = neighbours[row] >= 0
+                for other, score in zip(product_keys[neighbours[row][valid]].tolist(),
+                                        scores[row][valid].tolist()):
+                    combined[other] = score
+
+        delta = self._delta.get(product_id)
+        if delta:
+            for other, count in list(delta.items()):
+                combined[other] = combined.get(other, 0.0) + count
+
+        ranked = sorted(
+            ((other, score) for other, score in combined.items() if score > 0),
+            key=lambda item: item[1], reverse=True
+        )
+        return ranked[:limit]
+
+    def related_names(self, product_id: int, limit: int = 5) -> List[str]:
+        return [self._names[other] for other, _ in self.related(product_id, limit * 2) if other in self._names][:limit]
+
+recommender = CoPurchaseRecommender(top_n=settings.recommender_top_n)
@@ -0,0 +1,163 @@
+"""Read-replica health checks and read-your-writes stickiness.
+
+Read-only endpoints take their session from `get_read_db`, which uses the
+replica configured in READ_REPLICA_URL. Two things send a read back to the
+primary:
+
+- The replica is unreachable or more than `replica_max_lag_seconds`
+  behind. `check_replica_lag` runs every `replica_lag_check_seconds` and
+  flips `database.replica_ok`.
+- The caller made a successful write less than `replica_sticky_seconds`
+  ago, so the replica may not have it yet. ReadYourWritesMiddleware
+  remembers writers per worker, keyed by token subject or client address.
+  It also sets a short-lived cookie, which covers a next read that lands
+  on another worker.
+
+Endpoints whose responses are cached under a version, such as the catalog,
+also record the primary's WAL position when the version changes. They
+read from the replica again once `replica_caught_up` sees the replica has
+replayed that far.
+"""
+import logging
+import time
+from http.cookies import SimpleCookie
+from typing import Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+from .. import database
+from ..config import settings
+from .metrics import db_replica_lag
+from .security import bearer_subject
+
+logger = logging.getLogger(__name__)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+STICKY_COOKIE = "read_primary_until"
+SWEEP_SECONDS = 60.0
+
+# Seconds since the last replayed transaction, or 0 when replay has caught
+# up with everything received. NULL (so 0) on a server that is not replicating.
+PG_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# WAL positions as byte offsets, so they compare as plain numbers
+PG_CURRENT_LSN_QUERY = text("SELECT pg_current_wal_lsn() - '0/0'::pg_lsn")
+PG_REPLAY_LSN_QUERY = text("SELECT pg_last_wal_replay_lsn() - '0/0'::pg_lsn")
+
+# Newest position the replica is known to have replayed
+_replayed_lsn = 0
+
+def primary_lsn(db: Session) -> Optional[int]:
+    """The primary's current WAL position, or None on a database that does not replicate"""
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return int(db.execute(PG_CURRENT_LSN_QUERY).scalar())
+
+def replica_caught_up(lsn: Optional[int]) -> bool:
+    """Whether the replica has replayed the primary's WAL up to `lsn`.
+
+    Asks the replica only while the last position it reported is behind
+    `lsn`, so reads of an unchanged version cost nothing extra.
+    """
+    global _replayed_lsn
+    if lsn is None or lsn <= _replayed_lsn or database.replica_engine is None:
+        return True
+    try:
+        with database.replica_engine.connect() as connection:
+            if connection.dialect.name != "postgresql":
+                return True
+            _replayed_lsn = max(_replayed_lsn, int(connection.execute(PG_REPLAY_LSN_QUERY).scalar() or 0))
+    except Exception as e:
+        logger.warning("Could not read the replica's replay position: %s", e)
+        return False
+    return lsn <= _replayed_lsn
+
+def replica_lag() -> float:
+    """Current lag of the replica in seconds"""
+    with database.replica_engine.connect() as connection:
+        if connection.dialect.name != "postgresql":
+            # Stand-ins such as a second SQLite file do not replicate
+            connection.exec_driver_sql("SELECT 1")
+            return 0.0
+        return float(connection.execute(PG_LAG_QUERY).scalar() or 0)
+
+def check_replica_lag():
+    """Route reads to the replica only while it is reachable and within its lag budget"""
+    if database.replica_engine is None:
+        return
+    try:
+        lag = replica_lag()
+    except Exception as e:
+        logger.warning("Read replica unreachable, reading from the primary: %s", e)
+        database.replica_ok = False
+        db_replica_lag.set(-1)
+        return
+
+    healthy = lag <= settings.replica_max_lag_seconds
+    if healthy != database.replica_ok:
+        logger.warning("Read replica %s (lag %.2fs)", "back in rotation" if healthy else "lagging, reading from the primary", lag)
+    database.replica_ok = healthy
+    db_replica_lag.set(lag)
+
+class ReadYourWritesMiddleware:
+    """Pin a caller's reads to the primary for a few seconds after they write"""
+
+    def __init__(self, app):
+        self.app = app
+        # caller -> monotonic time until which their reads use the primary
+        self.recent_writers: Dict[str, float] = {}
+        self._next_sweep = 0.0
+
+    def _caller(self, scope, headers: dict) -> str:
+        subject = bearer_subject(headers)
+        if subject:
+            return subject
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or database.replica_engine is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        caller = self._caller(scope, headers)
+
+        if scope["method"] in SAFE_METHODS:
+            if self._is_sticky(caller, headers):
+                scope.setdefault("state", {})["read_primary"] = True
+            await self.app(scope, receive, send)
+            return
+
+        async def mark_writer(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                now = time.monotonic()
+                # Writers that never read again would otherwise stay forever
+                if now >= self._next_sweep:
+                    self.recent_writers = {k: until for k, until in self.recent_writers.items() if until > now}
+                    self._next_sweep = now + SWEEP_SECONDS
+                self.recent_writers[caller] = now + settings.replica_sticky_seconds
+                cookie = (f"{STICKY_COOKIE}={time.time() + settings.replica_sticky_seconds:.0f}; "
+                          f"Max-Age={settings.replica_sticky_seconds:.0f}; Path=/; HttpOnly; SameSite=Lax")
+                message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, mark_writer)
+
+    def _is_sticky(self, caller: str, headers: dict) -> bool:
+        now = time.monotonic()
+        until = self.recent_writers.get(caller)
+        if until is not None:
+            if until > now:
+                return True
+            del self.recent_writers[caller]
+
+        cookie = SimpleCookie(headers.get(b"cookie", b"").decode())
+        try:
+            return float(cookie[STICKY_COOKIE].value) > time.time()
+        except (KeyError, ValueError):
+            return False
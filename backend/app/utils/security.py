@@ -1,11 +1,16 @@
+import time
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from ..config import settings
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
+BEARER_CACHE_SIZE = 4096
+# token -> (subject, exp); entries are only used until the token expires
+_bearer_subjects: Dict[str, Tuple[str, float]] = {}
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -29,4 +34,32 @@ def verify_token(token: str) -> Optional[str]:
         email: str = payload.get("sub")
         return email
     except JWTError:
-        return None
\ No newline at end of file
+        return None
+
+def bearer_subject(headers: dict) -> Optional[str]:
+    """Subject of a valid bearer token in raw ASGI headers, for middlewares that run before auth.
+
+    Checking the signature dominates what these middlewares spend per
+    request, so subjects are cached per token until the token expires.
+    """
+    scheme, _, token = headers.get(b"authorization", b"").decode().partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    now = time.time()
+    cached = _bearer_subjects.get(token)
+    if cached is not None:
+        if cached[1] > now:
+            return cached[0]
+        _bearer_subjects.pop(token, None)
+
+    try:
+        payload = jwt.decode(token, settings.secret_key, algorithms=[settings.algorithm])
+    except JWTError:
+        return None
+    subject, exp = payload.get("sub"), payload.get("exp")
+    if subject and exp is not None:
+        if len(_bearer_subjects) >= BEARER_CACHE_SIZE:
+            _bearer_subjects.clear()
+        _bearer_subjects[token] = (subject, float(exp))
+    return subject
\ No newline at end of file
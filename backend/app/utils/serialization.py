@@ -0,0 +1,45 @@
+"""Fast JSON serialization for hot endpoints.
+
+List endpoints skip FastAPI's second validation pass over ORM objects:
+products are read as plain rows and dumped with orjson, and nested
+responses go through pre-built pydantic TypeAdapters straight to bytes.
+"""
+from typing import Any, Iterable, List
+import orjson
+from fastapi.responses import JSONResponse, Response
+from pydantic import TypeAdapter
+from ..models.product import Product
+from ..schemas.order import OrderResponse
+from ..schemas.product import ProductResponse
+
+class ORJSONResponse(JSONResponse):
+    """JSON response rendered with orjson (native datetime, enum and numpy support)"""
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+# Built once at import; building an adapter compiles its validator/serializer
+product_list_adapter = TypeAdapter(List[ProductResponse])
+order_list_adapter = TypeAdapter(List[OrderResponse])
+order_adapter = TypeAdapter(OrderResponse)
+
+# Column order matches ProductResponse
+PRODUCT_COLUMNS = (
+    Product.id, Product.name, Product.description, Product.price, Product.category,
+    Product.image_url, Product.stock_quantity, Product.is_active,
+    Product.created_at, Product.updated_at,
+)
+
+def rows_response(rows: Iterable) -> Response:
+    """Serialize column rows (e.g. from a PRODUCT_COLUMNS query) without building ORM objects"""
+    return Response(
+        orjson.dumps([row._asdict() for row in rows]),
+        media_type="application/json"
+    )
+
+def adapter_response(adapter: TypeAdapter, objects: Any) -> Response:
+    """Validate ORM objects with a pre-built adapter and dump them to JSON bytes in one go"""
+    return Response(
+        adapter.dump_json(adapter.validate_python(objects, from_attributes=True)),
+        media_type="application/json"
+    )
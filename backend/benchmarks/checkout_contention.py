@@ -0,0 +1,119 @@
+"""Parallel checkouts of one hot product, with and without sharded stock.
+
+Each worker thread loops: put one unit in its cart and hold it (the
+add-to-cart transaction), then convert the hold into a stock decrement and
+keep the transaction open for --work-ms before committing. The pause stands
+in for the order insert, outbox event and round trips a real checkout spends
+holding its locks. The run is repeated for each --shards value on a fresh
+product, and checkouts per second are reported for each.
+
+Row locks only matter on a database that has them: run this against
+Postgres. SQLite locks the whole database for every write, so sharding
+cannot help there.
+
+Usage (from backend/):
+    DATABASE_URL=postgresql://... python -m benchmarks.checkout_contention --workers 12 --shards 0 8 32
+"""
+import argparse
+import json
+import threading
+import time
+import uuid
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import insert
+from app.database import SessionLocal
+from app.models import user, product, cart, order, outbox, idempotency, reservation
+from app.models.cart import CartItem
+from app.models.product import Product
+from app.models.user import User
+from app.services.reservation_service import ReservationService
+from app.services.stock_shard_service import StockShardService
+
+def _setup(workers: int, shards: int) -> tuple:
+    """A fresh hot product and one shopper per worker"""
+    run = uuid.uuid4().hex[:8]
+    db = SessionLocal()
+    try:
+        product_id = db.scalar(insert(Product.__table__).values(
+            name=f"Flash sale {run}", price=9.99, stock_quantity=10_000_000, is_active=True
+        ).returning(Product.__table__.c.id))
+        user_ids = db.scalars(insert(User.__table__).returning(User.__table__.c.id, sort_by_parameter_order=True), [
+            {"email": f"contention-{run}-{i}@example.com", "username": f"contention_{run}_{i}",
+             "hashed_password": "!", "is_active": True, "is_admin": False}
+            for i in range(workers)
+        ]).all()
+        db.commit()
+        StockShardService(db).configure(product_id, shards)
+        return product_id, user_ids
+    finally:
+        db.close()
+
+def _worker(user_id: int, product_id: int, deadline: float, work: float, latencies: list, errors: list):
+    db = SessionLocal()
+    reservations = ReservationService(db)
+    try:
+        while time.perf_counter() < deadline:
+            db.add(CartItem(user_id=user_id, product_id=product_id, quantity=1))
+            reservations.hold_cart_lines(user_id, [product_id])
+            db.commit()
+
+            start = time.perf_counter()
+            try:
+                reservations.convert_cart(user_id)
+                db.query(CartItem).filter(CartItem.user_id == user_id).delete(synchronize_session=False)
+                time.sleep(work)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                db.query(CartItem).filter(CartItem.user_id == user_id).delete(synchronize_session=False)
+                db.commit()
+                errors.append(type(e).__name__)
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        db.close()
+
+def run(workers: int, shards: int, duration: float, work_ms: float) -> dict:
+    product_id, user_ids = _setup(workers, shards)
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    threads = [
+        threading.Thread(target=_worker, args=(user_id, product_id, deadline, work_ms / 1000, latencies, errors))
+        for user_id in user_ids
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ordered = sorted(latencies)
+    return {
+        "shards": shards,
+        "checkouts": len(ordered),
+        "errors": len(errors),
+        "checkouts_per_s": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(ordered[len(ordered) // 2] * 1000, 2) if ordered else None,
+        "p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2) if ordered else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=12, help="concurrent checkouts; keep within DB_POOL_SIZE + DB_MAX_OVERFLOW")
+    parser.add_argument("--shards", type=int, nargs="+", default=[0, 8, 32])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--work-ms", type=float, default=5, help="time each checkout holds its locks")
+    args = parser.parse_args()
+
+    command.upgrade(Config("alembic.ini"), "head")
+
+    results = [run(args.workers, shards, args.duration, args.work_ms) for shards in args.shards]
+    baseline = results[0]["checkouts_per_s"]
+    for result in results:
+        result["speedup"] = round(result["checkouts_per_s"] / baseline, 2) if baseline else None
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Fake Stripe and OpenAI HTTP servers for load tests.
+
+They answer only the endpoints the app calls, after a configurable delay,
+so checkout and chat can be exercised without network access or cost.
+The load runner starts them itself. Run them standalone when benchmarking
+a separately started server, and launch that server with
+STRIPE_API_BASE=http://127.0.0.1:12111 and
+OPENAI_API_BASE=http://127.0.0.1:12112/v1.
+
+Usage (from backend/):
+    python -m benchmarks.fakes --stripe-port 12111 --openai-port 12112 --latency-ms 50
+"""
+import argparse
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+_ids = itertools.count(1)
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def _reply(self, payload: dict, status: int = 200):
+        time.sleep(self.latency)
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class FakeStripeHandler(_FakeHandler):
+    """Payment intents always succeed; refunds and cancellations always go through"""
+
+    def do_POST(self):
+        form = {key: values[0] for key, values in parse_qs(self._read_body().decode()).items()}
+        now = int(time.time())
+
+        if self.path == "/v1/payment_intents":
+            intent_id = f"pi_fake_{next(_ids)}"
+            self._reply({
+                "id": intent_id, "object": "payment_intent", "status": "succeeded",
+                "amount": int(form.get("amount", 0)), "currency": form.get("currency", "usd"),
+                "client_secret": f"{intent_id}_secret", "created": now,
+            })
+        elif self.path.startswith("/v1/payment_intents/") and self.path.endswith("/cancel"):
+            intent_id = self.path.split("/")[3]
+            self._reply({"id": intent_id, "object": "payment_intent", "status": "canceled", "created": now})
+        elif self.path == "/v1/refunds":
+            self._reply({
+                "id": f"re_fake_{next(_ids)}", "object": "refund", "status": "succeeded",
+                "payment_intent": form.get("payment_intent"), "created": now,
+            })
+        else:
+            self._reply({"error": {"type": "invalid_request_error", "message": f"Unknown path {self.path}"}}, 404)
+
+class FakeOpenAIHandler(_FakeHandler):
+    """Chat completions return a canned answer with plausible token usage"""
+
+    reply = "Here are a few products you might like based on what you told me."
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            self._reply({"error": {"message": f"Unknown path {self.path}"}}, 404)
+            return
+
+        request = json.loads(self._read_body() or b"{}")
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+        completion_tokens = len(self.reply.split())
+        self._reply({
+            "id": f"chatcmpl-fake-{next(_ids)}", "object": "chat.completion",
+            "created": int(time.time()), "model": request.get("model", "gpt-3.5-turbo"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": self.reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+def start_fake(handler: type, port: int = 0, latency_ms: float = 0) -> ThreadingHTTPServer:
+    """Serve `handler` on 127.0.0.1 from a daemon thread; port 0 picks a free one"""
+    handler = type(handler.__name__, (handler,), {"latency": latency_ms / 1000})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def base_urls(stripe_server: ThreadingHTTPServer, openai_server: ThreadingHTTPServer) -> dict:
+    """Settings overrides pointing the app's SDK clients at the fakes"""
+    return {
+        "stripe_api_base": f"http://127.0.0.1:{stripe_server.server_port}",
+        "openai_api_base": f"http://127.0.0.1:{openai_server.server_port}/v1",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stripe-port", type=int, default=12111)
+    parser.add_argument("--openai-port", type=int, default=12112)
+    parser.add_argument("--latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    stripe_server = start_fake(FakeStripeHandler, args.stripe_port, args.latency_ms)
+    openai_server = start_fake(FakeOpenAIHandler, args.openai_port, args.latency_ms)
+    # As environment variables for the server under test
+    for key, value in base_urls(stripe_server, openai_server).items():
+        print(f"{key.upper()}={value}")
+
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
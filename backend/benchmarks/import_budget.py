@@ -0,0 +1,64 @@
+"""Fail when `import app.main` exceeds its cold-import budget or pulls in lazy SDKs.
+
+Usage (from backend/):
+    python -m benchmarks.import_budget --budget-ms 1500
+
+Exits non-zero on regression so it can gate CI. tests/test_import_budget.py
+runs the same check with the default budget.
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+# SDKs that must only be imported on first use (see app/utils/clients.py)
+LAZY_MODULES = ("stripe", "openai", "redis")
+DEFAULT_BUDGET_MS = 1500.0
+
+LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+def measure() -> tuple:
+    """Return (cumulative microseconds for app.main, set of imported top-level modules)"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        capture_output=True, text=True, check=True
+    ).stderr
+
+    total_us = 0
+    modules = set()
+    for match in LINE.finditer(stderr):
+        _, cumulative, _, name = match.groups()
+        modules.add(name.split(".")[0])
+        if name == "app.main":
+            total_us = int(cumulative)
+
+    return total_us, modules
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    samples = []
+    modules = set()
+    for _ in range(args.runs):
+        total_us, modules = measure()
+        samples.append(total_us / 1000)
+
+    best_ms = min(samples)
+    eager = sorted(m for m in LAZY_MODULES if m in modules)
+    print(f"import app.main: best {best_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+
+    failed = False
+    if best_ms > args.budget_ms:
+        print("FAIL: import time over budget")
+        failed = True
+    if eager:
+        print(f"FAIL: imported eagerly: {', '.join(eager)}")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,274 @@
+"""Replay weighted shopping scenarios against the API and report per-endpoint latency.
+
+Virtual users log in as seeded benchmark users (see benchmarks.seed). Each
+one loops over weighted scenarios until the duration runs out:
+
+- browse: list a page, open a product, fetch its also-bought list
+- search: a text search, sometimes within a category
+- cart: add to cart and view the cart
+- checkout: add to cart, then place the order
+- chat: talk to the shopping assistant
+
+Checkout goes through a fake Stripe and chat through a fake OpenAI server
+(see benchmarks.fakes). By default the app runs in-process over ASGI, in
+the same event loop as the clients, much like a single worker. Use
+--base-url to target a running server instead, started with the fakes'
+base URLs and RATE_LIMIT_ENABLED=false in its environment. Results are saved as JSON keyed by git
+commit. Pass --baseline to print p95 changes against an earlier run.
+
+Usage (from backend/):
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.load --users 20 --duration 30
+    python -m benchmarks.load --base-url http://127.0.0.1:8000 --baseline benchmarks/results/abc123.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+import httpx
+from app.config import settings
+from .fakes import FakeOpenAIHandler, FakeStripeHandler, base_urls, start_fake
+from .seed import BENCH_EMAIL, BENCH_PASSWORD, CATEGORIES, NOUNS
+
+DEFAULT_MIX = "browse=45,search=20,cart=15,checkout=10,chat=10"
+CHAT_MESSAGES = [
+    "Can you recommend a good gift under $50?",
+    "What's the status of my last order?",
+    "I'm looking for wireless headphones, any suggestions?",
+    "Which of these products is best for camping?",
+]
+
+class Recorder:
+    """Latencies and response statuses per endpoint name"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, name: str, seconds: float, status):
+        self.latencies[name].append(seconds)
+        self.statuses[name][str(status)] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, samples in sorted(self.latencies.items()):
+            endpoints[name] = _describe(samples, _errors(self.statuses[name]), elapsed)
+            endpoints[name]["statuses"] = dict(self.statuses[name])
+        every = [s for samples in self.latencies.values() for s in samples]
+        errors = sum(_errors(statuses) for statuses in self.statuses.values())
+        return {"total": _describe(every, errors, elapsed), "endpoints": endpoints}
+
+def _errors(statuses: Counter) -> int:
+    return sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+
+def _percentile(ordered: list, pct: float) -> float:
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+def _describe(samples: list, errors: int, elapsed: float) -> dict:
+    ordered = sorted(samples)
+    if not ordered:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 2),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 2),
+        "p50_ms": round(_percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(_percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(_percentile(ordered, 99) * 1000, 2),
+        "max_ms": round(ordered[-1] * 1000, 2),
+    }
+
+class VirtualUser:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, product_ids: list, rng: random.Random):
+        self.client = client
+        self.recorder = recorder
+        self.product_ids = product_ids
+        self.rng = rng
+        self.headers = {}
+
+    async def call(self, name: str, method: str, url: str, headers: dict = None, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, headers={**self.headers, **(headers or {})}, **kwargs)
+        except httpx.HTTPError as e:
+            self.recorder.record(name, time.perf_counter() - start, type(e).__name__)
+            return None
+        self.recorder.record(name, time.perf_counter() - start, response.status_code)
+        return response
+
+    async def login(self, index: int):
+        """Log in before the clock starts; bcrypt would otherwise dominate the numbers"""
+        response = await self.client.post("/auth/login", json={
+            "email": BENCH_EMAIL.format(index), "password": BENCH_PASSWORD
+        })
+        response.raise_for_status()
+        self.headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    async def browse(self):
+        await self.call("GET /products/", "GET", "/products/",
+                        params={"skip": self.rng.randrange(0, 200), "limit": 20})
+        product_id = self.rng.choice(self.product_ids)
+        await self.call("GET /products/{product_id}", "GET", f"/products/{product_id}")
+        await self.call("GET /products/{product_id}/also-bought", "GET", f"/products/{product_id}/also-bought")
+
+    async def search(self):
+        params = {"search": self.rng.choice(NOUNS), "limit": 20}
+        if self.rng.random() < 0.3:
+            params["category"] = self.rng.choice(CATEGORIES)
+        await self.call("GET /products/?search", "GET", "/products/", params=params)
+
+    async def cart(self):
+        await self.add_to_cart()
+        await self.call("GET /cart/", "GET", "/cart/")
+
+    async def checkout(self):
+        await self.add_to_cart()
+        headers = {}
+        while True:
+            response = await self.call("POST /orders/", "POST", "/orders/", headers=headers,
+                                       json={"shipping_address": "1 Benchmark Way", "payment_method_id": "pm_card_visa"})
+            if response is None or response.status_code != 429:
+                return
+            # Queued by the admission gate; come back with the ticket like the storefront does
+            headers = {"X-Checkout-Ticket": response.json()["ticket"]}
+            await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+    async def chat(self):
+        await self.call("POST /agents/chat", "POST", "/agents/chat",
+                        json={"message": self.rng.choice(CHAT_MESSAGES)})
+
+    async def add_to_cart(self):
+        await self.call("POST /cart/", "POST", "/cart/",
+                        json={"product_id": self.rng.choice(self.product_ids), "quantity": 1})
+
+async def _product_ids(client: httpx.AsyncClient, pages: int = 10) -> list:
+    ids = []
+    for page in range(pages):
+        response = await client.get("/products/", params={"skip": page * 100, "limit": 100})
+        response.raise_for_status()
+        batch = [row["id"] for row in response.json()]
+        ids.extend(batch)
+        if len(batch) < 100:
+            break
+    return ids
+
+async def _run_user(user: VirtualUser, mix: dict, deadline: float, think: float):
+    rng = user.rng
+    scenarios, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        await getattr(user, rng.choices(scenarios, weights)[0])()
+        if think:
+            await asyncio.sleep(rng.uniform(0, 2 * think))
+
+async def run(client: httpx.AsyncClient, args, mix: dict) -> dict:
+    product_ids = await _product_ids(client)
+    if not product_ids:
+        raise SystemExit("No products found; run `python -m benchmarks.seed` first")
+
+    recorder = Recorder()
+    users = [
+        VirtualUser(client, recorder, product_ids, random.Random(args.seed + i))
+        for i in range(args.users)
+    ]
+    await asyncio.gather(*(user.login(i) for i, user in enumerate(users)))
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+    await asyncio.gather(*(_run_user(user, mix, deadline, args.think_ms / 1000) for user in users))
+    return recorder.summary(time.perf_counter() - start)
+
+async def run_in_process(args, mix: dict) -> dict:
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await run(client, args, mix)
+
+async def run_remote(args, mix: dict) -> dict:
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30) as client:
+        return await run(client, args, mix)
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if not hasattr(VirtualUser, name):
+            raise argparse.ArgumentTypeError(f"unknown scenario {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def _compare(results: dict, baseline_path: str) -> dict:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    changes = {}
+    for name, current in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name, {})
+        if "p95_ms" in before and "p95_ms" in current and before["p95_ms"]:
+            changes[name] = f"{(current['p95_ms'] / before['p95_ms'] - 1) * 100:+.1f}% p95"
+    return {"baseline": baseline.get("meta", {}).get("git_commit"), "changes": changes}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to run")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX))
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between scenarios")
+    parser.add_argument("--fake-latency-ms", type=float, default=50, help="Stripe/OpenAI fake response delay")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="defaults to benchmarks/results/<commit>.json")
+    parser.add_argument("--baseline", help="earlier results file to compare p95 latencies against")
+    args = parser.parse_args()
+
+    if args.base_url:
+        results = asyncio.run(run_remote(args, args.mix))
+    else:
+        stripe_server = start_fake(FakeStripeHandler, latency_ms=args.fake_latency_ms)
+        openai_server = start_fake(FakeOpenAIHandler, latency_ms=args.fake_latency_ms)
+        for key, value in base_urls(stripe_server, openai_server).items():
+            setattr(settings, key, value)
+        # Every virtual user shares one client address, and logins alone would trip the auth limit
+        settings.rate_limit_enabled = False
+        results = asyncio.run(run_in_process(args, args.mix))
+
+    commit = _git_commit()
+    results["meta"] = {
+        "git_commit": commit,
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "target": args.base_url or "in-process",
+        "users": args.users,
+        "duration_s": args.duration,
+        "mix": args.mix,
+        "fake_latency_ms": args.fake_latency_ms,
+        "python": platform.python_version(),
+    }
+
+    output = args.output or os.path.join(os.path.dirname(__file__), "results", f"{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    report = {"output": output, "total": results["total"], "endpoints": results["endpoints"]}
+    if args.baseline:
+        report["comparison"] = _compare(results, args.baseline)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""Build-time, memory and lookup benchmark for the co-purchase recommender.
+
+Generates synthetic order lines with Zipf-distributed product popularity
+and builds the neighbour index from them without touching a database.
+
+Usage (from backend/):
+    python -m benchmarks.recommender --lines 10000000 --products 50000
+"""
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+import numpy as np
+from app.utils.recommender import CoPurchaseRecommender
+
+def synthetic_lines(lines: int, products: int, mean_basket: float, seed: int):
+    rng = np.random.default_rng(seed)
+    basket_sizes = rng.geometric(1.0 / mean_basket, size=int(lines / mean_basket) + 1)
+    basket_sizes = basket_sizes[np.cumsum(basket_sizes) <= lines]
+    order_ids = np.repeat(np.arange(len(basket_sizes), dtype=np.int64), basket_sizes)
+    product_ids = (rng.zipf(1.3, size=len(order_ids)) - 1) % products + 1
+    return order_ids, product_ids.astype(np.int64)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=10_000_000)
+    parser.add_argument("--products", type=int, default=50_000)
+    parser.add_argument("--mean-basket", type=float, default=3.0)
+    parser.add_argument("--top-n", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    order_ids, product_ids = synthetic_lines(args.lines, args.products, args.mean_basket, args.seed)
+    recommender = CoPurchaseRecommender(top_n=args.top_n)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    recommender.build(order_ids, product_ids)
+    build_seconds = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    keys, neighbours, scores = recommender._index
+    probes = keys[np.random.default_rng(args.seed).integers(0, len(keys), size=10_000)].tolist()
+    started = time.perf_counter()
+    for product_id in probes:
+        recommender.related(product_id, 5)
+    lookup_us = (time.perf_counter() - started) / len(probes) * 1e6
+
+    print(json.dumps({
+        "order_lines": int(len(order_ids)),
+        "orders": int(order_ids[-1]) + 1,
+        "products": int(len(keys)),
+        "build_seconds": round(build_seconds, 2),
+        "build_peak_mb": round(peak_bytes / 2**20, 1),
+        "index_mb": round((keys.nbytes + neighbours.nbytes + scores.nbytes) / 2**20, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "lookup_us": round(lookup_us, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""Seed a scratch database with synthetic users, products, carts and orders.
+
+Migrates DATABASE_URL to head and then bulk-inserts deterministic data
+(fixed --seed). Every seeded user shares BENCH_PASSWORD, and their emails
+follow BENCH_EMAIL, so the load runner can log in as any of them. Point
+DATABASE_URL at a throwaway database: the seed assumes it is empty.
+
+Usage (from backend/):
+    DATABASE_URL=sqlite:///bench.db python -m benchmarks.seed --users 1000 --products 5000 --orders 20000
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import func, insert
+from app.config import settings
+from app.database import SessionLocal
+from app.models import user, product, cart, order, outbox, idempotency, reservation
+from app.models.cart import CartItem
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product
+from app.models.user import User
+from app.utils.security import get_password_hash
+
+BENCH_EMAIL = "bench-user-{}@example.com"
+BENCH_PASSWORD = "bench-password"
+BATCH_SIZE = 1000
+
+CATEGORIES = ["Electronics", "Books", "Home", "Garden", "Toys", "Sports", "Beauty", "Grocery", "Fashion", "Automotive"]
+ADJECTIVES = ["Classic", "Smart", "Portable", "Organic", "Deluxe", "Compact", "Wireless", "Vintage", "Ultra", "Eco"]
+NOUNS = ["Speaker", "Lamp", "Backpack", "Novel", "Blender", "Sneakers", "Drone", "Teapot", "Jacket", "Puzzle",
+         "Headphones", "Notebook", "Chair", "Bottle", "Watch", "Camera", "Mug", "Racket", "Serum", "Planter"]
+ORDER_STATUSES = [OrderStatus.DELIVERED] * 5 + [OrderStatus.SHIPPED, OrderStatus.CONFIRMED,
+                                                OrderStatus.PROCESSING, OrderStatus.CANCELLED]
+
+def _batches(rows, size: int = BATCH_SIZE):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+def _insert_returning_ids(db, table, rows) -> list:
+    ids = []
+    for batch in _batches(rows):
+        ids.extend(db.scalars(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), batch
+        ).all())
+    return ids
+
+def _insert(db, table, rows):
+    for batch in _batches(rows):
+        db.execute(insert(table), batch)
+
+def seed(db, users: int, products: int, carts: int, orders: int, rng: random.Random) -> dict:
+    now = datetime.now(timezone.utc)
+    # bcrypt is deliberately slow; one hash serves every synthetic user
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+
+    user_ids = _insert_returning_ids(db, User.__table__, [
+        {
+            "email": BENCH_EMAIL.format(i), "username": f"bench_user_{i}",
+            "hashed_password": hashed_password, "first_name": f"Bench{i}",
+            "is_active": True, "is_admin": False,
+        }
+        for i in range(users)
+    ])
+
+    product_rows = []
+    for i in range(products):
+        adjective, noun = rng.choice(ADJECTIVES), rng.choice(NOUNS)
+        product_rows.append({
+            "name": f"{adjective} {noun} {i}",
+            "description": f"A {adjective.lower()} {noun.lower()} for everyday use.",
+            "price": round(rng.uniform(2, 500), 2),
+            "category": rng.choice(CATEGORIES),
+            "image_url": f"https://img.example/{i}.jpg",
+            # Deep enough that checkout scenarios never run out mid-benchmark
+            "stock_quantity": 100_000,
+            "is_active": rng.random() > 0.05,
+            "created_at": now - timedelta(days=rng.uniform(0, 365)),
+        })
+    product_ids = _insert_returning_ids(db, Product.__table__, product_rows)
+    prices = {pid: row["price"] for pid, row in zip(product_ids, product_rows)}
+    active_ids = [pid for pid, row in zip(product_ids, product_rows) if row["is_active"]]
+
+    cart_rows = []
+    for user_id in rng.sample(user_ids, min(carts, len(user_ids))):
+        # Inactive products would make every checkout of this cart fail
+        for product_id in rng.sample(active_ids, min(rng.randint(1, 4), len(active_ids))):
+            cart_rows.append({"user_id": user_id, "product_id": product_id, "quantity": rng.randint(1, 3)})
+    _insert(db, CartItem.__table__, cart_rows)
+
+    order_rows, order_lines = [], []
+    for _ in range(orders):
+        lines = [(pid, rng.randint(1, 3)) for pid in rng.sample(product_ids, min(rng.randint(1, 4), len(product_ids)))]
+        created_at = now - timedelta(days=rng.uniform(0, 90))
+        order_rows.append({
+            "user_id": rng.choice(user_ids),
+            "total_amount": round(sum(prices[pid] * qty for pid, qty in lines) * 1.08, 2),
+            "status": rng.choice(ORDER_STATUSES),
+            "shipping_address": "1 Benchmark Way, Springfield",
+            "stripe_payment_intent_id": f"pi_seed_{len(order_rows)}",
+            "created_at": created_at,
+        })
+        order_lines.append(lines)
+    order_ids = _insert_returning_ids(db, Order.__table__, order_rows)
+
+    _insert(db, OrderItem.__table__, [
+        {"order_id": order_id, "product_id": pid, "quantity": qty, "price": prices[pid]}
+        for order_id, lines in zip(order_ids, order_lines)
+        for pid, qty in lines
+    ])
+
+    db.commit()
+    return {
+        "users": len(user_ids), "products": len(product_ids), "cart_items": len(cart_rows),
+        "orders": len(order_ids), "order_items": sum(len(lines) for lines in order_lines),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--carts", type=int, default=100, help="users that start with a non-empty cart")
+    parser.add_argument("--orders", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    command.upgrade(Config("alembic.ini"), "head")
+
+    db = SessionLocal()
+    try:
+        if db.query(func.count(User.id)).filter(User.email.like(BENCH_EMAIL.format("%"))).scalar():
+            parser.error("database already contains benchmark users; seed a fresh one")
+
+        start = time.perf_counter()
+        counts = seed(db, args.users, args.products, args.carts, args.orders, random.Random(args.seed))
+    finally:
+        db.close()
+
+    print(json.dumps({
+        "database": settings.database_url.split("@")[-1],
+        "seeded": counts,
+        "seconds": round(time.perf_counter() - start, 2),
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
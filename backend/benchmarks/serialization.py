@@ -0,0 +1,68 @@
+"""Microbenchmark: serialize a 100-order page with nested items and products.
+
+Compares the legacy per-object path (model_validate + jsonable_encoder +
+json.dumps) with the pre-built TypeAdapter path used by the list endpoints.
+
+Usage (from backend/):
+    python -m benchmarks.serialization --orders 100 --items 5
+"""
+import argparse
+import json
+import timeit
+from datetime import datetime, timezone
+from fastapi.encoders import jsonable_encoder
+from app.models import user, product, cart, order
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.product import Product
+from app.schemas.order import OrderResponse
+from app.utils.serialization import order_list_adapter
+
+def build_page(orders: int, items: int) -> list:
+    """Transient ORM objects shaped like one page of GET /orders/"""
+    now = datetime.now(timezone.utc)
+    products = [
+        Product(
+            id=i, name=f"Product {i}", description="A fine product " * 8, price=19.99 + i,
+            category="Electronics", image_url=f"https://img.example/{i}.jpg",
+            stock_quantity=100, is_active=True, created_at=now, updated_at=now
+        )
+        for i in range(items)
+    ]
+    page = []
+    for i in range(orders):
+        page.append(Order(
+            id=i, user_id=1, total_amount=123.45, status=OrderStatus.CONFIRMED,
+            shipping_address="1 Main St, Springfield", tracking_number=None,
+            stripe_payment_intent_id=f"pi_{i}", created_at=now, updated_at=None,
+            order_items=[
+                OrderItem(id=i * items + j, product_id=p.id, quantity=2, price=p.price, product=p)
+                for j, p in enumerate(products)
+            ]
+        ))
+    return page
+
+def legacy(page: list) -> bytes:
+    models = [OrderResponse.model_validate(o) for o in page]
+    return json.dumps(jsonable_encoder(models)).encode()
+
+def adapter(page: list) -> bytes:
+    return order_list_adapter.dump_json(order_list_adapter.validate_python(page, from_attributes=True))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", type=int, default=100)
+    parser.add_argument("--items", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    page = build_page(args.orders, args.items)
+    results = {}
+    for name, fn in (("legacy", legacy), ("type_adapter", adapter)):
+        best = min(timeit.repeat(lambda: fn(page), number=1, repeat=args.repeat))
+        results[name] = round(best * 1000, 3)
+
+    results["speedup"] = round(results["legacy"] / results["type_adapter"], 2)
+    print(json.dumps({"page": f"{args.orders} orders x {args.items} items", "best_ms": results}, indent=2))
+
+if __name__ == "__main__":
+    main()
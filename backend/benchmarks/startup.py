@@ -0,0 +1,47 @@
+"""Measure import-to-first-request latency of the API in fresh interpreters.
+
+Usage (from backend/):
+    python -m benchmarks.startup --runs 10
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = """
+import json, time
+t0 = time.perf_counter()
+from app.main import app
+t1 = time.perf_counter()
+from fastapi.testclient import TestClient
+with TestClient(app) as client:
+    t2 = time.perf_counter()
+    client.get("/health")
+    t3 = time.perf_counter()
+print(json.dumps({"import": t1 - t0, "lifespan": t2 - t1, "first_request": t3 - t2, "total": t3 - t0}))
+"""
+
+def run_once() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [run_once() for _ in range(args.runs)]
+    report = {
+        phase: {
+            "median_ms": round(statistics.median(s[phase] for s in samples) * 1000, 2),
+            "max_ms": round(max(s[phase] for s in samples) * 1000, 2),
+        }
+        for phase in samples[0]
+    }
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
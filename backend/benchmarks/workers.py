@@ -0,0 +1,109 @@
+"""Compare API throughput across server worker configurations.
+
+For each combination of --workers and --stacks (event loop + HTTP parser),
+starts `python run.py` on a free port, runs the load runner's scenario mix
+against it, and stops it with SIGTERM, which also exercises the graceful
+drain. The server inherits DATABASE_URL, so seed that database first (see
+benchmarks.seed); use Postgres, since SQLite serializes writers across
+processes. More than one worker also needs INVALIDATION_BACKEND and
+ADMISSION_BACKEND set to postgres or redis, or run.py refuses to start. Stripe and OpenAI are served by the fakes, and rate limiting is
+turned off, because every virtual user shares one address.
+
+Usage (from backend/):
+    python -m benchmarks.workers --workers 1,2,4 --stacks asyncio+h11,uvloop+httptools --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import httpx
+from .fakes import FakeOpenAIHandler, FakeStripeHandler, base_urls, start_fake
+from .load import DEFAULT_MIX, _git_commit, _parse_mix, run_remote
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _wait_healthy(base_url: str, server: subprocess.Popen, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"Server exited with {server.returncode} during startup")
+        try:
+            if httpx.get(f"{base_url}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server at {base_url} not healthy after {timeout}s")
+
+def measure(workers: int, stack: str, args, env: dict) -> dict:
+    loop, http = stack.split("+")
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "run.py", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--loop", loop, "--http", http],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        args.base_url = f"http://127.0.0.1:{port}"
+        _wait_healthy(args.base_url, server)
+        results = asyncio.run(run_remote(args, args.mix))
+    finally:
+        start = time.perf_counter()
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=120)
+        shutdown_s = time.perf_counter() - start
+
+    total = results["total"]
+    return {
+        "workers": workers, "stack": stack,
+        "rps": total.get("rps"), "p50_ms": total.get("p50_ms"), "p95_ms": total.get("p95_ms"),
+        "errors": total["errors"], "shutdown_s": round(shutdown_s, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--stacks", default="asyncio+h11,uvloop+httptools",
+                        help="comma-separated <loop>+<http> pairs")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per configuration")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix(DEFAULT_MIX))
+    parser.add_argument("--think-ms", type=float, default=0)
+    parser.add_argument("--fake-latency-ms", type=float, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stripe_server = start_fake(FakeStripeHandler, latency_ms=args.fake_latency_ms)
+    openai_server = start_fake(FakeOpenAIHandler, latency_ms=args.fake_latency_ms)
+    env = {
+        **os.environ,
+        **{key.upper(): value for key, value in base_urls(stripe_server, openai_server).items()},
+        "RATE_LIMIT_ENABLED": "false",
+        "SERVER_ACCESS_LOG": "false",
+    }
+
+    runs = [
+        measure(int(workers), stack, args, env)
+        for stack in args.stacks.split(",")
+        for workers in args.workers.split(",")
+    ]
+    print(json.dumps({
+        "git_commit": _git_commit(),
+        "cpus": os.cpu_count(),
+        "users": args.users,
+        "duration_s": args.duration,
+        "runs": runs,
+    }, indent=2))
+
+if __name__ == "__main__":
+    main()
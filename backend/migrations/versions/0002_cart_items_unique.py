@@ -0,0 +1,45 @@
+"""Unique (user_id, product_id) on cart_items for upsert-based add-to-cart
+
+Duplicate lines left behind by the old read-then-insert path are folded
+into the oldest row before the constraint is added.
+
+Revision ID: 0002_cart_items_unique
+Revises: 0001_baseline
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0002_cart_items_unique"
+down_revision = "0001_baseline"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute("""
+        UPDATE cart_items SET quantity = (
+            SELECT SUM(dup.quantity) FROM cart_items dup
+            WHERE dup.user_id = cart_items.user_id
+              AND dup.product_id = cart_items.product_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM cart_items
+            GROUP BY user_id, product_id
+            HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM cart_items WHERE id NOT IN (
+            SELECT keep.id FROM (
+                SELECT MIN(id) AS id FROM cart_items GROUP BY user_id, product_id
+            ) keep
+        )
+    """)
+
+    with op.batch_alter_table("cart_items") as batch_op:
+        batch_op.create_unique_constraint(
+            "uq_cart_items_user_product", ["user_id", "product_id"]
+        )
+
+def downgrade():
+    with op.batch_alter_table("cart_items") as batch_op:
+        batch_op.drop_constraint("uq_cart_items_user_product", type_="unique")
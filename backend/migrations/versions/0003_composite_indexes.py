@@ -0,0 +1,43 @@
+"""Composite and partial indexes matching the hot query shapes
+
+On Postgres the indexes are built CONCURRENTLY so the tables stay
+writable while the migration runs.
+
+Revision ID: 0003_composite_indexes
+Revises: 0002_cart_items_unique
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003_composite_indexes"
+down_revision = "0002_cart_items_unique"
+branch_labels = None
+depends_on = None
+
+# Spelled the way each dialect renders `is_active == True`, so the planners
+# can match the partial index predicate against storefront queries
+PG_ACTIVE = sa.text("is_active = true")
+SQLITE_ACTIVE = sa.text("is_active = 1")
+
+INDEXES = [
+    ("ix_orders_user_id_created_at", "orders", ["user_id", "created_at"], {}),
+    ("ix_orders_status_created_at", "orders", ["status", "created_at"], {}),
+    ("ix_orders_created_at", "orders", ["created_at"], {}),
+    ("ix_order_items_order_id", "order_items", ["order_id"], {}),
+    ("ix_order_items_product_id", "order_items", ["product_id"], {}),
+    ("ix_products_active_category_created_at", "products", ["category", "created_at"],
+     {"postgresql_where": PG_ACTIVE, "sqlite_where": SQLITE_ACTIVE}),
+    ("ix_products_active_created_at", "products", ["created_at"],
+     {"postgresql_where": PG_ACTIVE, "sqlite_where": SQLITE_ACTIVE}),
+]
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns, kwargs in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True, **kwargs)
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,37 @@
+"""Transactional outbox for order side effects
+
+Revision ID: 0004_outbox_events
+Revises: 0003_composite_indexes
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004_outbox_events"
+down_revision = "0003_composite_indexes"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "outbox_events",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("event_type", sa.String(), nullable=False),
+        sa.Column("payload", sa.JSON(), nullable=False),
+        sa.Column("attempts", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("last_error", sa.Text()),
+        sa.Column("available_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("processed_at", sa.DateTime(timezone=True)),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_index("ix_outbox_events_id", "outbox_events", ["id"])
+    op.create_index(
+        "ix_outbox_events_pending", "outbox_events", ["available_at"],
+        postgresql_where=sa.text("processed_at IS NULL"),
+        sqlite_where=sa.text("processed_at IS NULL"),
+    )
+
+def downgrade():
+    op.drop_index("ix_outbox_events_pending", table_name="outbox_events")
+    op.drop_index("ix_outbox_events_id", table_name="outbox_events")
+    op.drop_table("outbox_events")
@@ -0,0 +1,36 @@
+"""Inventory reservations and the reserved stock counter
+
+Revision ID: 0006_inventory_reservations
+Revises: 0005_idempotency_keys
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0006_inventory_reservations"
+down_revision = "0005_idempotency_keys"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("products", sa.Column("reserved_quantity", sa.Integer(), nullable=False, server_default="0"))
+
+    op.create_table(
+        "inventory_reservations",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("quantity", sa.Integer(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.UniqueConstraint("user_id", "product_id", name="uq_inventory_reservations_user_product"),
+    )
+    op.create_index("ix_inventory_reservations_id", "inventory_reservations", ["id"])
+    op.create_index("ix_inventory_reservations_expires_at", "inventory_reservations", ["expires_at"])
+
+def downgrade():
+    op.drop_index("ix_inventory_reservations_expires_at", table_name="inventory_reservations")
+    op.drop_index("ix_inventory_reservations_id", table_name="inventory_reservations")
+    op.drop_table("inventory_reservations")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("reserved_quantity")
@@ -0,0 +1,43 @@
+"""Sharded stock counters for hot products
+
+Revision ID: 0007_product_stock_shards
+Revises: 0006_inventory_reservations
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0007_product_stock_shards"
+down_revision = "0006_inventory_reservations"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.add_column("products", sa.Column("stock_shards", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("inventory_reservations", sa.Column("shard", sa.Integer()))
+
+    op.create_table(
+        "product_stock_shards",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("product_id", sa.Integer(), sa.ForeignKey("products.id"), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("stock_quantity", sa.Integer(), nullable=False),
+        sa.Column("reserved_quantity", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("product_id", "shard", name="uq_product_stock_shards_product_shard"),
+    )
+    op.create_index("ix_product_stock_shards_id", "product_stock_shards", ["id"])
+
+def downgrade():
+    # Fold sharded stock back onto the product rows before the shards go away
+    op.execute("""
+        UPDATE products SET
+            stock_quantity = (SELECT SUM(stock_quantity) FROM product_stock_shards WHERE product_id = products.id),
+            reserved_quantity = (SELECT SUM(reserved_quantity) FROM product_stock_shards WHERE product_id = products.id)
+        WHERE stock_shards > 0
+    """)
+    op.drop_index("ix_product_stock_shards_id", table_name="product_stock_shards")
+    op.drop_table("product_stock_shards")
+    with op.batch_alter_table("inventory_reservations") as batch_op:
+        batch_op.drop_column("shard")
+    with op.batch_alter_table("products") as batch_op:
+        batch_op.drop_column("stock_shards")
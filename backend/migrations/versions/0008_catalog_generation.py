@@ -0,0 +1,24 @@
+"""Persisted catalog generation for ETags shared by every worker
+
+Revision ID: 0008_catalog_generation
+Revises: 0007_product_stock_shards
+Create Date: 2026-10-19
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0008_catalog_generation"
+down_revision = "0007_product_stock_shards"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    catalog_generation = op.create_table(
+        "catalog_generation",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("generation", sa.Integer(), nullable=False),
+    )
+    op.bulk_insert(catalog_generation, [{"id": 1, "generation": 0}])
+
+def downgrade():
+    op.drop_table("catalog_generation")
@@ -1,11 +1,105 @@
+"""Start the API server.
+
+Production is the default: uvloop and httptools when installed, and the
+lifespan required to succeed, which warms the connection pools and
+caches before a worker accepts traffic. On SIGTERM or Ctrl+C, each worker stops
+accepting connections and lets in-flight requests finish (checkouts
+included) for up to SERVER_GRACEFUL_TIMEOUT seconds. Only then does it
+stop its background jobs.
+
+Caches, admission leases and rate limit buckets are per process unless
+INVALIDATION_BACKEND, ADMISSION_BACKEND and RATE_LIMIT_BACKEND point at
+postgres or redis. So SERVER_WORKERS=0 (the default) starts one worker
+per available CPU only when all of them are shared, and one worker
+otherwise. Asking for several workers with per-process state anyway is
+refused.
+
+--dev is the only way to get auto-reload. It runs a single worker that
+restarts on code changes.
+
+Usage (from backend/):
+    python run.py
+    python run.py --workers 4 --port 8080
+    python run.py --dev
+"""
+import argparse
+import importlib.util
+import logging
+import os
 import uvicorn
-from app.main import app
+from app.config import settings
 
-if __name__ == "__main__":
+logger = logging.getLogger("run")
+
+def available_cpus() -> int:
+    """CPUs this process may run on, which respects container and taskset limits"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def _fastest(module: str, fallback: str) -> str:
+    if importlib.util.find_spec(module) is not None:
+        return module
+    logger.warning("%s is not installed; using %s (pip install %s)", module, fallback, module)
+    return fallback
+
+def _per_worker_state() -> list:
+    """Configured backends that keep their state in each process"""
+    backends = [
+        ("INVALIDATION_BACKEND", settings.invalidation_backend),
+        ("ADMISSION_BACKEND", settings.admission_backend),
+    ]
+    if settings.rate_limit_enabled:
+        backends.append(("RATE_LIMIT_BACKEND", settings.rate_limit_backend))
+    return [f"{name}={value}" for name, value in backends if value in ("loopback", "local")]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dev", action="store_true", help="single worker with auto-reload")
+    parser.add_argument("--host", default=settings.server_host)
+    parser.add_argument("--port", type=int, default=settings.server_port)
+    parser.add_argument("--workers", type=int, default=settings.server_workers,
+                        help="0 for one per available CPU, or one while any backend is per process")
+    parser.add_argument("--loop", choices=("uvloop", "asyncio"), help="default: uvloop when installed")
+    parser.add_argument("--http", choices=("httptools", "h11"), help="default: httptools when installed")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:     %(message)s")
+
+    if args.dev:
+        uvicorn.run("app.main:app", host=args.host, port=args.port, reload=True, log_level="info")
+        return
+
+    local = _per_worker_state()
+    if args.workers > 1 and local:
+        parser.error(f"{args.workers} workers would each keep their own {', '.join(local)}; "
+                     "use postgres or redis for them, or run one worker")
+    if args.workers:
+        workers = args.workers
+    elif local:
+        workers = 1
+        logger.info("Per-process state in %s; starting one worker", ", ".join(local))
+    else:
+        workers = available_cpus()
+    logger.info("Starting %d worker(s); up to %d database connections (pool %d + overflow %d each)",
+                workers, workers * (settings.db_pool_size + settings.db_max_overflow),
+                settings.db_pool_size, settings.db_max_overflow)
     uvicorn.run(
         "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        loop=args.loop or _fastest("uvloop", "asyncio"),
+        http=args.http or _fastest("httptools", "h11"),
+        # Under "auto", a startup error counts as no lifespan support and the worker serves cold
+        lifespan="on",
+        timeout_graceful_shutdown=settings.server_graceful_timeout,
+        # Client addresses (rate limits, read-your-writes) come from these proxies' X-Forwarded-For
+        proxy_headers=True,
+        forwarded_allow_ips=settings.forwarded_allow_ips,
+        access_log=settings.server_access_log,
+        log_level="info",
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Shared fixtures: a throwaway SQLite database, seeded users and products,
+an HTTP client without the lifespan (no background jobs), and a fake Stripe.
+
+DATABASE_URL must be set before `app` is imported, since the engine is
+built at import time.
+"""
+import os
+import tempfile
+
+_db_dir = tempfile.mkdtemp(prefix="smartmart-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_db_dir, 'primary.db')}"
+
+from types import SimpleNamespace
+from unittest import mock
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from app.config import settings
+from app.database import Base, SessionLocal, engine
+from app.main import app
+from app.utils.catalog import catalog_version
+from app.models.product import Product
+from app.models.user import User
+from app.utils.security import create_access_token
+
+# The suite shares one client address; limits are covered by their own tests
+settings.rate_limit_enabled = False
+
+@pytest.fixture(autouse=True)
+def database():
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    # The catalog version lives in the database, which was just replaced
+    with SessionLocal() as session:
+        catalog_version.load(session)
+    yield engine
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+def _token_headers(email: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': email})}"}
+
+@pytest.fixture
+def make_users(db):
+    """Create `count` active shoppers; returns their auth headers"""
+    def make(count: int) -> list:
+        users = [
+            User(email=f"shopper{i}@example.com", username=f"shopper{i}", hashed_password="x", is_active=True)
+            for i in range(count)
+        ]
+        db.add_all(users)
+        db.commit()
+        return [_token_headers(user.email) for user in users]
+    return make
+
+@pytest.fixture
+def user_headers(make_users):
+    return make_users(1)[0]
+
+@pytest.fixture
+def admin_headers(db):
+    db.add(User(email="admin@example.com", username="admin", hashed_password="x", is_active=True, is_admin=True))
+    db.commit()
+    return _token_headers("admin@example.com")
+
+@pytest.fixture
+def products(db):
+    rows = [
+        Product(name=f"Product {i}", price=10.0 + i, category=f"Category {i % 2}",
+                stock_quantity=50, is_active=True)
+        for i in range(5)
+    ]
+    db.add_all(rows)
+    db.commit()
+    # As the app's own product writes do
+    catalog_version.load(db)
+    return [row.id for row in rows]
+
+@pytest.fixture
+def fake_stripe():
+    """Payment intents succeed; refunds and cancellations are recorded.
+
+    Set `during_payment` on the returned object to run something while a
+    PaymentIntent is being created (a concurrent cart or stock edit).
+    """
+    calls = SimpleNamespace(refunds=[], cancels=[], during_payment=None)
+    intents = iter(range(1, 1_000_000))
+    # Like Stripe, a repeated idempotency key returns the intent it created first
+    by_key = {}
+
+    def create_intent(idempotency_key=None, **kwargs):
+        if calls.during_payment:
+            calls.during_payment()
+        if idempotency_key in by_key:
+            return by_key[idempotency_key]
+        intent = SimpleNamespace(id=f"pi_test_{next(intents)}", status="succeeded")
+        if idempotency_key is not None:
+            by_key[idempotency_key] = intent
+        return intent
+
+    def retrieve_intent(intent_id, **kwargs):
+        refunded = 100 if intent_id in calls.refunds else 0
+        return SimpleNamespace(id=intent_id, status="succeeded",
+                               latest_charge=SimpleNamespace(amount_refunded=refunded))
+
+    stripe = SimpleNamespace(
+        PaymentIntent=SimpleNamespace(
+            create=create_intent,
+            retrieve=retrieve_intent,
+            cancel=lambda intent_id, **kwargs: calls.cancels.append(intent_id),
+        ),
+        Refund=SimpleNamespace(create=lambda **kwargs: calls.refunds.append(kwargs.get("payment_intent"))),
+        error=SimpleNamespace(StripeError=type("StripeError", (Exception,), {})),
+    )
+    with mock.patch("app.routers.orders.get_stripe", return_value=stripe), \
+         mock.patch("app.services.order_service.get_stripe", return_value=stripe):
+        yield calls
+
+class StatementCounter:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __len__(self):
+        return len(self.statements)
+
+@pytest.fixture
+def count_statements():
+    """Count SQL statements sent to the primary inside `with count_statements() as counter:`"""
+    class _Counting:
+        def __enter__(self):
+            self.counter = StatementCounter()
+            event.listen(engine, "before_cursor_execute", self.counter)
+            return self.counter
+
+        def __exit__(self, *exc):
+            event.remove(engine, "before_cursor_execute", self.counter)
+
+    return _Counting
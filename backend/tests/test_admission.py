@@ -0,0 +1,93 @@
+"""Checkout admission: FIFO tickets, stale places and the 429 a queued caller gets."""
+import asyncio
+import time
+from types import SimpleNamespace
+import orjson
+from app.config import settings
+from app.utils import admission
+from app.utils.admission import CheckoutAdmissionMiddleware, LocalAdmissionQueue
+
+def _admit(queue, ticket=None, seconds_per_position=1.0):
+    return asyncio.run(queue.admit(ticket, seconds_per_position))
+
+def _full_queue(limit=1):
+    queue = LocalAdmissionQueue(limit)
+    queue.active = limit
+    return queue
+
+def test_queued_callers_are_numbered_in_arrival_order():
+    queue = _full_queue()
+
+    positions = [_admit(queue).position for _ in range(3)]
+
+    assert positions == [1, 2, 3]
+
+def test_presenting_a_ticket_keeps_its_place():
+    queue = _full_queue()
+    first = _admit(queue)
+    second = _admit(queue)
+
+    assert _admit(queue, second.ticket) == (False, second.ticket, 2, None)
+    assert _admit(queue, first.ticket).position == 1
+
+    asyncio.run(queue.release(None))
+    # A free slot goes to the head of the line, not to the ticket asking first
+    assert not _admit(queue, second.ticket).admitted
+    assert _admit(queue, first.ticket).admitted
+    assert not _admit(queue).admitted
+
+def test_tickets_not_presented_in_time_are_dropped(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: clock.now, time=time.time,
+                                                           perf_counter=time.perf_counter))
+    queue = _full_queue()
+    abandoned = _admit(queue, seconds_per_position=2.0)
+    waiting = _admit(queue, seconds_per_position=2.0)
+    assert waiting.position == 2
+
+    # Past the first ticket's Retry-After plus the grace period, but not the second's
+    clock.now += settings.checkout_ticket_grace_seconds + 3.0
+    assert _admit(queue, waiting.ticket, 2.0).position == 1
+    assert abandoned.ticket not in queue.queue
+
+def test_queued_checkout_gets_a_429_with_its_ticket():
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+
+    async def run():
+        middleware = CheckoutAdmissionMiddleware(app, _full_queue())
+        middleware.average_seconds = 4.0
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {"type": "http", "method": "POST", "path": "/orders/", "headers": []}
+        await middleware(scope, None, send)
+        await middleware(scope, None, send)
+        return sent
+
+    sent = asyncio.run(run())
+
+    assert calls == []
+    start, body = sent[2], orjson.loads(sent[3]["body"])
+    headers = dict(start["headers"])
+    assert start["status"] == 429
+    assert (body["position"], body["retry_after"]) == (2, 8)
+    assert headers[b"retry-after"] == b"8"
+    assert headers[b"x-checkout-ticket"].decode() == body["ticket"]
+
+def test_admitted_checkout_releases_its_slot():
+    queue = LocalAdmissionQueue(1)
+    calls = []
+
+    async def app(scope, receive, send):
+        calls.append(queue.active)
+
+    scope = {"type": "http", "method": "POST", "path": "/orders/", "headers": []}
+    asyncio.run(CheckoutAdmissionMiddleware(app, queue)(scope, None, None))
+
+    assert calls == [1]
+    assert queue.active == 0
@@ -0,0 +1,79 @@
+"""Add-to-cart and checkout: statement budgets and overselling under concurrency."""
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from app.models.cart import CartItem
+from app.models.product import Product
+
+CHECKOUT = {"shipping_address": "1 Test Street", "payment_method_id": "pm_card_visa"}
+
+def _fill_cart(client, headers, product_ids):
+    for product_id in product_ids:
+        response = client.post("/cart/", json={"product_id": product_id, "quantity": 1}, headers=headers)
+        assert response.status_code == 200, response.text
+
+def test_add_to_cart_is_one_upsert(client, user_headers, products, count_statements):
+    _fill_cart(client, user_headers, products[:1])
+
+    with count_statements() as counter:
+        response = client.post("/cart/", json={"product_id": products[0], "quantity": 2}, headers=user_headers)
+
+    assert response.status_code == 200
+    assert response.json()["quantity"] == 3
+    cart_writes = [s for s in counter.statements if s.lstrip().upper().startswith(("INSERT INTO CART_ITEMS", "UPDATE CART_ITEMS"))]
+    assert len(cart_writes) == 1
+    assert len(counter) <= 8
+
+def test_cart_and_checkout_statements_do_not_grow_with_the_cart(client, make_users, products, count_statements, fake_stripe):
+    small, large = make_users(2)
+    counts = {}
+    for name, headers, lines in (("small", small, products[:1]), ("large", large, products)):
+        _fill_cart(client, headers, lines)
+        with count_statements() as reading:
+            assert len(client.get("/cart/", headers=headers).json()) == len(lines)
+        with count_statements() as checkout:
+            response = client.post("/orders/", json=CHECKOUT, headers=headers)
+        assert response.status_code == 200, response.text
+        assert len(response.json()["order_items"]) == len(lines)
+        counts[name] = (len(reading), len(checkout))
+
+    assert counts["small"] == counts["large"]
+
+def test_concurrent_add_to_cart_never_oversells(client, make_users, db):
+    stock = 5
+    product = Product(name="Scarce", price=99.0, category="Limited", stock_quantity=stock, is_active=True)
+    db.add(product)
+    db.commit()
+    shoppers = make_users(4 * stock)
+    start = threading.Barrier(len(shoppers))
+
+    def add(headers):
+        start.wait()
+        return client.post("/cart/", json={"product_id": product.id, "quantity": 1}, headers=headers).status_code
+
+    with ThreadPoolExecutor(max_workers=len(shoppers)) as pool:
+        statuses = list(pool.map(add, shoppers))
+
+    assert statuses.count(200) == stock
+    assert set(statuses) == {200, 400}
+    db.expire_all()
+    in_carts = db.query(func.coalesce(func.sum(CartItem.quantity), 0)).filter(CartItem.product_id == product.id).scalar()
+    assert in_carts == stock
+    assert db.get(Product, product.id).reserved_quantity == stock
+
+def test_checkout_payment_runs_off_the_event_loop(client, user_headers, products, fake_stripe):
+    _fill_cart(client, user_headers, products[:1])
+    loops = []
+
+    def running_loop():
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+
+    fake_stripe.during_payment = running_loop
+    assert client.post("/orders/", json=CHECKOUT, headers=user_headers).status_code == 200
+
+    # Stripe was called from a worker thread, not from a coroutine on the loop
+    assert loops == [None]
@@ -0,0 +1,73 @@
+"""Bulk cart edits and cart merges: folding, all-or-nothing batches and set-based merging."""
+import asyncio
+import pytest
+from fastapi import HTTPException
+from app.models.cart import CartItem
+from app.models.product import Product
+from app.models.user import User
+from app.schemas.cart import CartBulkOperation
+from app.services.cart_service import CartService
+
+def _op(op: str, product_id: int, quantity: int = 1) -> CartBulkOperation:
+    return CartBulkOperation(op=op, product_id=product_id, quantity=quantity)
+
+def _bulk(client, headers, *operations):
+    return client.post("/cart/bulk", json={"operations": [operation.model_dump() for operation in operations]},
+                       headers=headers)
+
+def _cart(client, headers) -> dict:
+    return {line["product_id"]: line["quantity"] for line in client.get("/cart/", headers=headers).json()}
+
+def test_operations_fold_into_one_target_per_product(db):
+    fold = CartService(db)._fold_operations
+    assert fold([_op("add", 1, 2), _op("add", 1, 3)]) == {1: ("add", 5)}
+    assert fold([_op("add", 1, 2), _op("update", 1, 7), _op("add", 1, 1)]) == {1: ("set", 8)}
+    assert fold([_op("add", 1, 2), _op("remove", 1)]) == {1: ("remove", 0)}
+    # Adding after a remove starts from an empty line
+    assert fold([_op("remove", 1), _op("add", 1, 4)]) == {1: ("set", 4)}
+    assert fold([_op("add", 1), _op("update", 2, 3)]) == {1: ("add", 1), 2: ("set", 3)}
+
+def test_negative_quantities_are_rejected(db):
+    with pytest.raises(HTTPException) as rejected:
+        CartService(db)._fold_operations([_op("add", 1, -1)])
+    assert rejected.value.status_code == 400
+
+def test_bulk_applies_adds_updates_and_removes(client, user_headers, products, db):
+    for product_id in products[:2]:
+        client.post("/cart/", json={"product_id": product_id, "quantity": 2}, headers=user_headers)
+
+    response = _bulk(client, user_headers,
+                     _op("add", products[0], 3), _op("remove", products[1]),
+                     _op("update", products[2], 4), _op("add", products[3], 0))
+
+    assert response.status_code == 200, response.text
+    assert _cart(client, user_headers) == {products[0]: 5, products[2]: 4}
+    held = dict(db.query(Product.id, Product.reserved_quantity).filter(Product.id.in_(products[:3])).all())
+    assert held == {products[0]: 5, products[1]: 0, products[2]: 4}
+
+def test_stock_shortfall_rejects_the_whole_batch(client, user_headers, products, db):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 2}, headers=user_headers)
+
+    response = _bulk(client, user_headers,
+                     _op("add", products[0], 1), _op("add", products[1], 1), _op("add", products[2], 51))
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Only 50 items of 'Product 2' available in stock"
+    assert _cart(client, user_headers) == {products[0]: 2}
+    db.expire_all()
+    assert db.get(Product, products[1]).reserved_quantity == 0
+
+def test_merge_adds_to_existing_lines(client, make_users, products, db):
+    guest, member = make_users(2)
+    for headers, lines in ((guest, {products[0]: 2, products[1]: 1}), (member, {products[0]: 3})):
+        for product_id, quantity in lines.items():
+            client.post("/cart/", json={"product_id": product_id, "quantity": quantity}, headers=headers)
+    guest_id, member_id = (db.query(User.id).filter(User.email == f"shopper{i}@example.com").scalar() for i in (0, 1))
+
+    assert asyncio.run(CartService(db).merge_carts(guest_id, member_id))
+
+    assert _cart(client, member) == {products[0]: 5, products[1]: 1}
+    assert db.query(CartItem).filter(CartItem.user_id == guest_id).count() == 0
+    db.expire_all()
+    assert db.get(Product, products[0]).reserved_quantity == 5
+    assert db.get(Product, products[1]).reserved_quantity == 1
@@ -0,0 +1,70 @@
+"""Conditional GETs on the catalog endpoints."""
+from datetime import datetime, timezone
+from app.config import settings
+from app.models.product import Product
+from app.utils.catalog import CatalogVersion, catalog_version
+
+def test_matching_etag_is_not_modified(client, products):
+    first = client.get(f"/products/{products[0]}")
+    assert first.status_code == 200
+
+    again = client.get(f"/products/{products[0]}", headers={"If-None-Match": first.headers["ETag"]})
+    assert again.status_code == 304
+
+def test_etag_does_not_answer_for_a_missing_product(client, products):
+    listing = client.get("/products/")
+    product = client.get(f"/products/{products[0]}")
+
+    for etag in (listing.headers["ETag"], product.headers["ETag"], "*"):
+        response = client.get("/products/999999", headers={"If-None-Match": etag})
+        assert response.status_code == 404
+    assert client.get(f"/products/{products[1]}", headers={"If-None-Match": product.headers["ETag"]}).status_code == 200
+
+def test_write_retires_etag(client, products, admin_headers):
+    etag = client.get(f"/products/{products[0]}").headers["ETag"]
+
+    assert client.put(f"/products/{products[0]}", json={"price": 1.5}, headers=admin_headers).status_code == 200
+
+    response = client.get(f"/products/{products[0]}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["price"] == 1.5
+
+def test_workers_and_restarts_share_etags(client, products, admin_headers, db):
+    # Another worker, or this one after a restart, reads the same version from the database
+    other_worker = CatalogVersion()
+    etag = client.get("/products/").headers["ETag"]
+    assert other_worker.etag == etag
+
+    assert client.put(f"/products/{products[0]}", json={"price": 2.5}, headers=admin_headers).status_code == 200
+    assert client.get("/products/").headers["ETag"] != etag
+
+    # What a "product" invalidation event does in the other worker
+    other_worker.load(db)
+    assert other_worker.etag == client.get("/products/").headers["ETag"]
+
+def test_cart_holds_keep_catalog_etags(client, user_headers, products, db, monkeypatch):
+    monkeypatch.setattr(settings, "catalog_stock_refresh_seconds", 0)
+    # Older than any timestamp a write in this test could leave behind
+    long_ago = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    db.query(Product).update({Product.created_at: long_ago, Product.updated_at: long_ago})
+    db.commit()
+    catalog_version.load(db)
+    etag = client.get("/products/").headers["ETag"]
+
+    assert client.post("/cart/", json={"product_id": products[0], "quantity": 3}, headers=user_headers).status_code == 200
+    catalog_version.stock_changed()
+
+    assert client.get("/products/", headers={"If-None-Match": etag}).status_code == 304
+
+def test_stock_changes_retire_product_etags_but_not_category_etags(client, user_headers, products, fake_stripe,
+                                                                    monkeypatch):
+    monkeypatch.setattr(settings, "catalog_stock_refresh_seconds", 0)
+    listing = client.get("/products/").headers["ETag"]
+    categories = client.get("/products/categories/").headers["ETag"]
+
+    assert client.post("/cart/", json={"product_id": products[0], "quantity": 3}, headers=user_headers).status_code == 200
+    checkout = {"shipping_address": "1 Test Street", "payment_method_id": "pm_card_visa"}
+    assert client.post("/orders/", json=checkout, headers=user_headers).status_code == 200
+
+    assert client.get("/products/", headers={"If-None-Match": listing}).status_code == 200
+    assert client.get("/products/categories/", headers={"If-None-Match": categories}).status_code == 304
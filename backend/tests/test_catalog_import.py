@@ -0,0 +1,70 @@
+"""Bulk catalog import: per-row errors instead of failed requests."""
+from app.config import settings
+from app.models.product import Product
+
+def _import(client, headers, body: str, fmt: str = "ndjson"):
+    return client.post(f"/products/import?format={fmt}", content=body.encode(), headers=headers)
+
+def test_ndjson_rows_that_are_not_objects_are_row_errors(client, admin_headers):
+    body = "\n".join(['5', 'null', '"text"', '[1, 2]', '{"name": "Lamp", "price": 12.5}', '{bad json'])
+
+    response = _import(client, admin_headers, body)
+
+    assert response.status_code == 200
+    report = response.json()
+    assert (report["inserted"], report["failed"]) == (1, 5)
+    assert [error["line"] for error in report["errors"]] == [1, 2, 3, 4, 6]
+
+def test_csv_rows_with_extra_fields_are_row_errors(client, admin_headers):
+    body = "name,price\nLamp,12.5\nDesk,80,surplus\n"
+
+    report = _import(client, admin_headers, body, "csv").json()
+
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["line"] == 3
+
+def test_bad_id_is_a_row_error(client, admin_headers, products):
+    report = _import(client, admin_headers, f'{{"id": [1], "price": 3}}\n{{"id": {products[0]}, "price": 3}}').json()
+
+    assert (report["updated"], report["failed"]) == (1, 1)
+
+def test_partial_update_keeps_other_columns(client, admin_headers, products, db):
+    report = _import(client, admin_headers, f'{{"id": {products[0]}, "price": 99.0}}').json()
+
+    assert report["updated"] == 1
+    product = db.get(Product, products[0])
+    assert (product.name, product.price, product.stock_quantity) == ("Product 0", 99.0, 50)
+
+def test_update_only_needs_the_changed_columns(client, admin_headers, products, db):
+    report = _import(client, admin_headers, f"id,category\n{products[1]},Lighting\n", "csv").json()
+
+    assert (report["updated"], report["failed"]) == (1, 0)
+    assert db.get(Product, products[1]).category == "Lighting"
+
+def test_oversized_upload_is_rejected(client, admin_headers, monkeypatch):
+    monkeypatch.setattr(settings, "product_import_max_bytes", 64)
+
+    response = _import(client, admin_headers, '{"name": "Lamp", "price": 12.5}\n' * 10)
+
+    assert response.status_code == 413
+
+def test_unknown_id_inserts_a_product_with_that_id(client, admin_headers, products, db):
+    body = '{"id": 900, "name": "Lamp", "price": 12.5, "stock_quantity": 4}\n{"id": 901, "price": 3}'
+
+    report = _import(client, admin_headers, body).json()
+
+    assert (report["inserted"], report["failed"]) == (1, 1)
+    assert report["errors"][0]["line"] == 2
+    product = db.get(Product, 900)
+    assert (product.name, product.price, product.stock_quantity) == ("Lamp", 12.5, 4)
+    assert db.get(Product, 901) is None
+
+def test_export_imports_into_an_empty_catalog(client, admin_headers, products, db):
+    exported = client.get("/products/export?format=ndjson", headers=admin_headers).text
+    db.query(Product).delete()
+    db.commit()
+
+    report = _import(client, admin_headers, exported).json()
+
+    assert (report["inserted"], report["failed"]) == (len(products), 0)
+    assert sorted(id for id, in db.query(Product.id)) == sorted(products)
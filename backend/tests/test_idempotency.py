@@ -0,0 +1,101 @@
+"""Idempotency-Key replays and waits for order creation."""
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from app.config import settings
+from app.models.idempotency import IdempotencyKey
+from app.models.order import Order
+from app.utils import idempotency
+
+CHECKOUT = {"shipping_address": "1 Test Street", "payment_method_id": "pm_card_visa"}
+
+def _checkout(client, headers, key, body=CHECKOUT):
+    return client.post("/orders/", json=body, headers={**headers, "Idempotency-Key": key})
+
+def test_retry_replays_the_stored_order(client, products, user_headers, fake_stripe):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 1}, headers=user_headers)
+
+    first = _checkout(client, user_headers, "order-1")
+    retry = _checkout(client, user_headers, "order-1")
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["id"] == first.json()["id"]
+
+def test_key_reused_with_another_body_is_rejected(client, products, user_headers, fake_stripe):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 1}, headers=user_headers)
+    _checkout(client, user_headers, "order-1")
+
+    response = _checkout(client, user_headers, "order-1", {**CHECKOUT, "shipping_address": "Elsewhere"})
+
+    assert response.status_code == 422
+
+def test_duplicate_of_a_running_request_gives_up_at_the_deadline(client, user_headers, db, monkeypatch):
+    monkeypatch.setattr(settings, "idempotency_wait_seconds", 0.3)
+    now = datetime.now(timezone.utc)
+    # Claimed by a request in another worker that is still running
+    db.add(IdempotencyKey(
+        owner="shopper0@example.com", method="POST", path="/orders/", key="order-1",
+        request_hash=hashlib.sha256(json.dumps(CHECKOUT).encode()).hexdigest(),
+        locked_until=now + timedelta(minutes=5), expires_at=now + timedelta(hours=1),
+    ))
+    db.commit()
+
+    response = client.post("/orders/", content=json.dumps(CHECKOUT),
+                           headers={**user_headers, "Idempotency-Key": "order-1", "Content-Type": "application/json"})
+
+    assert response.status_code == 409
+    assert response.headers["Retry-After"] == "1"
+
+def test_lost_claim_race_polls_until_the_deadline(client, user_headers, monkeypatch):
+    monkeypatch.setattr(settings, "idempotency_wait_seconds", 0.3)
+    # Every insert loses to a concurrent claim whose row is not visible yet
+    with mock.patch.object(idempotency, "_claim", return_value=(False, None)) as claim:
+        response = _checkout(client, user_headers, "order-1")
+
+    assert response.status_code == 409
+    assert claim.call_count <= 0.3 / idempotency.POLL_INTERVAL + 2
+
+def _fail_order_write_once(monkeypatch):
+    """The charge succeeds, then writing the order hits an unexpected error"""
+    from app.routers import orders
+
+    stage = orders.stage_order_event
+    failures = iter([RuntimeError("database went away")])
+
+    def flaky_stage(db, order):
+        failure = next(failures, None)
+        if failure is not None:
+            raise failure
+        stage(db, order)
+
+    monkeypatch.setattr(orders, "stage_order_event", flaky_stage)
+
+def test_retry_after_a_refunded_failure_does_not_confirm_an_order(client, products, user_headers,
+                                                                  fake_stripe, db, monkeypatch):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 1}, headers=user_headers)
+    _fail_order_write_once(monkeypatch)
+
+    first = _checkout(client, user_headers, "order-1")
+    retry = _checkout(client, user_headers, "order-1")
+
+    assert first.status_code == retry.status_code == 500
+    assert "Idempotency-Final" not in first.headers
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert fake_stripe.refunds == ["pi_test_1"]
+    assert db.query(Order).count() == 0
+
+def test_replayed_refunded_intent_is_rejected(client, products, user_headers, fake_stripe, db, monkeypatch):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 1}, headers=user_headers)
+    _fail_order_write_once(monkeypatch)
+    _checkout(client, user_headers, "order-1")
+    # The stored outcome has gone (expired and swept); Stripe still replays the intent
+    db.query(IdempotencyKey).delete()
+    db.commit()
+
+    retry = _checkout(client, user_headers, "order-1")
+
+    assert retry.status_code == 409
+    assert fake_stripe.refunds == ["pi_test_1"]
+    assert db.query(Order).count() == 0
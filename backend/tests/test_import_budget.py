@@ -0,0 +1,18 @@
+"""Cold-import budget for app.main, measured with -X importtime in a fresh interpreter."""
+import subprocess
+import sys
+from benchmarks.import_budget import DEFAULT_BUDGET_MS, LAZY_MODULES, measure
+
+RUNS = 3
+
+def test_import_app_main_stays_within_budget():
+    # The best of a few runs, so a busy machine does not fail the check
+    best_ms = min(measure()[0] for _ in range(RUNS)) / 1000
+    assert 0 < best_ms <= DEFAULT_BUDGET_MS, f"import app.main took {best_ms:.0f} ms"
+
+def test_sdks_are_not_imported_with_the_app():
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, app.main; print(' '.join(sorted(sys.modules)))"],
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    assert [module for module in LAZY_MODULES if module in loaded] == []
@@ -0,0 +1,66 @@
+"""Invalidation bus: two workers stood in for by two buses on one loopback hub."""
+import asyncio
+from app.utils.invalidation import InvalidationBus, LoopbackTransport
+from app.utils.metrics import cache_invalidation_propagation
+
+def _propagation_samples(entity: str) -> int:
+    series = cache_invalidation_propagation._values.get((entity,))
+    return sum(series[:-1]) if series else 0
+
+async def _until(condition, timeout: float = 2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "event was not applied in time"
+        await asyncio.sleep(0.01)
+
+def _workers(calls: list):
+    """Two buses, each with a plain handler and an `own` handler that log (worker, kind, ids)"""
+    buses = []
+    for name in ("writer", "other"):
+        bus = InvalidationBus()
+        bus.on("widget")(lambda ids, name=name: calls.append((name, "plain", ids)))
+        bus.on("widget", own=True)(lambda ids, name=name: calls.append((name, "own", ids)))
+        buses.append(bus)
+    return buses
+
+def test_events_reach_other_workers_and_own_handlers():
+    calls = []
+
+    async def run():
+        hub = []
+        writer, other = _workers(calls)
+        await writer.start(LoopbackTransport(hub))
+        await other.start(LoopbackTransport(hub))
+        before = _propagation_samples("widget")
+        try:
+            writer.publish("widget", [3, 1])
+            await _until(lambda: len(calls) == 3)
+            # Only the other worker's application counts as propagation
+            await _until(lambda: _propagation_samples("widget") == before + 1)
+        finally:
+            await writer.stop()
+            await other.stop()
+
+    asyncio.run(run())
+
+    assert sorted(calls) == [
+        ("other", "own", [3, 1]),
+        ("other", "plain", [3, 1]),
+        ("writer", "own", [3, 1]),
+    ]
+
+def test_resync_invalidates_everything():
+    calls = []
+
+    async def run():
+        (bus, _) = _workers(calls)
+        await bus.start(LoopbackTransport())
+        try:
+            bus._resync()
+            await _until(lambda: len(calls) == 2)
+        finally:
+            await bus.stop()
+
+    asyncio.run(run())
+
+    assert sorted(calls) == [("writer", "own", None), ("writer", "plain", None)]
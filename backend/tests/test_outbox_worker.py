@@ -0,0 +1,37 @@
+"""The standalone outbox worker delivers events staged by checkout."""
+import os
+import subprocess
+import sys
+import time
+from app.models.outbox import OutboxEvent
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHECKOUT = {"shipping_address": "1 Test Street", "payment_method_id": "pm_card_visa"}
+
+def test_standalone_worker_dispatches_pending_events(client, products, user_headers, fake_stripe, db):
+    client.post("/cart/", json={"product_id": products[0], "quantity": 1}, headers=user_headers)
+    assert client.post("/orders/", json=CHECKOUT, headers=user_headers).status_code == 200
+    assert db.query(OutboxEvent).filter(OutboxEvent.processed_at.is_(None)).count() == 1
+
+    # Inherits DATABASE_URL, so it drains the test database
+    worker = subprocess.Popen(
+        [sys.executable, "-m", "app.outbox_worker"], cwd=BACKEND_DIR,
+        env={**os.environ, "OUTBOX_POLL_SECONDS": "0.1"},
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True,
+    )
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline and worker.poll() is None:
+            db.expire_all()
+            event = db.query(OutboxEvent).one()
+            if event.processed_at is not None or event.attempts:
+                break
+            time.sleep(0.1)
+    finally:
+        worker.terminate()
+        output = worker.communicate(timeout=10)[0]
+
+    assert event.event_type == "order.created"
+    assert event.processed_at is not None, output
+    assert event.last_error is None
+    assert "placed by user" in output
@@ -0,0 +1,39 @@
+"""Opt-in request profiling and profile retention."""
+import os
+import time
+import pytest
+from app.config import settings
+from app.utils.profiling import _sweep_artifacts
+
+@pytest.fixture
+def profile_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "profile_dir", str(tmp_path))
+    return tmp_path
+
+def test_admin_request_is_profiled(client, products, admin_headers, profile_dir):
+    response = client.get("/products/?profile=1", headers=admin_headers)
+
+    profile_id = response.headers["X-Profile-ID"]
+    assert sorted(os.listdir(profile_dir)) == [f"{profile_id}.folded", f"{profile_id}.json"]
+    assert client.get(f"/profiles/{profile_id}", headers=admin_headers).json()["sql_count"] >= 1
+
+def test_shopper_request_is_not_profiled(client, products, user_headers, profile_dir):
+    response = client.get("/products/?profile=1", headers=user_headers)
+
+    assert response.status_code == 200
+    assert "X-Profile-ID" not in response.headers
+    assert not os.listdir(profile_dir)
+
+def test_sweep_keeps_newest_profiles_within_age(profile_dir, monkeypatch):
+    monkeypatch.setattr(settings, "profile_max_files", 2)
+    monkeypatch.setattr(settings, "profile_max_age_hours", 1)
+    now = time.time()
+    for profile_id, age in (("old", 7200), ("a", 30), ("b", 20), ("c", 10)):
+        for suffix in (".json", ".folded"):
+            path = profile_dir / f"{profile_id}{suffix}"
+            path.write_text("x")
+            os.utime(path, (now - age, now - age))
+
+    _sweep_artifacts()
+
+    assert sorted(os.listdir(profile_dir)) == ["b.folded", "b.json", "c.folded", "c.json"]
@@ -0,0 +1,90 @@
+"""Rate limit callers: token subjects, and the client address once a token is invalid or expired."""
+import asyncio
+import time
+from datetime import timedelta
+from app.config import settings
+from app.utils import security
+from app.utils.rate_limit import Limit, RateLimitMiddleware, _gcra, caller
+from app.utils.security import create_access_token
+
+SCOPE = {"client": ("10.0.0.7", 5000)}
+
+def _headers(token: str) -> dict:
+    return {b"authorization": f"Bearer {token}".encode()}
+
+def test_callers_are_token_subjects_or_addresses():
+    token = create_access_token({"sub": "shopper@example.com"})
+    assert caller(SCOPE, _headers(token)) == "user:shopper@example.com"
+    assert caller(SCOPE, _headers("not-a-jwt")) == "ip:10.0.0.7"
+    assert caller(SCOPE, {}) == "ip:10.0.0.7"
+
+def test_auth_routes_count_by_address_even_with_a_token():
+    token = create_access_token({"sub": "shopper@example.com"})
+    assert caller(SCOPE, _headers(token), "auth") == "ip:10.0.0.7"
+
+def test_expired_tokens_are_not_served_from_the_cache(monkeypatch):
+    token = create_access_token({"sub": "brief@example.com"}, expires_delta=timedelta(seconds=-1))
+    # Cached while it was still valid
+    monkeypatch.setitem(security._bearer_subjects, token, ("brief@example.com", time.time() - 1))
+
+    assert caller(SCOPE, _headers(token)) == "ip:10.0.0.7"
+    assert token not in security._bearer_subjects
+
+def test_gcra_spreads_the_limit_over_its_period():
+    limit = Limit(2, 1.0)
+
+    allowed, tat, first = _gcra(None, 0.0, limit)
+    assert (allowed, first.remaining, first.reset) == (True, 1, 0.5)
+    allowed, tat, second = _gcra(tat, 0.0, limit)
+    assert (allowed, second.remaining, second.reset) == (True, 0, 1.0)
+
+    allowed, kept, rejected = _gcra(tat, 0.0, limit)
+    assert not allowed and kept == tat
+    assert (rejected.remaining, rejected.retry_after) == (0, 0.5)
+
+    # Half a period later one request's worth has drained
+    assert _gcra(tat, 0.5, limit)[0]
+
+def _login_attempts(count: int, monkeypatch) -> list:
+    monkeypatch.setattr(settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(settings, "rate_limit_auth", "2/minute")
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def run():
+        middleware = RateLimitMiddleware(app)
+        starts = []
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                starts.append((message["status"], dict(message["headers"])))
+
+        for n in range(count):
+            token = create_access_token({"sub": f"shopper{n}@example.com"})
+            await middleware({
+                "type": "http", "method": "POST", "path": "/auth/login", "query_string": b"",
+                "client": ("10.0.0.7", 5000), "headers": [(b"authorization", f"Bearer {token}".encode())],
+            }, None, send)
+        return starts
+
+    return asyncio.run(run())
+
+def test_allowed_responses_carry_ratelimit_headers(monkeypatch):
+    (status, headers), = _login_attempts(1, monkeypatch)
+
+    assert status == 200
+    assert headers[b"ratelimit-limit"] == b"2"
+    assert headers[b"ratelimit-remaining"] == b"1"
+    assert headers[b"ratelimit-reset"] == b"30"
+    assert headers[b"ratelimit-policy"] == b"2;w=60"
+
+def test_callers_over_the_limit_get_a_429_with_retry_after(monkeypatch):
+    # A different token each time; logins are still counted per address
+    statuses = _login_attempts(3, monkeypatch)
+
+    assert [status for status, _ in statuses] == [200, 200, 429]
+    headers = statuses[2][1]
+    assert headers[b"retry-after"] == b"30"
+    assert headers[b"ratelimit-remaining"] == b"0"
@@ -0,0 +1,49 @@
+"""Co-purchase recommendations: orders recorded while a rebuild runs are counted once."""
+from sqlalchemy import event
+from app.models.order import Order, OrderItem, OrderStatus
+from app.models.user import User
+from app.utils.recommender import CoPurchaseRecommender
+
+def _order(db, product_ids) -> int:
+    order = Order(user_id=db.query(User.id).scalar(), total_amount=10.0, status=OrderStatus.CONFIRMED)
+    db.add(order)
+    db.flush()
+    db.add_all(OrderItem(order_id=order.id, product_id=product_id, quantity=1, price=1.0) for product_id in product_ids)
+    db.commit()
+    return order.id
+
+def _rebuild(recommender, db, during_query=lambda: None):
+    """Rebuild, running `during_query` after the rebuild started tracking orders but before it reads them"""
+    pending = [during_query]
+
+    def before(orm_execute_state):
+        if pending and OrderItem in [mapper.class_ for mapper in orm_execute_state.all_mappers]:
+            pending.pop()()
+    event.listen(db, "do_orm_execute", before)
+    try:
+        recommender.rebuild(db)
+    finally:
+        event.remove(db, "do_orm_execute", before)
+
+def test_rebuild_does_not_double_count_orders_recorded_during_it(db, user_headers, products):
+    recommender = CoPurchaseRecommender(top_n=5)
+    _order(db, products[:2])
+    racing = _order(db, products[:2])
+
+    # Committed before the query read the orders, recorded just after the rebuild began
+    _rebuild(recommender, db, lambda: recommender.record(racing, products[:2]))
+
+    assert recommender.related(products[0]) == [(products[1], 2.0)]
+
+def test_rebuild_keeps_changes_the_query_did_not_see(db, user_headers, products):
+    recommender = CoPurchaseRecommender(top_n=5)
+    cancelled = _order(db, products[:2])
+    _order(db, products[:2])
+
+    # Cancelled after the query read it as a sale
+    _rebuild(recommender, db, lambda: recommender.record(cancelled, products[:2], sign=-1))
+    assert recommender.related(products[0]) == [(products[1], 1.0)]
+
+    # Confirmed after the rebuild
+    recommender.record(10_000, products[:2])
+    assert recommender.related(products[0]) == [(products[1], 2.0)]
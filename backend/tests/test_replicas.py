@@ -0,0 +1,158 @@
+"""Read routing between the primary and a read replica, with a second SQLite file as the replica."""
+import asyncio
+import time
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import database
+from app.database import Base
+from app.models.cart import CartItem
+from app.models.product import Product
+from app.main import app
+from app.models.user import User
+from app.utils.catalog import catalog_version
+from app.utils import replicas
+from app.utils.replicas import STICKY_COOKIE, ReadYourWritesMiddleware
+
+# Only the replica has this cart line, so a cart read tells which database served it
+REPLICA_QUANTITY = 9
+
+@pytest.fixture
+def replica_file(tmp_path, db, user_headers, products):
+    """A replica that lags behind: same user and catalog, plus a cart line the primary lacks"""
+    replica_engine = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(replica_engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+    user = db.query(User).filter(User.email == "shopper0@example.com").one()
+    with Session() as replica:
+        replica.add(User(id=user.id, email=user.email, username=user.username, hashed_password="x", is_active=True))
+        for product in db.query(Product).all():
+            replica.add(Product(id=product.id, name=product.name, price=product.price,
+                                category=product.category, stock_quantity=product.stock_quantity, is_active=True))
+        replica.add(CartItem(user_id=user.id, product_id=products[0], quantity=REPLICA_QUANTITY))
+        replica.commit()
+    yield replica_engine, Session
+    replica_engine.dispose()
+
+def _forget_writers():
+    """Clear the writers remembered by the app's middleware, which outlives each test"""
+    layer = app.middleware_stack
+    while layer is not None:
+        if isinstance(layer, ReadYourWritesMiddleware):
+            layer.recent_writers.clear()
+        layer = getattr(layer, "app", None)
+
+@pytest.fixture
+def replica(monkeypatch, replica_file, client):
+    replica_engine, Session = replica_file
+    # The stack is built on the first request
+    client.get("/health")
+    _forget_writers()
+    monkeypatch.setattr(database, "replica_engine", replica_engine)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", Session)
+    monkeypatch.setattr(database, "replica_ok", True)
+    return replica_engine
+
+def _cart_quantities(client, headers, **kwargs) -> list:
+    response = client.get("/cart/", headers=headers, **kwargs)
+    assert response.status_code == 200, response.text
+    return [line["quantity"] for line in response.json()]
+
+def test_reads_without_a_recent_write_use_the_replica(client, user_headers, replica):
+    assert _cart_quantities(client, user_headers) == [REPLICA_QUANTITY]
+
+def test_reads_after_a_write_use_the_primary(client, user_headers, products, replica):
+    response = client.post("/cart/", json={"product_id": products[1], "quantity": 1}, headers=user_headers)
+    assert response.status_code == 200, response.text
+    assert STICKY_COOKIE in response.headers["set-cookie"]
+
+    assert _cart_quantities(client, user_headers) == [1]
+
+def test_read_your_writes_cookie_pins_reads_to_the_primary(client, user_headers, replica):
+    # A write handled by another worker: only the cookie says the caller just wrote
+    client.cookies.set(STICKY_COOKIE, f"{time.time() + 60:.0f}")
+    assert _cart_quantities(client, user_headers) == []
+
+    client.cookies.set(STICKY_COOKIE, f"{time.time() - 60:.0f}")
+    assert _cart_quantities(client, user_headers) == [REPLICA_QUANTITY]
+
+def test_lagging_replica_is_taken_out_of_rotation(client, user_headers, replica, monkeypatch):
+    monkeypatch.setattr(database, "replica_ok", False)
+    assert _cart_quantities(client, user_headers) == []
+
+def test_without_a_replica_everything_uses_the_primary(client, user_headers, products, replica_file):
+    assert database.replica_engine is None
+    assert _cart_quantities(client, user_headers) == []
+
+    response = client.post("/cart/", json={"product_id": products[1], "quantity": 1}, headers=user_headers)
+    assert response.status_code == 200, response.text
+    assert "set-cookie" not in response.headers
+    assert _cart_quantities(client, user_headers) == [1]
+
+def test_writers_that_never_read_again_are_swept(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(replicas, "time", SimpleNamespace(monotonic=lambda: clock.now, time=time.time))
+    monkeypatch.setattr(database, "replica_engine", object())
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def send(message):
+        pass
+
+    middleware = ReadYourWritesMiddleware(app)
+
+    def post_from(address):
+        scope = {"type": "http", "method": "POST", "path": "/auth/register", "headers": [], "client": (address, 1)}
+        asyncio.run(middleware(scope, None, send))
+
+    for n in range(50):
+        post_from(f"10.0.0.{n}")
+    assert len(middleware.recent_writers) == 50
+
+    clock.now += replicas.SWEEP_SECONDS
+    post_from("10.0.1.1")
+    assert list(middleware.recent_writers) == ["10.0.1.1"]
+
+class _ReplayingReplica:
+    """Stands in for a Postgres replica engine that reports a replay position"""
+
+    def __init__(self, lsn: int):
+        self.lsn = lsn
+        self.dialect = SimpleNamespace(name="postgresql")
+
+    def connect(self):
+        replica = self
+
+        class Connection:
+            dialect = replica.dialect
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                return False
+
+            def execute(self, statement):
+                return SimpleNamespace(scalar=lambda: replica.lsn)
+
+        return Connection()
+
+def test_catalog_reads_wait_for_the_replica_to_replay_the_version(client, products, replica, replica_file, monkeypatch):
+    _, Session = replica_file
+    with Session() as session:
+        session.query(Product).filter(Product.id == products[0]).update({"name": "Replica copy"})
+        session.commit()
+    engine = _ReplayingReplica(lsn=50)
+    monkeypatch.setattr(database, "replica_engine", engine)
+    monkeypatch.setattr(replicas, "_replayed_lsn", 0)
+    monkeypatch.setattr(catalog_version, "lsn", 100)
+
+    assert client.get(f"/products/{products[0]}").json()["name"] == "Product 0"
+
+    engine.lsn = 120
+    assert client.get(f"/products/{products[0]}").json()["name"] == "Replica copy"
+    # Known to be caught up now; the replica is not asked again
+    engine.lsn = 0
+    assert client.get(f"/products/{products[0]}").json()["name"] == "Replica copy"
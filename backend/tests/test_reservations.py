@@ -0,0 +1,98 @@
+"""Cart holds: available-to-promise checks, stock cuts and checkout conversion."""
+from datetime import datetime, timedelta, timezone
+from app.database import SessionLocal
+from app.models.cart import CartItem
+from app.models.order import OrderItem
+from app.models.product import Product
+from app.models.reservation import InventoryReservation
+from app.models.user import User
+from app.services.reservation_service import sweep_expired
+from app.utils.invalidation import invalidation_bus
+
+CHECKOUT = {"shipping_address": "1 Test Street", "payment_method_id": "pm_card_visa"}
+
+def _add(client, headers, product_id, quantity):
+    return client.post("/cart/", json={"product_id": product_id, "quantity": quantity}, headers=headers)
+
+def _set_stock(product_id: int, stock: int):
+    """A stock edit committed by someone else"""
+    db = SessionLocal()
+    try:
+        db.get(Product, product_id).stock_quantity = stock
+        db.commit()
+    finally:
+        db.close()
+
+def test_update_counts_other_carts_holds(client, make_users, products, db):
+    first, second = make_users(2)
+    _set_stock(products[0], 5)
+    assert _add(client, first, products[0], 4).status_code == 200
+    line = _add(client, second, products[0], 1).json()
+
+    too_many = client.put(f"/cart/{line['id']}", json={"quantity": 3}, headers=second)
+    own_hold_counts = client.put(f"/cart/{line['id']}", json={"quantity": 1}, headers=second)
+
+    assert too_many.status_code == 400
+    assert too_many.json()["detail"] == "Only 1 items available in stock"
+    assert own_hold_counts.status_code == 200
+
+def test_stock_cut_below_holds_releases_the_newest(client, make_users, admin_headers, products, db):
+    early, late = make_users(2)
+    assert _add(client, early, products[0], 20).status_code == 200
+    assert _add(client, late, products[0], 20).status_code == 200
+
+    response = client.put(f"/products/{products[0]}", json={"stock_quantity": 25}, headers=admin_headers)
+
+    assert response.status_code == 200
+    product = db.get(Product, products[0])
+    assert (product.stock_quantity, product.reserved_quantity) == (25, 20)
+    holders = db.query(User.email).join(InventoryReservation, InventoryReservation.user_id == User.id).all()
+    assert holders == [("shopper0@example.com",)]
+    # The released line stays in the cart and is held again at checkout, if it fits
+    assert db.query(CartItem).count() == 2
+
+def test_checkout_converts_the_lines_that_were_charged(client, user_headers, products, fake_stripe, db):
+    assert _add(client, user_headers, products[0], 2).status_code == 200
+
+    def edit_cart_in_another_tab():
+        client.put(f"/cart/{cart_line}", json={"quantity": 7}, headers=user_headers)
+        _add(client, user_headers, products[1], 1)
+
+    cart_line = client.get("/cart/", headers=user_headers).json()[0]["id"]
+    fake_stripe.during_payment = edit_cart_in_another_tab
+    response = client.post("/orders/", json=CHECKOUT, headers=user_headers)
+
+    assert response.status_code == 200
+    db.expire_all()
+    assert [(item.product_id, item.quantity) for item in db.query(OrderItem)] == [(products[0], 2)]
+    assert db.get(Product, products[0]).stock_quantity == 48
+    assert db.get(Product, products[0]).reserved_quantity == 0
+    # Added while paying: still in the cart and still held
+    assert [(line.product_id, line.quantity) for line in db.query(CartItem)] == [(products[1], 1)]
+    assert db.get(Product, products[1]).reserved_quantity == 1
+
+def test_failed_conversion_after_payment_refunds(client, user_headers, products, fake_stripe, db):
+    assert _add(client, user_headers, products[0], 2).status_code == 200
+    fake_stripe.during_payment = lambda: _set_stock(products[0], 0)
+
+    response = client.post("/orders/", json=CHECKOUT, headers=user_headers)
+
+    assert response.status_code in (400, 409)
+    assert fake_stripe.refunds == ["pi_test_1"]
+    db.expire_all()
+    assert db.get(Product, products[0]).stock_quantity == 0
+
+def test_holds_publish_hold_changes_once_committed(client, user_headers, products, db, monkeypatch):
+    published = []
+    monkeypatch.setattr(invalidation_bus, "publish", lambda entity, ids=None: published.append((entity, ids)))
+
+    assert _add(client, user_headers, products[0], 2).status_code == 200
+    assert _add(client, user_headers, products[1], 1000).status_code == 400
+    assert published == [("hold", [products[0]])]
+
+    published.clear()
+    db.query(InventoryReservation).update({"expires_at": datetime.now(timezone.utc) - timedelta(minutes=1)})
+    db.commit()
+    assert published == []
+    assert sweep_expired(db) == 1
+    assert published == [("hold", [products[0]])]
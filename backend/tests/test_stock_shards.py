@@ -0,0 +1,43 @@
+"""Stock edits on sharded products go to the shards and survive reconcile."""
+import asyncio
+from app.models.product import Product
+from app.schemas.product import ProductUpdate
+from app.services.product_service import ProductService
+from app.services.stock_shard_service import StockShardService, reconcile_totals
+
+def _shard(client, admin_headers, product_id, count=4):
+    response = client.put(f"/products/{product_id}/stock-shards", json={"shards": count}, headers=admin_headers)
+    assert response.status_code == 200, response.text
+
+def _stock_after_reconcile(db, product_id) -> int:
+    reconcile_totals(db)
+    db.expire_all()
+    return db.get(Product, product_id).stock_quantity
+
+def test_import_sets_sharded_stock(client, admin_headers, products, db):
+    _shard(client, admin_headers, products[0])
+
+    body = f'{{"id": {products[0]}, "stock_quantity": 80, "price": 9.5}}'
+    report = client.post("/products/import", content=body.encode(), headers=admin_headers).json()
+
+    assert (report["updated"], report["failed"]) == (1, 0)
+    assert StockShardService(db).totals([products[0]])[products[0]][0] == 80
+    assert _stock_after_reconcile(db, products[0]) == 80
+    assert db.get(Product, products[0]).price == 9.5
+
+def test_import_cannot_cut_sharded_stock_below_holds(client, admin_headers, user_headers, products, db):
+    _shard(client, admin_headers, products[0])
+    assert client.post("/cart/", json={"product_id": products[0], "quantity": 10}, headers=user_headers).status_code == 200
+
+    body = f'{{"id": {products[0]}, "stock_quantity": 5}}'
+    report = client.post("/products/import", content=body.encode(), headers=admin_headers).json()
+
+    assert (report["updated"], report["failed"]) == (0, 1)
+    assert _stock_after_reconcile(db, products[0]) == 50
+
+def test_product_service_update_sets_sharded_stock(client, admin_headers, products, db):
+    _shard(client, admin_headers, products[0])
+
+    asyncio.run(ProductService(db).update_product(products[0], ProductUpdate(stock_quantity=70)))
+
+    assert _stock_after_reconcile(db, products[0]) == 70
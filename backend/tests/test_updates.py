@@ -0,0 +1,23 @@
+"""Live updates: the WebSocket authenticates with its first message, not the URL."""
+import pytest
+from starlette.websockets import WebSocketDisconnect
+from app.utils.security import create_access_token
+
+def test_first_message_authenticates(client, user_headers):
+    token = user_headers["Authorization"].removeprefix("Bearer ")
+    with client.websocket_connect("/updates/ws") as websocket:
+        websocket.send_json({"token": token})
+        websocket.send_json({"watch": "not a list"})
+        assert websocket.receive_json()["type"] == "error"
+
+@pytest.mark.parametrize("first_message", [
+    {"token": create_access_token({"sub": "nobody@example.com"})},
+    {"token": "not-a-jwt"},
+    {"watch": [1]},
+])
+def test_rejected_tokens_close_the_socket(client, user_headers, first_message):
+    with client.websocket_connect("/updates/ws") as websocket:
+        websocket.send_json(first_message)
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+    assert closed.value.code == 1008
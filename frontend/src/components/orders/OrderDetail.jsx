@@ -15,6 +15,7 @@ import {
   ExternalLink
 } from 'lucide-react';
 import { useAgent } from '../../context/AgentContext';
+import { updateService } from '../../services/updates';
 import toast from 'react-hot-toast';
 
 const OrderDetail = () => {
@@ -29,6 +30,20 @@ const OrderDetail = () => {
     fetchOrderDetail();
   }, [orderId]);
 
+  // Status changes are pushed by the server instead of polled
+  useEffect(() => updateService.subscribe((message) => {
+    if (message.type === 'reconnected') {
+      fetchOrderDetail();
+    } else if (message.type === 'order' && message.order_id === parseInt(orderId)) {
+      setOrder((current) => current && {
+        ...current,
+        status: message.status,
+        tracking_number: message.tracking_number,
+        updated_at: message.updated_at || current.updated_at
+      });
+    }
+  }), [orderId]);
+
   const fetchOrderDetail = async () => {
     try {
       setLoading(true);
@@ -16,6 +16,7 @@ import {
 } from 'lucide-react';
 import { useAgent } from '../../context/AgentContext';
 import { useAuth } from '../../context/AuthContext';
+import { updateService } from '../../services/updates';
 import toast from 'react-hot-toast';
 
 const OrderHistory = () => {
@@ -32,6 +33,20 @@ const OrderHistory = () => {
     fetchOrders();
   }, []);
 
+  // Status changes are pushed by the server instead of polled
+  useEffect(() => updateService.subscribe((message) => {
+    if (message.type === 'reconnected') {
+      fetchOrders();
+    } else if (message.type === 'order') {
+      setOrders((current) => current.map((order) => order.id === message.order_id ? {
+        ...order,
+        status: message.status,
+        tracking_number: message.tracking_number,
+        updated_at: message.updated_at || order.updated_at
+      } : order));
+    }
+  }), []);
+
   const fetchOrders = async () => {
     try {
       setLoading(true);
@@ -1,5 +1,6 @@
 import React, { createContext, useContext, useState, useEffect } from 'react';
 import { cartService } from '../services/cart';
+import { updateService } from '../services/updates';
 import { useAuth } from './AuthContext';
 import toast from 'react-hot-toast';
 
@@ -34,6 +35,27 @@ export const CartProvider = ({ children }) => {
     calculateTotals();
   }, [cartItems]);
 
+  // Hear about cart products running low or selling out while the user shops
+  useEffect(() => {
+    if (!isAuthenticated) return undefined;
+    return updateService.subscribe((message) => {
+      if (message.type === 'reconnected') {
+        loadCart();
+      } else if (message.type === 'stock') {
+        setCartItems((items) => items.map((item) => item.product.id === message.product_id
+          ? { ...item, product: { ...item.product, stock_quantity: message.available } }
+          : item));
+        if (message.level !== 'in_stock') {
+          toast(message.level === 'low' ? `Only ${message.available} left of an item in your cart` : 'An item in your cart just sold out');
+        }
+      }
+    });
+  }, [isAuthenticated]);
+
+  useEffect(() => {
+    updateService.watchProducts(cartItems.map((item) => item.product.id));
+  }, [cartItems]);
+
   const calculateTotals = () => {
     const total = cartItems.reduce((sum, item) => {
       return sum + (item.product.price * item.quantity);
@@ -16,6 +16,13 @@ export const cartService = {
     return response.data;
   },
 
+  // Apply several add/update/remove operations in one request
+  // operations: [{ op: 'add' | 'update' | 'remove', product_id, quantity }]
+  async bulkUpdateCart(operations) {
+    const response = await api.post('/cart/bulk', { operations });
+    return response.data;
+  },
+
   // Update cart item quantity
   async updateCartItem(cartItemId, quantity) {
     const response = await api.put(`/cart/items/${cartItemId}`, {
@@ -13,16 +13,28 @@ export const orderService = {
     return response.data;
   },
 
-  // Create new order from cart
-  async createOrder(orderData) {
-    const response = await api.post('/orders/', {
-      shipping_address: orderData.shipping_address,
-      payment_method_id: orderData.payment_method_id,
-      billing_address: orderData.billing_address,
-      shipping_method: orderData.shipping_method,
-      notes: orderData.notes
-    });
-    return response.data;
+  // Create new order from cart; reuse the same key when retrying so the server replays instead of charging again.
+  // While checkout is busy the server answers 429 with a place in line; onQueued receives {position, retry_after}.
+  async createOrder(orderData, idempotencyKey = crypto.randomUUID(), onQueued = () => {}) {
+    const headers = { 'Idempotency-Key': idempotencyKey };
+    for (;;) {
+      try {
+        const response = await api.post('/orders/', {
+          shipping_address: orderData.shipping_address,
+          payment_method_id: orderData.payment_method_id,
+          billing_address: orderData.billing_address,
+          shipping_method: orderData.shipping_method,
+          notes: orderData.notes
+        }, { headers });
+        return response.data;
+      } catch (error) {
+        const queued = error.response?.status === 429 && error.response.data?.ticket;
+        if (!queued) throw error;
+        headers['X-Checkout-Ticket'] = error.response.data.ticket;
+        onQueued(error.response.data);
+        await new Promise((resolve) => setTimeout(resolve, error.response.data.retry_after * 1000));
+      }
+    }
   },
 
   // Create order with specific items (not from cart)
@@ -39,9 +51,11 @@ export const orderService = {
   },
 
   // Cancel order
-  async cancelOrder(orderId, reason = '') {
+  async cancelOrder(orderId, reason = '', idempotencyKey = crypto.randomUUID()) {
     const response = await api.post(`/orders/${orderId}/cancel`, {
       reason: reason
+    }, {
+      headers: { 'Idempotency-Key': idempotencyKey }
     });
     return response.data;
   },
@@ -0,0 +1,63 @@
+const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:8000';
+const UPDATES_URL = `${API_BASE_URL.replace(/^http/, 'ws')}/updates/ws`;
+const MAX_RETRY_MS = 30000;
+
+// One shared WebSocket per tab, opened while anything listens. The server pushes
+// {type: 'order', order_id, status, tracking_number, updated_at} for the user's
+// orders and {type: 'stock', product_id, available, level} for watched products.
+const listeners = new Set();
+let socket = null;
+let watched = [];
+let retryMs = 1000;
+let retryTimer = null;
+let connectedBefore = false;
+
+const connect = () => {
+  const token = localStorage.getItem('token');
+  if (!token || socket) return;
+
+  socket = new WebSocket(UPDATES_URL);
+  socket.onopen = () => {
+    retryMs = 1000;
+    // Authenticate with the first message; a token in the URL would be logged
+    socket.send(JSON.stringify({ token }));
+    if (watched.length) socket.send(JSON.stringify({ watch: watched }));
+    // Anything may have changed while disconnected
+    if (connectedBefore) listeners.forEach((listener) => listener({ type: 'reconnected' }));
+    connectedBefore = true;
+  };
+  socket.onmessage = (event) => {
+    const message = JSON.parse(event.data);
+    listeners.forEach((listener) => listener(message));
+  };
+  socket.onclose = (event) => {
+    socket = null;
+    // 1008: the token was rejected; wait for a new login instead of retrying
+    if (!listeners.size || event.code === 1008) return;
+    retryTimer = setTimeout(connect, retryMs);
+    retryMs = Math.min(retryMs * 2, MAX_RETRY_MS);
+  };
+};
+
+export const updateService = {
+  // Receive live updates until the returned function is called
+  subscribe(listener) {
+    listeners.add(listener);
+    connect();
+    return () => {
+      listeners.delete(listener);
+      if (!listeners.size) {
+        clearTimeout(retryTimer);
+        socket?.close();
+      }
+    };
+  },
+
+  // Replace the products whose stock level changes are pushed (e.g. the cart's)
+  watchProducts(productIds) {
+    watched = productIds;
+    if (socket?.readyState === WebSocket.OPEN) {
+      socket.send(JSON.stringify({ watch: watched }));
+    }
+  }
+};